@@ -0,0 +1,11 @@
+# __main__.py - Cho phép chạy: python -m ocrnhom9z batch <thư mục> ...
+
+import os
+import sys
+
+# Các module dùng import phẳng (from config import *) → thêm thư mục app vào sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cli import main
+
+sys.exit(main())
@@ -0,0 +1,367 @@
+# benchmark.py - Đo hiệu năng pipeline offline (không tốn quota Gemini)
+
+import argparse
+import glob
+import json
+import os
+import tempfile
+import time
+from config import *
+
+def make_synthetic_students(n_rows):
+    """Tạo danh sách sinh viên giả lập theo template mặc định"""
+    surnames = VIETNAMESE_NAMES_DATABASE["surnames"]
+    middle_names = VIETNAMESE_NAMES_DATABASE["middle_names"]
+    first_names = VIETNAMESE_NAMES_DATABASE["first_names"]["male"]
+    students = []
+    for i in range(n_rows):
+        students.append({
+            "stt": str(i + 1),
+            "lop": f"CNTT {17 + i % 5}-0{1 + i % 3}",
+            "msv": f"17710{i:05d}",
+            "ho": f"{surnames[i % len(surnames)]} {middle_names[i % len(middle_names)]}",
+            "ten": first_names[i % len(first_names)],
+            "cc": f"{(i * 7) % 11:.1f}",
+            "kt1": f"{(i * 3) % 11:.1f}"
+        })
+    return students
+
+def make_synthetic_response(n_rows):
+    """Tạo response JSON giả lập có n_rows sinh viên"""
+    return json.dumps({"students": make_synthetic_students(n_rows)}, ensure_ascii=False)
+
+def bench_pipeline(args):
+    """Chạy extract_many với ReplayBackend ở mức song song thực tế"""
+    from ocr_backends import ReplayBackend
+    from ocr_processor import OCRProcessor
+    from rate_limiter import TokenBucketRateLimiter
+
+    image_paths = []
+    for pattern in args.images:
+        image_paths.extend(sorted(glob.glob(pattern)))
+    if not image_paths:
+        print("❌ Không tìm thấy ảnh nào")
+        return
+    image_paths = image_paths * args.repeat
+
+    recordings_dir = args.recordings or tempfile.mkdtemp(prefix="ocr_replay_")
+    backend = ReplayBackend(
+        recordings_dir=recordings_dir,
+        latency=(args.latency_min, args.latency_max),
+        error_rate=args.error_rate,
+        default_response=make_synthetic_response(args.rows),
+        seed=0
+    )
+    limiter = TokenBucketRateLimiter(rate_per_minute=args.rpm, burst=args.burst,
+                                     backoff_base=0.1, backoff_max=2.0)
+    processor = OCRProcessor(api_key=None, response_cache=False, backend=backend, rate_limiter=limiter)
+    processor.dedupe_enabled = False  # ảnh lặp lại (--repeat) vẫn phải gọi backend thật
+
+    start = time.perf_counter()
+    ok_count = 0
+    total_rows = 0
+    for _, success, df, _ in processor.extract_many(image_paths, max_workers=args.workers, ordered=False):
+        if success:
+            ok_count += 1
+            total_rows += len(df)
+    elapsed = time.perf_counter() - start
+
+    print("\n📊 === KẾT QUẢ BENCHMARK PIPELINE ===")
+    print(f"Ảnh: {len(image_paths)} | Thành công: {ok_count} | Dòng: {total_rows}")
+    print(f"Worker: {args.workers} | Giới hạn: {args.rpm} req/phút | Trễ: {args.latency_min}-{args.latency_max}s")
+    print(f"Thời gian: {elapsed:.2f}s | Thông lượng: {len(image_paths) / elapsed:.2f} ảnh/s")
+    print(f"Limiter: {limiter.get_stats()}")
+
+def legacy_student_to_row(student, columns_config, index):
+    """OCRProcessor._student_to_row trước khi dựng DataFrame theo cột - giữ nguyên văn làm mốc so sánh"""
+    row = []
+
+    # Xử lý từng cột theo cấu hình
+    for col_config in columns_config:
+        col_key = col_config.get('key', '')
+        value = student.get(col_key, '').strip()
+
+        # Xử lý đặc biệt cho tên (nếu có cả ho và ten)
+        if col_key == 'ho' and 'ten' in [c.get('key') for c in columns_config]:
+            ho = student.get('ho', '').strip()
+            ten = student.get('ten', '').strip()
+
+            # DEBUG: In ra để kiểm tra
+            print(f"Student {index+1}: ho='{ho}', ten='{ten}'")
+
+            # VALIDATION: Kiểm tra phân chia tên
+            if ho and ten:
+                ho_words = ho.split()
+                ten_words = ten.split()
+
+                # Kiểm tra các trường hợp lỗi phân chia tên
+                needs_fix = False
+
+                # Trường hợp 1: ho có 1 từ, ten có nhiều từ
+                if len(ho_words) == 1 and len(ten_words) > 1:
+                    print(f"⚠️ PHÁT HIỆN LỖI PHÂN CHIA TÊN (Type 1): ho='{ho}' (1 từ), ten='{ten}' ({len(ten_words)} từ)")
+                    needs_fix = True
+
+                # Trường hợp 2: ten có nhiều từ (bất kể ho có bao nhiêu từ)
+                elif len(ten_words) > 1:
+                    print(f"⚠️ PHÁT HIỆN LỖI PHÂN CHIA TÊN (Type 2): ten='{ten}' có {len(ten_words)} từ (phải chỉ có 1 từ)")
+                    needs_fix = True
+
+                # Trường hợp 3: ho trống nhưng ten có nhiều từ
+                elif not ho and len(ten_words) > 1:
+                    print(f"⚠️ PHÁT HIỆN LỖI PHÂN CHIA TÊN (Type 3): ho trống, ten='{ten}' có {len(ten_words)} từ")
+                    needs_fix = True
+
+                if needs_fix:
+                    # Tự động sửa: ghép lại và phân chia đúng
+                    full_name = f"{ho} {ten}".strip()
+                    name_parts = full_name.split()
+                    if len(name_parts) >= 2:
+                        ho = " ".join(name_parts[:-1])  # Tất cả trừ từ cuối
+                        ten = name_parts[-1]  # Từ cuối
+                        print(f"✅ ĐÃ SỬA: ho='{ho}', ten='{ten}'")
+                        # Cập nhật lại trong student data
+                        student['ho'] = ho
+                        student['ten'] = ten
+                    elif len(name_parts) == 1:
+                        # Chỉ có 1 từ - để làm tên, ho để trống
+                        ho = ""
+                        ten = name_parts[0]
+                        print(f"✅ ĐÃ SỬA (1 từ): ho='', ten='{ten}'")
+                        student['ho'] = ho
+                        student['ten'] = ten
+
+            value = ho
+
+        row.append(value)
+
+    return row
+
+def legacy_students_to_dataframe(students, columns_config):
+    """OCRProcessor._students_to_dataframe trước khi dựng theo cột (từng dòng, in log mỗi sinh viên)"""
+    import pandas as pd
+    from ocr_processor import OCRProcessor
+
+    df_data = [legacy_student_to_row(student, columns_config, i) for i, student in enumerate(students)]
+    df = pd.DataFrame(df_data, columns=OCRProcessor._get_headers(columns_config))
+    print(f"📊 DataFrame columns: {list(df.columns)}")
+    return df
+
+def bench_parse(args):
+    """Đo thời gian parse response lớn → DataFrame: theo cột (mặc định) so với cách cũ từng dòng"""
+    import contextlib
+    import io
+    from ocr_processor import OCRProcessor
+
+    processor = OCRProcessor(api_key=None, response_cache=False)
+    response_text = make_synthetic_response(args.rows)
+    columns_config = processor.prompt_manager.get_current_columns()
+
+    def by_row():
+        students = processor._parse_response_to_students(response_text)
+        return legacy_students_to_dataframe(students, columns_config)
+
+    def by_column():
+        return processor._parse_response_to_dataframe(response_text)
+
+    print(f"\n📊 === PARSE RESPONSE {args.rows} DÒNG ({len(response_text) / 1024:.0f} KB) ===")
+    results = {}
+    for name, func in (("Từng dòng", by_row), ("Theo cột", by_column)):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):  # không tính thời gian in log
+                df = func()
+            timings.append(time.perf_counter() - start)
+        results[name] = df
+        print(f"{name:<12} tốt nhất {min(timings) * 1000:8.1f} ms | trung bình {sum(timings) / len(timings) * 1000:8.1f} ms"
+              f" | {len(df)} dòng")
+
+    same = results["Từng dòng"].equals(results["Theo cột"])
+    print(f"Kết quả hai cách {'giống nhau ✅' if same else 'KHÁC NHAU ❌'}")
+
+def make_noisy_dataframe(n_rows, with_class=True):
+    """
+    DataFrame chưa làm sạch có lỗi OCR điển hình (nhầm chữ/số, thiếu dấu, điểm ngoài khoảng...)
+
+    with_class=False: cột Lớp để trống như bảng điểm không có cột Lớp
+    """
+    import pandas as pd
+
+    rows = []
+    for i, student in enumerate(make_synthetic_students(n_rows)):
+        msv, lop, ho, cc = student["msv"], student["lop"], student["ho"], student["cc"]
+        if i % 7 == 0:
+            msv = msv.replace("1", "I").replace("0", "O")
+        if i % 11 == 0:
+            lop = lop.replace("CNTT", "CNIT").replace("1", "l").lower()
+        if i % 5 == 0:
+            ho = ho.replace("Nguyễn", "Nguyen").replace("Trần", "tran")
+        if i % 9 == 0:
+            cc = cc.replace(".", ",")
+        elif i % 13 == 0:
+            cc = "1" + cc
+        rows.append({"STT": student["stt"] if i % 17 else "x", "Lớp": lop if with_class else "", "MSV": msv,
+                     "Họ và đệm": ho, "Tên": student["ten"].lower() if i % 3 == 0 else student["ten"],
+                     "CC": cc, "KT1": student["kt1"].replace("0", "O") if i % 4 == 0 else student["kt1"]})
+    return pd.DataFrame(rows)
+
+def bench_validate(args):
+    """So sánh DataValidator từng dòng (iterrows) và vectorized ở nhiều kích thước"""
+    import contextlib
+    import io
+    from data_validator import DataValidator
+
+    print("\n📊 === DATAVALIDATOR: TỪNG DÒNG vs VECTORIZED ===")
+    print(f"{'Dòng':>8}{'Từng dòng':>13}{'Vectorized':>13}{'Nhanh hơn':>11}  Giống nhau")
+    # Thêm một lượt với cột Lớp trống (bảng không có cột Lớp)
+    for n_rows, with_class in [(n, True) for n in args.sizes] + [(args.sizes[0], False)]:
+        df = make_noisy_dataframe(n_rows, with_class)
+        results = []
+        for method in ("validate_and_clean_dataframe_rows", "validate_and_clean_dataframe"):
+            validator = DataValidator()
+            frame = df.copy()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):  # không tính thời gian in log
+                cleaned = getattr(validator, method)(frame)
+            results.append((time.perf_counter() - start, cleaned, validator.get_corrections_summary()))
+
+        (row_time, row_df, row_fixes), (vec_time, vec_df, vec_fixes) = results
+        same = row_df.equals(vec_df) and row_fixes == vec_fixes
+        print(f"{n_rows:>8}{row_time:>12.3f}s{vec_time:>12.3f}s{row_time / vec_time:>10.1f}x  "
+              f"{'✅' if same else '❌'} ({len(vec_fixes)} sửa đổi{'' if with_class else ', Lớp trống'})")
+
+def cell_accuracy(reference_df, df):
+    """Tỷ lệ ô khớp với bảng tham chiếu (so theo thứ tự dòng, chỉ các cột của bảng tham chiếu)"""
+    total = reference_df.size
+    if total == 0:
+        return 1.0 if df is None or df.empty else 0.0
+    rows = min(len(reference_df), len(df))
+    matched = 0
+    for column in reference_df.columns:
+        if column not in df.columns:
+            continue
+        expected = reference_df[column].iloc[:rows].astype(str).str.strip().to_numpy()
+        actual = df[column].iloc[:rows].astype(str).str.strip().to_numpy()
+        matched += int((expected == actual).sum())
+    return matched / total
+
+def bench_prompt(args):
+    """So sánh chi phí token (và độ chính xác nếu có ảnh) giữa prompt gốc và prompt rút gọn"""
+    from prompt_manager import PromptManager
+
+    prompt_manager = PromptManager(os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt_templates.json"))
+    gemini = None
+    if args.api_key:
+        from ocr_backends import GeminiBackend
+        gemini = GeminiBackend(args.api_key)
+
+    count_tokens = gemini.count_tokens if gemini else None
+    print(f"\n📊 === TOKEN CỦA PROMPT ({'countTokens Gemini' if gemini else 'ước lượng ~4 byte/token'}) ===")
+    print(f"{'Template':<24}{'Gốc':>8}{'Rút gọn':>10}{'Tiết kiệm':>11}")
+    for row in prompt_manager.get_prompt_token_report(count_tokens):
+        print(f"{row['template']:<24}{row['tokens']:>8}{row['compact_tokens']:>10}{row['saved']:>10.0%}")
+
+    if not args.images:
+        return
+    if not gemini or not (args.recordings or args.record):
+        print("❌ So sánh độ chính xác cần --api-key và --recordings (response tham chiếu đã ghi)")
+        return
+
+    from ocr_backends import RecordingBackend, ReplayBackend
+    from ocr_processor import OCRProcessor
+
+    if args.template:
+        if args.template not in prompt_manager.get_template_names():
+            print(f"❌ Không có template '{args.template}'")
+            return
+        prompt_manager.current_template = args.template  # không ghi lại file template
+
+    image_paths = []
+    for pattern in args.images:
+        image_paths.extend(sorted(glob.glob(pattern)))
+
+    if args.record:
+        # Ghi response của prompt gốc làm bảng tham chiếu - kiểm tra lại rồi chạy với --recordings
+        recorder = OCRProcessor(api_key=args.api_key, response_cache=False, prompt_manager=prompt_manager,
+                                backend=RecordingBackend(gemini, ReplayBackend(recordings_dir=args.record)))
+        recorder.dedupe_enabled = False
+        recorded = sum(1 for path in image_paths if recorder.extract_data_from_image(path)[0])
+        print(f"💾 Đã ghi {recorded}/{len(image_paths)} response vào {args.record}")
+        return
+
+    # Bảng tham chiếu: response đã ghi (đã duyệt) cho từng ảnh
+    reference = OCRProcessor(api_key=None, response_cache=False, prompt_manager=prompt_manager,
+                             backend=ReplayBackend(recordings_dir=args.recordings))
+    references = {}
+    for path in image_paths:
+        success, df, message = reference.extract_data_from_image(path)
+        if success:
+            references[path] = df
+        else:
+            print(f"⚠️ Bỏ qua {os.path.basename(path)}: {message}")
+    if not references:
+        print("❌ Không có ảnh nào có response tham chiếu")
+        return
+
+    results = []
+    for compact in (False, True):
+        processor = OCRProcessor(api_key=args.api_key, response_cache=False, prompt_manager=prompt_manager,
+                                 backend=gemini)
+        processor.compact_prompt = compact
+        accuracies = []
+        for path, reference_df in references.items():
+            success, df, _ = processor.extract_data_from_image(path)
+            accuracies.append(cell_accuracy(reference_df, df) if success else 0.0)
+        summary = processor.get_metrics(summary=True)
+        calls = summary["api_calls"] or 1
+        results.append((processor.get_prompt_variant(), summary["prompt_tokens"] / calls,
+                        summary["stages"].get("api", 0.0) / calls, sum(accuracies) / len(accuracies)))
+
+    print(f"\n📊 === PROMPT GỐC vs RÚT GỌN ({len(references)} ảnh) ===")
+    print(f"{'Biến thể':<28}{'Token vào/req':>14}{'Trễ API/req':>13}{'Độ chính xác':>14}")
+    for variant, tokens, latency, accuracy in results:
+        print(f"{variant:<28}{tokens:>14.0f}{latency:>12.2f}s{accuracy:>14.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline cho pipeline OCR")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pipeline = subparsers.add_parser("pipeline", help="Benchmark extract_many với ReplayBackend")
+    pipeline.add_argument("images", nargs="+", help="Đường dẫn / glob ảnh đầu vào")
+    pipeline.add_argument("--repeat", type=int, default=10, help="Lặp danh sách ảnh N lần")
+    pipeline.add_argument("--workers", type=int, default=BATCH_MAX_WORKERS)
+    pipeline.add_argument("--rpm", type=float, default=600, help="Giới hạn request/phút")
+    pipeline.add_argument("--burst", type=int, default=RATE_LIMIT_BURST)
+    pipeline.add_argument("--latency-min", type=float, default=0.5)
+    pipeline.add_argument("--latency-max", type=float, default=2.0)
+    pipeline.add_argument("--error-rate", type=float, default=0.0, help="Tỷ lệ lỗi 429 giả lập")
+    pipeline.add_argument("--rows", type=int, default=40, help="Số dòng mỗi response giả lập")
+    pipeline.add_argument("--recordings", help="Thư mục response đã ghi (mặc định: thư mục tạm)")
+    pipeline.set_defaults(func=bench_pipeline)
+
+    parse = subparsers.add_parser("parse", help="Benchmark parse response lớn thành DataFrame")
+    parse.add_argument("--rows", type=int, default=10000, help="Số dòng của response giả lập")
+    parse.add_argument("--repeat", type=int, default=5, help="Số lần đo")
+    parse.set_defaults(func=bench_parse)
+
+    validate = subparsers.add_parser("validate", help="Benchmark DataValidator từng dòng và vectorized")
+    validate.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                          help="Các kích thước DataFrame cần đo")
+    validate.set_defaults(func=bench_validate)
+
+    prompt = subparsers.add_parser("prompt", help="Chi phí token / độ chính xác của prompt gốc và rút gọn")
+    prompt.add_argument("images", nargs="*", help="Ảnh để so sánh độ chính xác (cần --recordings và --api-key)")
+    prompt.add_argument("--recordings", help="Thư mục response tham chiếu đã ghi")
+    prompt.add_argument("--record", metavar="DIR",
+                        help="Ghi response của prompt gốc cho các ảnh vào DIR (làm --recordings sau khi kiểm tra)")
+    prompt.add_argument("--template", help="Template dùng khi so sánh (mặc định: template hiện tại)")
+    prompt.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY"),
+                        help="Gemini API key - đếm token chính xác và chạy so sánh")
+    prompt.set_defaults(func=bench_prompt)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
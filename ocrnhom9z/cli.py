@@ -0,0 +1,343 @@
+# cli.py - Chạy trích xuất không cần giao diện (cron, máy chủ không màn hình)
+#
+# Ví dụ:
+#   python -m ocrnhom9z batch ./anh --template default --xlsx ket_qua.xlsx --db
+#   python -m ocrnhom9z watch ./thu_muc_chung --xlsx-dir ./ket_qua --db
+#
+# Tiến trình được in ra stdout dạng JSON lines (mỗi dòng một sự kiện);
+# log của các module (emoji) được chuyển sang stderr.
+# Module này không import tkinter; các module nặng chỉ được import khi cần.
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+from config import *
+
+_emit_lock = threading.Lock()
+
+def emit(stream, event, **fields):
+    """In một sự kiện tiến trình dạng JSON (một dòng, an toàn khi gọi từ nhiều thread)"""
+    fields = {"event": event, "time": round(time.time(), 3), **fields}
+    line = json.dumps(fields, ensure_ascii=False, default=str) + "\n"
+    with _emit_lock:
+        stream.write(line)
+        stream.flush()
+
+def collect_inputs(paths, recursive=False):
+    """Danh sách file ảnh/PDF từ các đường dẫn (file hoặc thư mục), sắp xếp theo tên"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            if recursive:
+                for root, _, names in os.walk(path):
+                    files.extend(os.path.join(root, name) for name in names)
+            else:
+                files.extend(os.path.join(path, name) for name in os.listdir(path))
+        else:
+            files.append(path)
+    return sorted(f for f in files if os.path.isfile(f) and f.lower().endswith(BATCH_FILE_EXTENSIONS))
+
+def load_database_config(server, database):
+    """Server/database từ tham số, nếu thiếu thì lấy từ database_config.json (thư mục hiện tại hoặc thư mục app)"""
+    if server and database:
+        return server, database
+    for config_dir in (os.getcwd(), APP_DIR):
+        config_path = os.path.join(config_dir, "database_config.json")
+        if os.path.exists(config_path):
+            with open(config_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            return server or saved.get("server_name"), database or saved.get("database_name")
+    return server, database
+
+def create_processor(args):
+    """Khởi tạo OCRProcessor theo tham số dòng lệnh"""
+    from ocr_processor import OCRProcessor
+    from prompt_manager import PromptManager
+
+    # Đường dẫn template tuyệt đối - cron thường chạy ở thư mục khác
+    prompt_manager = PromptManager(os.path.join(APP_DIR, "prompt_templates.json"))
+    if args.template:
+        if args.template not in prompt_manager.get_template_names():
+            raise Exception(f"Không có template '{args.template}'. "
+                            f"Các template: {', '.join(prompt_manager.get_template_names())}")
+        prompt_manager.set_current_template(args.template)
+
+    backend = None
+    if args.record:
+        # Ghi lại response Gemini để chạy offline bằng ReplayBackend (benchmark, so sánh prompt)
+        from ocr_backends import GeminiBackend, RecordingBackend, ReplayBackend
+        if not args.api_key:
+            raise Exception("--record cần Gemini API key (--api-key hoặc GEMINI_API_KEY)")
+        backend = RecordingBackend(GeminiBackend(args.api_key), ReplayBackend(recordings_dir=args.record))
+
+    # Khi ghi: mỗi ảnh phải thực sự gọi API → tắt cache response
+    processor = OCRProcessor(api_key=args.api_key, prompt_manager=prompt_manager, backend=backend,
+                             response_cache=False if args.record else None)
+    if args.record:
+        processor.dedupe_enabled = False
+    if args.compact_prompt:
+        processor.compact_prompt = True
+    if args.engine:
+        processor.ocr_engine = args.engine
+    return processor
+
+def save_to_database(df, args, processor=None):
+    """Lưu kết quả vào SQL Server (tạo bảng nếu chưa có) kèm số liệu trích xuất vào OCR_Sessions"""
+    from database_manager import DatabaseManager
+
+    server, database = load_database_config(args.server, args.database)
+    db_manager = DatabaseManager(server, database)
+    success, message = db_manager.test_connection()
+    if not success:
+        return False, message, 0
+
+    success, message = db_manager.create_tables()
+    if not success:
+        return False, message, 0
+
+    result = db_manager.insert_grades_dynamic(DatabaseManager.dataframe_to_grades(df))
+    if result[0] and processor:
+        metrics_ok, metrics_msg, _ = processor.save_metrics(db_manager)
+        if not metrics_ok:
+            print(f"⚠️ {metrics_msg}")
+    return result
+
+def fix_suspect_rows(processor, validator, page, df, args, out):
+    """Gọi lại Gemini cho các dòng nghi sai của một trang (nếu bật) - trả về DataFrame đã sửa"""
+    if not (args.fix_suspect or REEXTRACT_SUSPECT_ROWS):
+        return df
+    df, report = processor.reextract_suspect_rows(page, df, validator=validator)
+    if report["suspects"]:
+        emit(out, "fix", path=str(page), **report)
+    return df
+
+def open_job_store(path=None):
+    """Job store tại path (kết quả lưu ở <path>_results) hoặc vị trí mặc định"""
+    from job_store import JobStore
+    if not path:
+        return JobStore()
+    return JobStore(path, path + "_results")
+
+def run_batch(args, out):
+    """Lệnh batch: trích xuất → validate → gộp → xuất Excel / lưu database"""
+    import pandas as pd
+    from data_validator import DataValidator
+
+    inputs = collect_inputs(args.paths, recursive=args.recursive)
+    if not inputs:
+        emit(out, "error", message="Không tìm thấy file ảnh/PDF nào")
+        return 2
+    if not args.api_key and args.engine != "tesseract":
+        emit(out, "error", message="Thiếu API key: dùng --api-key hoặc biến môi trường GEMINI_API_KEY")
+        return 2
+
+    started = time.time()
+    processor = create_processor(args)
+    validator = DataValidator()
+
+    job_store = open_job_store(args.job_store) if args.job_store else None
+    if job_store and args.retry_failed:
+        emit(out, "reset", jobs=job_store.reset_failed())
+
+    from page_source import expand_pages
+    pages = list(expand_pages(inputs))
+    emit(out, "start", files=len(inputs), pages=len(pages),
+         template=processor.get_prompt_variant(), engine=processor.ocr_engine)
+
+    frames = []
+    failed = 0
+    corrections = 0
+    results = processor.extract_many(pages, max_workers=args.workers, ordered=False, job_store=job_store)
+    for done, (image_path, success, df, raw_response) in enumerate(results, start=1):
+        rows = 0
+        if success and not df.empty:
+            df = fix_suspect_rows(processor, validator, image_path, df, args, out)
+            cleaned_df = validator.validate_and_clean_dataframe(df)
+            page_corrections = len(validator.get_corrections_summary())
+            processor.record_corrections(image_path, page_corrections)
+            corrections += page_corrections
+            frames.append(cleaned_df)
+            rows = len(cleaned_df)
+        else:
+            failed += 1
+        emit(out, "page", path=str(image_path), done=done, total=len(pages), success=bool(success and rows),
+             rows=rows, error=None if rows else (raw_response if not success else "Không có dữ liệu"))
+
+    merged_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if 'MSV' in merged_df.columns:
+        merged_df = merged_df.drop_duplicates(subset=['MSV'], keep='first').reset_index(drop=True)
+
+    exit_code = 0 if not failed else 1
+    if merged_df.empty:
+        emit(out, "error", message="Không trích xuất được dữ liệu từ ảnh nào")
+        exit_code = 1
+    else:
+        if args.xlsx:
+            from excel_exporter import ExcelExporter
+            success, message = ExcelExporter().export_to_excel(merged_df, args.xlsx)
+            emit(out, "xlsx", path=args.xlsx, success=success, rows=len(merged_df), message=message)
+            exit_code = exit_code if success else 1
+        if args.db:
+            success, message, count = save_to_database(merged_df, args, processor)
+            emit(out, "db", success=success, rows=count, message=message)
+            exit_code = exit_code if success else 1
+
+    emit(out, "done", pages=len(pages), failed=failed, rows=len(merged_df),
+         elapsed=round(time.time() - started, 2), corrections=corrections,
+         metrics=processor.get_metrics(summary=True), requests=processor.get_request_stats())
+    return exit_code
+
+def run_watch(args, out):
+    """Lệnh watch: theo dõi thư mục, mỗi file mới → trích xuất → validate → Excel / database"""
+    from concurrent.futures import ThreadPoolExecutor
+    import pandas as pd
+    from data_validator import DataValidator
+    from folder_watcher import FolderWatcher
+    from job_store import JobStore
+    from page_source import expand_pages
+
+    if not args.api_key and args.engine != "tesseract":
+        emit(out, "error", message="Thiếu API key: dùng --api-key hoặc biến môi trường GEMINI_API_KEY")
+        return 2
+
+    processor = create_processor(args)
+    variant = processor.get_job_variant()
+    # Luôn dùng job store: khởi động lại không xử lý / lưu database lại các file đã xong
+    job_store = open_job_store(args.job_store)
+    if args.retry_failed:
+        emit(out, "reset", jobs=job_store.reset_failed())
+    if args.xlsx_dir:
+        os.makedirs(args.xlsx_dir, exist_ok=True)
+
+    workers = max(1, args.workers or WATCH_MAX_WORKERS)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr-watch")
+    # Giới hạn số file chờ: watcher tạm dừng khi pool đã đầy
+    slots = threading.BoundedSemaphore(workers * 2)
+
+    def process_file(path, ready_at):
+        try:
+            pages = list(expand_pages([path]))
+            if all(job_store.enqueue(page, variant=variant)['state'] == JobStore.DONE for page in pages):
+                emit(out, "skip", path=path, reason="Đã xử lý trước đó")
+                return
+
+            validator = DataValidator()
+            frames = []
+            errors = []
+            corrections = 0
+            for page, success, df, raw_response in processor.extract_many(pages, max_workers=1,
+                                                                           job_store=job_store):
+                if success and not df.empty:
+                    df = fix_suspect_rows(processor, validator, page, df, args, out)
+                    frames.append(validator.validate_and_clean_dataframe(df))
+                    page_corrections = len(validator.get_corrections_summary())
+                    processor.record_corrections(page, page_corrections)
+                    corrections += page_corrections
+                else:
+                    errors.append(f"{page}: {raw_response if not success else 'Không có dữ liệu'}")
+
+            merged_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            result = {"path": path, "pages": len(pages), "rows": len(merged_df), "errors": errors,
+                      "corrections": corrections}
+            if not merged_df.empty:
+                if args.xlsx_dir:
+                    from excel_exporter import ExcelExporter
+                    xlsx_path = os.path.join(args.xlsx_dir, os.path.splitext(os.path.basename(path))[0] + ".xlsx")
+                    success, message = ExcelExporter().export_to_excel(merged_df, xlsx_path)
+                    result["xlsx"] = xlsx_path if success else None
+                    if not success:
+                        errors.append(message)
+                if args.db:
+                    success, message, count = save_to_database(merged_df, args, processor)
+                    result["db_rows"] = count
+                    if not success:
+                        errors.append(message)
+            result["latency"] = round(time.monotonic() - ready_at, 2)
+            emit(out, "file", success=not errors and not merged_df.empty, **result)
+        except Exception as e:
+            emit(out, "file", path=path, success=False, errors=[str(e)])
+        finally:
+            slots.release()
+
+    def on_file_ready(path):
+        slots.acquire()
+        emit(out, "queued", path=path)
+        executor.submit(process_file, path, time.monotonic())
+
+    watcher = FolderWatcher(args.folder, on_file_ready, recursive=args.recursive)
+    watcher.start()
+    emit(out, "watch", folder=watcher.folder, mode=watcher.mode, workers=workers,
+         template=processor.get_prompt_variant())
+    try:
+        watcher.wait(args.run_for)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        executor.shutdown(wait=True)
+        emit(out, "stopped", jobs=job_store.get_stats())
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m ocrnhom9z",
+        description="Trích xuất bảng điểm không cần giao diện (tiến trình in ra stdout dạng JSON lines)"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # Tham số dùng chung cho batch / watch
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--template", help="Tên prompt template (mặc định: default)")
+    common.add_argument("--db", action="store_true", help="Lưu kết quả vào SQL Server")
+    common.add_argument("--server", help="SQL Server (mặc định lấy từ database_config.json)")
+    common.add_argument("--database", help="Tên database (mặc định lấy từ database_config.json)")
+    common.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY"),
+                        help="Gemini API key (mặc định: biến môi trường GEMINI_API_KEY)")
+    common.add_argument("--compact-prompt", action="store_true",
+                        help="Dùng prompt rút gọn (ít token hơn) thay cho prompt gốc của template")
+    common.add_argument("--fix-suspect", action="store_true",
+                        help="Gọi lại Gemini chỉ cho các dòng nghi sai (MSV, điểm, STT nhảy) thay vì cả bảng")
+    common.add_argument("--engine", choices=["gemini", "tesseract", "auto"], help="Engine OCR (ghi đè OCR_ENGINE)")
+    common.add_argument("--record", metavar="DIR",
+                        help="Ghi response Gemini vào thư mục DIR (dùng lại offline bằng ReplayBackend / benchmark.py)")
+    common.add_argument("--workers", type=int, help="Số worker song song")
+    common.add_argument("--job-store", help="File SQLite job store để chạy tiếp khi bị gián đoạn")
+    common.add_argument("--retry-failed", action="store_true",
+                        help="Đặt lại các ảnh lỗi trong job store (xóa số lần thử) trước khi chạy")
+    common.add_argument("--recursive", action="store_true", help="Duyệt cả thư mục con")
+
+    batch = subparsers.add_parser("batch", parents=[common], help="Trích xuất hàng loạt ảnh / PDF trong thư mục")
+    batch.add_argument("paths", nargs="+", help="Thư mục hoặc file ảnh/PDF")
+    batch.add_argument("--xlsx", help="Xuất kết quả gộp ra file Excel")
+    batch.set_defaults(handler=run_batch)
+
+    watch = subparsers.add_parser("watch", parents=[common],
+                                  help="Theo dõi thư mục và tự động xử lý ảnh / PDF mới")
+    watch.add_argument("folder", help="Thư mục cần theo dõi")
+    watch.add_argument("--xlsx-dir", help="Thư mục lưu file Excel kết quả (mỗi file ảnh một file Excel)")
+    watch.add_argument("--run-for", type=float, help="Tự dừng sau số giây này (mặc định: chạy tới khi Ctrl+C)")
+    watch.set_defaults(handler=run_watch)
+    return parser
+
+def main(argv=None):
+    """Điểm vào CLI - trả về exit code"""
+    args = build_parser().parse_args(argv)
+    out = sys.stdout
+    try:
+        # Log dạng emoji của các module → stderr, stdout chỉ chứa JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            return args.handler(args, out)
+    except KeyboardInterrupt:
+        emit(out, "error", message="Đã dừng bởi người dùng")
+        return 130
+    except Exception as e:
+        emit(out, "error", message=str(e))
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
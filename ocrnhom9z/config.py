@@ -1,10 +1,79 @@
 # config.py - Cấu hình hệ thống
 
+import bisect
+import os
+import unicodedata
+from functools import lru_cache
+from types import MappingProxyType
+
+# Thư mục chứa mã nguồn - file dữ liệu cục bộ nằm ở đây dù chạy từ thư mục nào (cron, shortcut...)
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
 # Gemini API Configuration
 GEMINI_MODEL = "gemini-1.5-flash"
 MAX_TOKENS = 4000
-TIMEOUT = 120
+TIMEOUT = 120  # giây - deadline cho mỗi request Gemini (quá hạn thì hủy)
+HEDGE_ENABLED = False  # gửi request dự phòng khi request chậm hơn percentile HEDGE_PERCENTILE
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20  # số request thành công tối thiểu trước khi bắt đầu hedge
+HEDGE_MIN_DELAY = 5.0  # giây - không hedge sớm hơn mốc này
+HEDGE_LATENCY_WINDOW = 200  # số request gần nhất dùng để tính percentile
+METRICS_HISTORY_SIZE = 1000  # số lần trích xuất giữ số liệu trong bộ nhớ (get_metrics)
+GEMINI_CONNECTION_CHECK_TTL = 300  # giây - kết quả kiểm tra kết nối thành công được dùng lại
 GEMINI_RATE_LIMIT = 15  # requests per minute
+GEMINI_JSON_MODE = True  # yêu cầu Gemini trả JSON theo schema sinh từ cột của template
+PROMPT_COMPACT = False  # dùng prompt rút gọn sinh từ cột + quy tắc của template (ít token hơn)
+GEMINI_STREAMING = True  # nhận response dạng stream khi có người nhận từng dòng (on_row / iter_rows)
+RATE_LIMIT_BURST = 3  # số request được phép gửi dồn khi bucket đầy
+RATE_LIMIT_MAX_RETRIES = 5  # số lần thử lại khi gặp lỗi 429/quota
+RATE_LIMIT_BACKOFF_BASE = 2.0  # giây, nhân đôi sau mỗi lần lỗi quota liên tiếp
+RATE_LIMIT_BACKOFF_MAX = 60.0  # giây
+
+# Batch Processing Settings
+BATCH_MAX_WORKERS = 4  # số ảnh xử lý đồng thời tối đa
+
+# Job Store Settings (tiếp tục batch sau khi bị gián đoạn)
+JOB_STORE_FILE = os.path.join(APP_DIR, "ocr_jobs.db")
+JOB_RESULTS_DIR = os.path.join(APP_DIR, "ocr_job_results")
+JOB_MAX_ATTEMPTS = 3  # số lần thử tối đa cho một ảnh lỗi trong một phiên (lần chạy sau thử lại từ đầu)
+
+# Batch Dedupe Settings (file trùng trong cùng một batch)
+# Chỉ gộp file giống hệt nội dung (SHA-256) - ảnh chụp lại cùng bảng vẫn được gửi lên API
+BATCH_DEDUPE_ENABLED = True
+
+# Response Cache Settings
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_FILE = os.path.join(APP_DIR, "ocr_response_cache.db")
+RESPONSE_CACHE_MAX_ENTRIES = 2000  # vượt quá sẽ xóa bản ghi ít dùng nhất (LRU)
+
+# Image Normalization Settings (trước khi upload)
+IMAGE_NORMALIZE_ENABLED = True
+IMAGE_MAX_SIDE = 2048  # pixel, cạnh dài nhất sau khi thu nhỏ
+IMAGE_GRAYSCALE = False
+IMAGE_ENCODING = "JPEG"  # JPEG, PNG hoặc WEBP
+IMAGE_JPEG_QUALITY = 85
+
+# Auto-crop Settings (cắt vùng bảng trước khi gửi ảnh)
+AUTO_CROP_ENABLED = True
+AUTO_CROP_WORK_SIDE = 512  # cạnh dài của bản thu nhỏ dùng để dò đường kẻ
+AUTO_CROP_INK_DELTA = 25  # độ tối hơn nền cục bộ để coi là mực
+AUTO_CROP_MIN_LINE_RATIO = 0.25  # đường kẻ phải dài tối thiểu 25% chiều rộng/cao ảnh
+AUTO_CROP_MARGIN = 0.02  # nới lề 2% quanh khung bảng
+AUTO_CROP_MIN_AREA_RATIO = 0.15  # khung nhỏ hơn 15% ảnh → coi như không tìm thấy
+
+# Tiling Settings (bảng dài nhiều dòng)
+TILING_ENABLED = False
+TILE_MIN_ASPECT_RATIO = 1.8  # chỉ chia khi chiều cao / chiều rộng >= giá trị này
+TILE_COUNT = 3  # số dải ngang
+TILE_OVERLAP = 0.1  # tỷ lệ chồng lấn giữa hai dải liền kề (so với chiều cao dải)
+
+# Targeted Re-extraction (chỉ gọi lại cho các dòng nghi sai)
+REEXTRACT_SUSPECT_ROWS = False  # tự động gọi lại cho các dòng DataValidator đánh dấu nghi sai
+REEXTRACT_BAND_PADDING_ROWS = 1.5  # số dòng cắt thêm mỗi phía quanh vị trí ước lượng của dòng
+REEXTRACT_MAX_BANDS = 4  # cần nhiều dải hơn → gọi lại cả bảng sẽ rẻ hơn, bỏ qua
+
+# Replay Backend Settings (chạy offline không tốn quota)
+REPLAY_RECORDINGS_DIR = "replay_recordings"
 
 # Application Settings
 APP_TITLE = "📊 Trích Xuất Bảng Điểm Sinh Viên"
@@ -13,14 +82,29 @@ APP_BG_COLOR = "#f0f0f0"
 
 # File Settings
 SUPPORTED_IMAGE_FORMATS = [
-    ("Image files", "*.png *.jpg *.jpeg *.bmp *.tiff"),
+    ("Image files", "*.png *.jpg *.jpeg *.bmp *.tif *.tiff"),
+    ("All files", "*.*")
+]
+# Xử lý hàng loạt: thêm PDF scan (mỗi trang TIFF/PDF là một job riêng)
+SUPPORTED_BATCH_FORMATS = [
+    ("Image / PDF files", "*.png *.jpg *.jpeg *.bmp *.tif *.tiff *.pdf"),
     ("All files", "*.*")
 ]
+BATCH_FILE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.pdf')
+PDF_RENDER_DPI = 200  # độ phân giải render trang PDF
+
+# Hot-folder Settings (chế độ theo dõi thư mục: python -m ocrnhom9z watch <thư mục>)
+WATCH_USE_NATIVE = True  # dùng watchdog (inotify / ReadDirectoryChangesW) nếu đã cài, không thì quét định kỳ
+WATCH_POLL_INTERVAL = 2.0  # giây giữa hai lần quét thư mục (chế độ quét)
+WATCH_SETTLE_SECONDS = 2.0  # file phải giữ nguyên kích thước/thời gian sửa trong khoảng này mới xử lý
+WATCH_MAX_WORKERS = 2  # số file xử lý song song
 
 # OCR Settings
+OCR_ENGINE = "gemini"  # gemini | tesseract | auto (Tesseract trước, Gemini dự phòng cho chữ viết tay)
 OCR_LANGUAGES = "vie+eng"
 OCR_CONFIG_STANDARD = "--oem 3 --psm 6"
 OCR_CONFIG_HANDWRITING = "--oem 3 --psm 4"
+OCR_MIN_ROWS = 1  # chế độ auto: Tesseract đọc ít hơn số dòng này thì chuyển sang Gemini
 
 # Data Validation Settings
 MIN_MSV_LENGTH = 8
@@ -28,6 +112,15 @@ MAX_MSV_LENGTH = 10
 VALID_MSV_PREFIXES = ['15', '17', '18', '19', '20', '21', '22', '23', '24']
 VALID_SCORE_RANGE = (0.0, 10.0)
 
+# Fuzzy Name Correction (name_corrector.py)
+NAME_FUZZY_ENABLED = True  # sửa tên gần đúng khi không có trong OCR_NAME_CORRECTIONS
+NAME_FUZZY_MAX_DISTANCE = 2  # số lỗi tối đa (thêm / xóa / thay / đổi chỗ ký tự) trên tên không dấu
+NAME_FUZZY_MIN_LENGTH = 4  # tên ngắn hơn: chỉ khôi phục dấu, không sửa ký tự
+NAME_FUZZY_LONG_LENGTH = 7  # tên từ độ dài này mới được sửa tới NAME_FUZZY_MAX_DISTANCE lỗi
+NAME_FUZZY_MAX_WORD_LENGTH = 15  # từ dài hơn không phải tên - bỏ qua (giới hạn độ trễ)
+NAME_FUZZY_MAX_CANDIDATES = 64  # số ứng viên tối đa được tính khoảng cách mỗi lần tra
+NAME_FUZZY_CACHE_SIZE = 4096
+
 # Excel Export Settings
 EXCEL_SHEET_NAME_PREFIX = "BangDiem"
 EXCEL_HEADERS = ["STT", "Lớp", "MSV", "Họ và đệm", "Tên", "CC", "KT1", "KT2", "KDT"]
@@ -99,238 +192,211 @@ COMMON_VIETNAMESE_NAMES = (
 )[:20]  # Top 20 tên
 
 # OCR Error Corrections
-OCR_NUMBER_CORRECTIONS = {
-    'O': '0', 'o': '0',
-    'I': '1', 'l': '1', '|': '1',
-    'S': '5', 's': '5',
-    'G': '6', 'g': '6',
-    'T': '7', 't': '7',
-    'B': '8', 'b': '8',
-    'g': '9', 'q': '9',
-}
+def build_corrections(pairs, name):
+    """Tạo dict sửa lỗi từ danh sách cặp (sai, đúng) - cảnh báo khi một khóa có nhiều giá trị khác nhau"""
+    corrections = {}
+    for wrong, correct in pairs:
+        if wrong in corrections and corrections[wrong] != correct:
+            print(f"⚠️ {name}: '{wrong}' có hai giá trị '{corrections[wrong]}' và '{correct}' - dùng '{correct}'")
+        corrections[wrong] = correct
+    return corrections
+
+# Danh sách cặp thay vì dict literal: khóa trùng trong dict literal bị ghi đè mà không báo
+OCR_NUMBER_CORRECTIONS = build_corrections([
+    ('O', '0'), ('o', '0'),
+    ('I', '1'), ('l', '1'), ('|', '1'),
+    ('S', '5'), ('s', '5'),
+    ('G', '6'),
+    ('T', '7'), ('t', '7'),
+    ('B', '8'), ('b', '8'),
+    ('g', '9'), ('q', '9'),  # 'g' viết tay giống 9 (trước đây có thêm 'g': '6' nhưng bị ghi đè)
+], "OCR_NUMBER_CORRECTIONS")
 
 # Comprehensive OCR Name Corrections Database
-OCR_NAME_CORRECTIONS = {
+# Mỗi khóa chỉ một giá trị: từ có nhiều cách đọc lấy cách phổ biến nhất (Van → Văn, Truong → Trương,
+# Uyen → Uyên), hoặc giữ nguyên khi dạng không dấu cũng là tên thật (Thanh, Anh, Dung, Vinh).
+# Chữ thường / hoa được tra qua suggest_name_correction (lower / upper / title).
+OCR_NAME_CORRECTIONS = build_corrections([
     # Họ phổ biến - sửa lỗi thiếu dấu
-    'Nguyen': 'Nguyễn', 'nguyen': 'Nguyễn', 'NGUYEN': 'Nguyễn',
-    'Tran': 'Trần', 'tran': 'Trần', 'TRAN': 'Trần',
-    'Le': 'Lê', 'le': 'Lê', 'LE': 'Lê',
-    'Pham': 'Phạm', 'pham': 'Phạm', 'PHAM': 'Phạm',
-    'Hoang': 'Hoàng', 'hoang': 'Hoàng', 'HOANG': 'Hoàng',
-    'Huynh': 'Huỳnh', 'huynh': 'Huỳnh', 'HUYNH': 'Huỳnh',
-    'Bui': 'Bùi', 'bui': 'Bùi', 'BUI': 'Bùi',
-    'Do': 'Đỗ', 'do': 'Đỗ', 'DO': 'Đỗ',
-    'Dao': 'Đào', 'dao': 'Đào', 'DAO': 'Đào',
-    'Duong': 'Dương', 'duong': 'Dương', 'DUONG': 'Dương',
-    'Lam': 'Lâm', 'lam': 'Lâm', 'LAM': 'Lâm',
-    'Luong': 'Lương', 'luong': 'Lương', 'LUONG': 'Lương',
-    'Dang': 'Đặng', 'dang': 'Đặng', 'DANG': 'Đặng',
-    'Vo': 'Võ', 'vo': 'Võ', 'VO': 'Võ',
-    'Vu': 'Vũ', 'vu': 'Vũ', 'VU': 'Vũ',
-    'Ho': 'Hồ', 'ho': 'Hồ', 'HO': 'Hồ',
-    'Ngo': 'Ngô', 'ngo': 'Ngô', 'NGO': 'Ngô',
-    'Ly': 'Lý', 'ly': 'Lý', 'LY': 'Lý',
-    'Truong': 'Trương', 'truong': 'Trương', 'TRUONG': 'Trương',
-    'Vuong': 'Vương', 'vuong': 'Vương', 'VUONG': 'Vương',
+    ('Nguyen', 'Nguyễn'), ('nguyen', 'Nguyễn'), ('NGUYEN', 'Nguyễn'),
+    ('Tran', 'Trần'), ('tran', 'Trần'), ('TRAN', 'Trần'),
+    ('Le', 'Lê'), ('le', 'Lê'), ('LE', 'Lê'),
+    ('Pham', 'Phạm'), ('pham', 'Phạm'), ('PHAM', 'Phạm'),
+    ('Hoang', 'Hoàng'), ('hoang', 'Hoàng'), ('HOANG', 'Hoàng'),
+    ('Huynh', 'Huỳnh'), ('huynh', 'Huỳnh'), ('HUYNH', 'Huỳnh'),
+    ('Bui', 'Bùi'), ('bui', 'Bùi'), ('BUI', 'Bùi'),
+    ('Do', 'Đỗ'), ('do', 'Đỗ'), ('DO', 'Đỗ'),
+    ('Dao', 'Đào'), ('dao', 'Đào'), ('DAO', 'Đào'),
+    ('Duong', 'Dương'), ('duong', 'Dương'), ('DUONG', 'Dương'),
+    ('Lam', 'Lâm'), ('lam', 'Lâm'), ('LAM', 'Lâm'),
+    ('Luong', 'Lương'), ('luong', 'Lương'), ('LUONG', 'Lương'),
+    ('Dang', 'Đặng'), ('dang', 'Đặng'), ('DANG', 'Đặng'),
+    ('Vo', 'Võ'), ('vo', 'Võ'), ('VO', 'Võ'),
+    ('Vu', 'Vũ'), ('vu', 'Vũ'), ('VU', 'Vũ'),
+    ('Ho', 'Hồ'), ('ho', 'Hồ'), ('HO', 'Hồ'),
+    ('Ngo', 'Ngô'), ('ngo', 'Ngô'), ('NGO', 'Ngô'),
+    ('Ly', 'Lý'), ('ly', 'Lý'), ('LY', 'Lý'),
+    ('Truong', 'Trương'), ('truong', 'Trương'), ('TRUONG', 'Trương'),
+    ('Vuong', 'Vương'), ('vuong', 'Vương'), ('VUONG', 'Vương'),
 
     # Tên đệm phổ biến
-    'Van': 'Văn', 'van': 'Văn', 'VAN': 'Văn',
-    'Duc': 'Đức', 'duc': 'Đức', 'DUC': 'Đức',
-    'Thi': 'Thị', 'thi': 'Thị', 'THI': 'Thị',
-    'Ngoc': 'Ngọc', 'ngoc': 'Ngọc', 'NGOC': 'Ngọc',
-    'Hong': 'Hồng', 'hong': 'Hồng', 'HONG': 'Hồng',
-    'Thanh': 'Thanh', 'thanh': 'Thanh', 'THANH': 'Thanh',
-    'Quang': 'Quang', 'quang': 'Quang', 'QUANG': 'Quang',
-    'Huu': 'Hữu', 'huu': 'Hữu', 'HUU': 'Hữu',
-    'Cong': 'Công', 'cong': 'Công', 'CONG': 'Công',
-    'Thanh': 'Thành', 'thanh': 'Thành', 'THANH': 'Thành',
+    ('Van', 'Văn'), ('van', 'Văn'), ('VAN', 'Văn'),
+    ('Duc', 'Đức'), ('duc', 'Đức'), ('DUC', 'Đức'),
+    ('Thi', 'Thị'), ('thi', 'Thị'), ('THI', 'Thị'),
+    ('Ngoc', 'Ngọc'), ('ngoc', 'Ngọc'), ('NGOC', 'Ngọc'),
+    ('Hong', 'Hồng'), ('hong', 'Hồng'), ('HONG', 'Hồng'),
+    ('Thanh', 'Thanh'), ('thanh', 'Thanh'), ('THANH', 'Thanh'),
+    ('Quang', 'Quang'), ('quang', 'Quang'), ('QUANG', 'Quang'),
+    ('Huu', 'Hữu'), ('huu', 'Hữu'), ('HUU', 'Hữu'),
+    ('Cong', 'Công'), ('cong', 'Công'), ('CONG', 'Công'),
 
     # Tên riêng phổ biến
-    'Anh': 'Anh', 'anh': 'Anh', 'ANH': 'Anh',
-    'Dat': 'Đạt', 'dat': 'Đạt', 'DAT': 'Đạt',
-    'Dung': 'Dũng', 'dung': 'Dũng', 'DUNG': 'Dũng',
-    'Dong': 'Đông', 'dong': 'Đông', 'DONG': 'Đông',
-    'Cuong': 'Cường', 'cuong': 'Cường', 'CUONG': 'Cường',
-    'Hung': 'Hùng', 'hung': 'Hùng', 'HUNG': 'Hùng',
-    'Manh': 'Mạnh', 'manh': 'Mạnh', 'MANH': 'Mạnh',
-    'Quoc': 'Quốc', 'quoc': 'Quốc', 'QUOC': 'Quốc',
-    'Tien': 'Tiến', 'tien': 'Tiến', 'TIEN': 'Tiến',
-    'Tuan': 'Tuấn', 'tuan': 'Tuấn', 'TUAN': 'Tuấn',
-    'Vinh': 'Vinh', 'vinh': 'Vinh', 'VINH': 'Vinh',
-    'Bao': 'Bảo', 'bao': 'Bảo', 'BAO': 'Bảo',
-    'Khanh': 'Khánh', 'khanh': 'Khánh', 'KHANH': 'Khánh',
-    'Linh': 'Linh', 'linh': 'Linh', 'LINH': 'Linh',
-    'Phuong': 'Phương', 'phuong': 'Phương', 'PHUONG': 'Phương',
-    'Thao': 'Thảo', 'thao': 'Thảo', 'THAO': 'Thảo',
-    'Huong': 'Hương', 'huong': 'Hương', 'HUONG': 'Hương',
-    'Quynh': 'Quỳnh', 'quynh': 'Quỳnh', 'QUYNH': 'Quỳnh',
-    'Yen': 'Yến', 'yen': 'Yến', 'YEN': 'Yến',
-    'Thuy': 'Thúy', 'thuy': 'Thúy', 'THUY': 'Thúy',
-    'Tuyet': 'Tuyết', 'tuyet': 'Tuyết', 'TUYET': 'Tuyết',
+    ('Anh', 'Anh'), ('anh', 'Anh'), ('ANH', 'Anh'),
+    ('Dat', 'Đạt'), ('dat', 'Đạt'), ('DAT', 'Đạt'),
+    ('Dong', 'Đông'), ('dong', 'Đông'), ('DONG', 'Đông'),
+    ('Cuong', 'Cường'), ('cuong', 'Cường'), ('CUONG', 'Cường'),
+    ('Hung', 'Hùng'), ('hung', 'Hùng'), ('HUNG', 'Hùng'),
+    ('Manh', 'Mạnh'), ('manh', 'Mạnh'), ('MANH', 'Mạnh'),
+    ('Quoc', 'Quốc'), ('quoc', 'Quốc'), ('QUOC', 'Quốc'),
+    ('Tien', 'Tiến'), ('tien', 'Tiến'), ('TIEN', 'Tiến'),
+    ('Tuan', 'Tuấn'), ('tuan', 'Tuấn'), ('TUAN', 'Tuấn'),
+    ('Vinh', 'Vinh'), ('vinh', 'Vinh'), ('VINH', 'Vinh'),
+    ('Bao', 'Bảo'), ('bao', 'Bảo'), ('BAO', 'Bảo'),
+    ('Khanh', 'Khánh'), ('khanh', 'Khánh'), ('KHANH', 'Khánh'),
+    ('Linh', 'Linh'), ('linh', 'Linh'), ('LINH', 'Linh'),
+    ('Phuong', 'Phương'), ('phuong', 'Phương'), ('PHUONG', 'Phương'),
+    ('Thao', 'Thảo'), ('thao', 'Thảo'), ('THAO', 'Thảo'),
+    ('Huong', 'Hương'), ('huong', 'Hương'), ('HUONG', 'Hương'),
+    ('Quynh', 'Quỳnh'), ('quynh', 'Quỳnh'), ('QUYNH', 'Quỳnh'),
+    ('Yen', 'Yến'), ('yen', 'Yến'), ('YEN', 'Yến'),
+    ('Tuyet', 'Tuyết'), ('tuyet', 'Tuyết'), ('TUYET', 'Tuyết'),
 
     # Các trường hợp thiếu dấu phổ biến - Họ
-    'Dang': 'Đặng', 'dang': 'Đặng', 'DANG': 'Đặng',
-    'Dinh': 'Đinh', 'dinh': 'Đinh', 'DINH': 'Đinh',
-    'Dong': 'Đông', 'dong': 'Đông', 'DONG': 'Đông',
-    'Doan': 'Đoàn', 'doan': 'Đoàn', 'DOAN': 'Đoàn',
-    'Kieu': 'Kiều', 'kieu': 'Kiều', 'KIEU': 'Kiều',
-    'Luu': 'Lưu', 'luu': 'Lưu', 'LUU': 'Lưu',
-    'Thai': 'Thái', 'thai': 'Thái', 'THAI': 'Thái',
-    'Tang': 'Tăng', 'tang': 'Tăng', 'TANG': 'Tăng',
-    'Thach': 'Thạch', 'thach': 'Thạch', 'THACH': 'Thạch',
-    'Hua': 'Hứa', 'hua': 'Hứa', 'HUA': 'Hứa',
-    'Quach': 'Quách', 'quach': 'Quách', 'QUACH': 'Quách',
-    'Ton': 'Tôn', 'ton': 'Tôn', 'TON': 'Tôn',
-    'Khuong': 'Khương', 'khuong': 'Khương', 'KHUONG': 'Khương',
-    'Tu': 'Từ', 'tu': 'Từ', 'TU': 'Từ',
-    'Ung': 'Ưng', 'ung': 'Ưng', 'UNG': 'Ưng',
-    'Au': 'Âu', 'au': 'Âu', 'AU': 'Âu',
-    'Bach': 'Bạch', 'bach': 'Bạch', 'BACH': 'Bạch',
-    'Banh': 'Bành', 'banh': 'Bành', 'BANH': 'Bành',
-    'Cung': 'Cung', 'cung': 'Cung', 'CUNG': 'Cung',
-    'Diep': 'Diệp', 'diep': 'Diệp', 'DIEP': 'Diệp',
-    'Doan': 'Doãn', 'doan': 'Doãn', 'DOAN': 'Doãn',
+    ('Doan', 'Đoàn'), ('doan', 'Đoàn'), ('DOAN', 'Đoàn'),
+    ('Kieu', 'Kiều'), ('kieu', 'Kiều'), ('KIEU', 'Kiều'),
+    ('Luu', 'Lưu'), ('luu', 'Lưu'), ('LUU', 'Lưu'),
+    ('Thai', 'Thái'), ('thai', 'Thái'), ('THAI', 'Thái'),
+    ('Tang', 'Tăng'), ('tang', 'Tăng'), ('TANG', 'Tăng'),
+    ('Thach', 'Thạch'), ('thach', 'Thạch'), ('THACH', 'Thạch'),
+    ('Hua', 'Hứa'), ('hua', 'Hứa'), ('HUA', 'Hứa'),
+    ('Quach', 'Quách'), ('quach', 'Quách'), ('QUACH', 'Quách'),
+    ('Ton', 'Tôn'), ('ton', 'Tôn'), ('TON', 'Tôn'),
+    ('Khuong', 'Khương'), ('khuong', 'Khương'), ('KHUONG', 'Khương'),
+    ('Ung', 'Ưng'), ('ung', 'Ưng'), ('UNG', 'Ưng'),
+    ('Au', 'Âu'), ('au', 'Âu'), ('AU', 'Âu'),
+    ('Banh', 'Bành'), ('banh', 'Bành'), ('BANH', 'Bành'),
+    ('Cung', 'Cung'), ('cung', 'Cung'), ('CUNG', 'Cung'),
+    ('Diep', 'Diệp'), ('diep', 'Diệp'), ('DIEP', 'Diệp'),
 
     # Các trường hợp thiếu dấu - Tên đệm
-    'Minh': 'Minh', 'minh': 'Minh', 'MINH': 'Minh',
-    'Huu': 'Hữu', 'huu': 'Hữu', 'HUU': 'Hữu',
-    'Cong': 'Công', 'cong': 'Công', 'CONG': 'Công',
-    'Thanh': 'Thành', 'thanh': 'Thành', 'THANH': 'Thành',
-    'Tuan': 'Tuấn', 'tuan': 'Tuấn', 'TUAN': 'Tuấn',
-    'Khac': 'Khắc', 'khac': 'Khắc', 'KHAC': 'Khắc',
-    'Dinh': 'Đình', 'dinh': 'Đình', 'DINH': 'Đình',
-    'Tan': 'Tấn', 'tan': 'Tấn', 'TAN': 'Tấn',
-    'Bich': 'Bích', 'bich': 'Bích', 'BICH': 'Bích',
-    'Dieu': 'Diệu', 'dieu': 'Diệu', 'DIEU': 'Diệu',
-    'Cam': 'Cẩm', 'cam': 'Cẩm', 'CAM': 'Cẩm',
-    'My': 'Mỹ', 'my': 'Mỹ', 'MY': 'Mỹ',
-    'Gia': 'Gia', 'gia': 'Gia', 'GIA': 'Gia',
-    'Nhu': 'Như', 'nhu': 'Như', 'NHU': 'Như',
+    ('Minh', 'Minh'), ('minh', 'Minh'), ('MINH', 'Minh'),
+    ('Khac', 'Khắc'), ('khac', 'Khắc'), ('KHAC', 'Khắc'),
+    ('Dinh', 'Đình'), ('dinh', 'Đình'), ('DINH', 'Đình'),
+    ('Bich', 'Bích'), ('bich', 'Bích'), ('BICH', 'Bích'),
+    ('Dieu', 'Diệu'), ('dieu', 'Diệu'), ('DIEU', 'Diệu'),
+    ('Cam', 'Cẩm'), ('cam', 'Cẩm'), ('CAM', 'Cẩm'),
+    ('My', 'Mỹ'), ('my', 'Mỹ'), ('MY', 'Mỹ'),
+    ('Gia', 'Gia'), ('gia', 'Gia'), ('GIA', 'Gia'),
+    ('Nhu', 'Như'), ('nhu', 'Như'), ('NHU', 'Như'),
 
     # Các trường hợp thiếu dấu - Tên riêng
-    'Binh': 'Bình', 'binh': 'Bình', 'BINH': 'Bình',
-    'Duc': 'Đức', 'duc': 'Đức', 'DUC': 'Đức',
-    'Hung': 'Hùng', 'hung': 'Hùng', 'HUNG': 'Hùng',
-    'Khang': 'Khang', 'khang': 'Khang', 'KHANG': 'Khang',
-    'Kien': 'Kiên', 'kien': 'Kiên', 'KIEN': 'Kiên',
-    'Long': 'Long', 'long': 'Long', 'LONG': 'Long',
-    'Phong': 'Phong', 'phong': 'Phong', 'PHONG': 'Phong',
-    'Son': 'Sơn', 'son': 'Sơn', 'SON': 'Sơn',
-    'Thang': 'Thắng', 'thang': 'Thắng', 'THANG': 'Thắng',
-    'Thinh': 'Thịnh', 'thinh': 'Thịnh', 'THINH': 'Thịnh',
-    'Tung': 'Tùng', 'tung': 'Tùng', 'TUNG': 'Tùng',
-    'Vinh': 'Vĩnh', 'vinh': 'Vĩnh', 'VINH': 'Vĩnh',
-    'Xuan': 'Xuân', 'xuan': 'Xuân', 'XUAN': 'Xuân',
-    'Bach': 'Bách', 'bach': 'Bách', 'BACH': 'Bách',
-    'Cao': 'Cao', 'cao': 'Cao', 'CAO': 'Cao',
-    'Hieu': 'Hiếu', 'hieu': 'Hiếu', 'HIEU': 'Hiếu',
-    'Khai': 'Khải', 'khai': 'Khải', 'KHAI': 'Khải',
-    'Loi': 'Lợi', 'loi': 'Lợi', 'LOI': 'Lợi',
-    'Ngan': 'Ngân', 'ngan': 'Ngân', 'NGAN': 'Ngân',
-    'Quyet': 'Quyết', 'quyet': 'Quyết', 'QUYET': 'Quyết',
-    'Tan': 'Tân', 'tan': 'Tân', 'TAN': 'Tân',
-    'Thong': 'Thông', 'thong': 'Thông', 'THONG': 'Thông',
-    'Truong': 'Trường', 'truong': 'Trường', 'TRUONG': 'Trường',
-    'Van': 'Vạn', 'van': 'Vạn', 'VAN': 'Vạn',
+    ('Binh', 'Bình'), ('binh', 'Bình'), ('BINH', 'Bình'),
+    ('Khang', 'Khang'), ('khang', 'Khang'), ('KHANG', 'Khang'),
+    ('Kien', 'Kiên'), ('kien', 'Kiên'), ('KIEN', 'Kiên'),
+    ('Long', 'Long'), ('long', 'Long'), ('LONG', 'Long'),
+    ('Phong', 'Phong'), ('phong', 'Phong'), ('PHONG', 'Phong'),
+    ('Son', 'Sơn'), ('son', 'Sơn'), ('SON', 'Sơn'),
+    ('Thang', 'Thắng'), ('thang', 'Thắng'), ('THANG', 'Thắng'),
+    ('Thinh', 'Thịnh'), ('thinh', 'Thịnh'), ('THINH', 'Thịnh'),
+    ('Tung', 'Tùng'), ('tung', 'Tùng'), ('TUNG', 'Tùng'),
+    ('Xuan', 'Xuân'), ('xuan', 'Xuân'), ('XUAN', 'Xuân'),
+    ('Bach', 'Bách'), ('bach', 'Bách'), ('BACH', 'Bách'),
+    ('Cao', 'Cao'), ('cao', 'Cao'), ('CAO', 'Cao'),
+    ('Hieu', 'Hiếu'), ('hieu', 'Hiếu'), ('HIEU', 'Hiếu'),
+    ('Khai', 'Khải'), ('khai', 'Khải'), ('KHAI', 'Khải'),
+    ('Loi', 'Lợi'), ('loi', 'Lợi'), ('LOI', 'Lợi'),
+    ('Ngan', 'Ngân'), ('ngan', 'Ngân'), ('NGAN', 'Ngân'),
+    ('Quyet', 'Quyết'), ('quyet', 'Quyết'), ('QUYET', 'Quyết'),
+    ('Tan', 'Tân'), ('tan', 'Tân'), ('TAN', 'Tân'),
+    ('Thong', 'Thông'), ('thong', 'Thông'), ('THONG', 'Thông'),
 
     # Tên nữ thiếu dấu
-    'Chi': 'Chi', 'chi': 'Chi', 'CHI': 'Chi',
-    'Dung': 'Dung', 'dung': 'Dung', 'DUNG': 'Dung',
-    'Ha': 'Hà', 'ha': 'Hà', 'HA': 'Hà',
-    'Lan': 'Lan', 'lan': 'Lan', 'LAN': 'Lan',
-    'Mai': 'Mai', 'mai': 'Mai', 'MAI': 'Mai',
-    'Nga': 'Nga', 'nga': 'Nga', 'NGA': 'Nga',
-    'Oanh': 'Oanh', 'oanh': 'Oanh', 'OANH': 'Oanh',
-    'Uyen': 'Uyên', 'uyen': 'Uyên', 'UYEN': 'Uyên',
-    'Van': 'Vân', 'van': 'Vân', 'VAN': 'Vân',
-    'Anh': 'Ánh', 'anh': 'Ánh', 'ANH': 'Ánh',
-    'Chau': 'Châu', 'chau': 'Châu', 'CHAU': 'Châu',
-    'Hoa': 'Hoa', 'hoa': 'Hoa', 'HOA': 'Hoa',
-    'Lam': 'Lam', 'lam': 'Lam', 'LAM': 'Lam',
-    'Nhi': 'Nhi', 'nhi': 'Nhi', 'NHI': 'Nhi',
-    'Phung': 'Phụng', 'phung': 'Phụng', 'PHUNG': 'Phụng',
-    'Thu': 'Thư', 'thu': 'Thư', 'THU': 'Thư',
-    'Trinh': 'Trinh', 'trinh': 'Trinh', 'TRINH': 'Trinh',
-    'Uyen': 'Uyển', 'uyen': 'Uyển', 'UYEN': 'Uyển',
-    'Cuc': 'Cúc', 'cuc': 'Cúc', 'CUC': 'Cúc',
-    'Hang': 'Hằng', 'hang': 'Hằng', 'HANG': 'Hằng',
-    'Lien': 'Liên', 'lien': 'Liên', 'LIEN': 'Liên',
-    'Pha': 'Pha', 'pha': 'Pha', 'PHA': 'Pha',
-    'Suong': 'Sương', 'suong': 'Sương', 'SUONG': 'Sương',
-    'Tu': 'Tú', 'tu': 'Tú', 'TU': 'Tú',
-    'Vang': 'Vàng', 'vang': 'Vàng', 'VANG': 'Vàng',
-    'Dao': 'Đào', 'dao': 'Đào', 'DAO': 'Đào',
-    'Huyen': 'Huyền', 'huyen': 'Huyền', 'HUYEN': 'Huyền',
+    ('Chi', 'Chi'), ('chi', 'Chi'), ('CHI', 'Chi'),
+    ('Dung', 'Dung'), ('dung', 'Dung'), ('DUNG', 'Dung'),
+    ('Ha', 'Hà'), ('ha', 'Hà'), ('HA', 'Hà'),
+    ('Lan', 'Lan'), ('lan', 'Lan'), ('LAN', 'Lan'),
+    ('Mai', 'Mai'), ('mai', 'Mai'), ('MAI', 'Mai'),
+    ('Nga', 'Nga'), ('nga', 'Nga'), ('NGA', 'Nga'),
+    ('Oanh', 'Oanh'), ('oanh', 'Oanh'), ('OANH', 'Oanh'),
+    ('Uyen', 'Uyên'), ('uyen', 'Uyên'), ('UYEN', 'Uyên'),
+    ('Chau', 'Châu'), ('chau', 'Châu'), ('CHAU', 'Châu'),
+    ('Hoa', 'Hoa'), ('hoa', 'Hoa'), ('HOA', 'Hoa'),
+    ('Nhi', 'Nhi'), ('nhi', 'Nhi'), ('NHI', 'Nhi'),
+    ('Phung', 'Phụng'), ('phung', 'Phụng'), ('PHUNG', 'Phụng'),
+    ('Thu', 'Thư'), ('thu', 'Thư'), ('THU', 'Thư'),
+    ('Trinh', 'Trinh'), ('trinh', 'Trinh'), ('TRINH', 'Trinh'),
+    ('Cuc', 'Cúc'), ('cuc', 'Cúc'), ('CUC', 'Cúc'),
+    ('Hang', 'Hằng'), ('hang', 'Hằng'), ('HANG', 'Hằng'),
+    ('Lien', 'Liên'), ('lien', 'Liên'), ('LIEN', 'Liên'),
+    ('Pha', 'Pha'), ('pha', 'Pha'), ('PHA', 'Pha'),
+    ('Suong', 'Sương'), ('suong', 'Sương'), ('SUONG', 'Sương'),
+    ('Tu', 'Tú'), ('tu', 'Tú'), ('TU', 'Tú'),
+    ('Vang', 'Vàng'), ('vang', 'Vàng'), ('VANG', 'Vàng'),
+    ('Huyen', 'Huyền'), ('huyen', 'Huyền'), ('HUYEN', 'Huyền'),
 
     # Các trường hợp đặc biệt với dấu thanh
-    'An': 'An', 'an': 'An', 'AN': 'An',  # Có thể là Ân, Ấn
-    'Am': 'Âm', 'am': 'Âm', 'AM': 'Âm',
-    'Au': 'Âu', 'au': 'Âu', 'AU': 'Âu',
-    'Ay': 'Ấy', 'ay': 'Ấy', 'AY': 'Ấy',
-    'Em': 'Em', 'em': 'Em', 'EM': 'Em',
-    'En': 'Ên', 'en': 'Ên', 'EN': 'Ên',
-    'Eo': 'Eo', 'eo': 'Eo', 'EO': 'Eo',
-    'Ep': 'Ép', 'ep': 'Ép', 'EP': 'Ép',
-    'Et': 'Ết', 'et': 'Ết', 'ET': 'Ết',
-    'Ich': 'Ích', 'ich': 'Ích', 'ICH': 'Ích',
-    'Im': 'Im', 'im': 'Im', 'IM': 'Im',
-    'In': 'In', 'in': 'In', 'IN': 'In',
-    'It': 'Ít', 'it': 'Ít', 'IT': 'Ít',
-    'Oc': 'Óc', 'oc': 'Óc', 'OC': 'Óc',
-    'Om': 'Ôm', 'om': 'Ôm', 'OM': 'Ôm',
-    'On': 'Ôn', 'on': 'Ôn', 'ON': 'Ôn',
-    'Ong': 'Ông', 'ong': 'Ông', 'ONG': 'Ông',
-    'Op': 'Óp', 'op': 'Óp', 'OP': 'Óp',
-    'Ot': 'Ót', 'ot': 'Ót', 'OT': 'Ót',
-    'Uc': 'Úc', 'uc': 'Úc', 'UC': 'Úc',
-    'Um': 'Ùm', 'um': 'Ùm', 'UM': 'Ùm',
-    'Un': 'Ún', 'un': 'Ún', 'UN': 'Ún',
-    'Ung': 'Ưng', 'ung': 'Ưng', 'UNG': 'Ưng',
-    'Up': 'Úp', 'up': 'Úp', 'UP': 'Úp',
-    'Ut': 'Út', 'ut': 'Út', 'UT': 'Út',
+    ('An', 'An'), ('an', 'An'), ('AN', 'An'),  # Có thể là Ân, Ấn
+    ('Am', 'Âm'), ('am', 'Âm'), ('AM', 'Âm'),
+    ('Ay', 'Ấy'), ('ay', 'Ấy'), ('AY', 'Ấy'),
+    ('Em', 'Em'), ('em', 'Em'), ('EM', 'Em'),
+    ('En', 'Ên'), ('en', 'Ên'), ('EN', 'Ên'),
+    ('Eo', 'Eo'), ('eo', 'Eo'), ('EO', 'Eo'),
+    ('Ep', 'Ép'), ('ep', 'Ép'), ('EP', 'Ép'),
+    ('Et', 'Ết'), ('et', 'Ết'), ('ET', 'Ết'),
+    ('Ich', 'Ích'), ('ich', 'Ích'), ('ICH', 'Ích'),
+    ('Im', 'Im'), ('im', 'Im'), ('IM', 'Im'),
+    ('In', 'In'), ('in', 'In'), ('IN', 'In'),
+    ('It', 'Ít'), ('it', 'Ít'), ('IT', 'Ít'),
+    ('Oc', 'Óc'), ('oc', 'Óc'), ('OC', 'Óc'),
+    ('Om', 'Ôm'), ('om', 'Ôm'), ('OM', 'Ôm'),
+    ('On', 'Ôn'), ('on', 'Ôn'), ('ON', 'Ôn'),
+    ('Ong', 'Ông'), ('ong', 'Ông'), ('ONG', 'Ông'),
+    ('Op', 'Óp'), ('op', 'Óp'), ('OP', 'Óp'),
+    ('Ot', 'Ót'), ('ot', 'Ót'), ('OT', 'Ót'),
+    ('Uc', 'Úc'), ('uc', 'Úc'), ('UC', 'Úc'),
+    ('Um', 'Ùm'), ('um', 'Ùm'), ('UM', 'Ùm'),
+    ('Un', 'Ún'), ('un', 'Ún'), ('UN', 'Ún'),
+    ('Up', 'Úp'), ('up', 'Úp'), ('UP', 'Úp'),
+    ('Ut', 'Út'), ('ut', 'Út'), ('UT', 'Út'),
 
     # Tên có dấu sắc, huyền, hỏi, ngã, nặng
-    'Anh': 'Ánh', 'anh': 'ánh',  # Có thể là Ánh (nữ) hoặc Anh (nam)
-    'Duc': 'Đức', 'duc': 'đức',
-    'Hung': 'Hùng', 'hung': 'hùng',  # Có thể là Hùng, Hưng, Hững
-    'Huy': 'Huy', 'huy': 'huy',  # Có thể là Huy, Hùy, Hủy, Hũy, Hụy
-    'Khoi': 'Khôi', 'khoi': 'khôi',
-    'Loc': 'Lộc', 'loc': 'lộc',
-    'Nhan': 'Nhân', 'nhan': 'nhân',
-    'Phat': 'Phát', 'phat': 'phát',
-    'Quan': 'Quân', 'quan': 'quân',
-    'Tam': 'Tâm', 'tam': 'tâm',
-    'The': 'Thế', 'the': 'thế',
-    'Tri': 'Trí', 'tri': 'trí',
-    'Tuong': 'Tường', 'tuong': 'tường',
-    'Uy': 'Uy', 'uy': 'uy',
-    'Vinh': 'Vĩnh', 'vinh': 'vĩnh',
+    ('Huy', 'Huy'),  # Có thể là Huy, Hùy, Hủy, Hũy, Hụy
+    ('Khoi', 'Khôi'),
+    ('Loc', 'Lộc'),
+    ('Nhan', 'Nhân'),
+    ('Phat', 'Phát'),
+    ('Quan', 'Quân'),
+    ('Tam', 'Tâm'),
+    ('The', 'Thế'),
+    ('Tri', 'Trí'),
+    ('Tuong', 'Tường'),
+    ('Uy', 'Uy'),
 
     # Tên nữ thiếu dấu phổ biến
-    'Chau': 'Châu', 'chau': 'châu',
-    'Dieu': 'Diệu', 'dieu': 'diệu',
-    'Hanh': 'Hạnh', 'hanh': 'hạnh',
-    'Hien': 'Hiền', 'hien': 'hiền',
-    'Loan': 'Loan', 'loan': 'loan',
-    'Que': 'Quế', 'que': 'quế',
-    'Thuy': 'Thùy', 'thuy': 'thùy',  # Có thể là Thùy, Thúy, Thủy
-    'Truc': 'Trúc', 'truc': 'trúc',
-    'Uyen': 'Uyển', 'uyen': 'uyển',
-    'Hang': 'Hằng', 'hang': 'hằng',
-    'Lien': 'Liên', 'lien': 'liên',
-    'Suong': 'Sương', 'suong': 'sương',
-    'Vang': 'Vàng', 'vang': 'vàng',
-    'Huyen': 'Huyền', 'huyen': 'huyền',
-
-    # Lỗi OCR với ký tự đặc biệt
-    'Đ': 'Đ', 'd': 'đ', 'D': 'Đ',  # Đ bị nhầm thành D
-    'ă': 'ă', 'a': 'ă', 'A': 'Ă',  # ă bị nhầm thành a
-    'â': 'â', 'a': 'â', 'A': 'Â',  # â bị nhầm thành a
-    'ê': 'ê', 'e': 'ê', 'E': 'Ê',  # ê bị nhầm thành e
-    'ô': 'ô', 'o': 'ô', 'O': 'Ô',  # ô bị nhầm thành o
-    'ơ': 'ơ', 'o': 'ơ', 'O': 'Ơ',  # ơ bị nhầm thành o
-    'ư': 'ư', 'u': 'ư', 'U': 'Ư',  # ư bị nhầm thành u
-}
+    ('Hanh', 'Hạnh'),
+    ('Hien', 'Hiền'),
+    ('Loan', 'Loan'),
+    ('Que', 'Quế'),
+    ('Thuy', 'Thùy'),  # Có thể là Thùy, Thúy, Thủy
+    ('Truc', 'Trúc'),
+
+    # Lỗi OCR với ký tự đặc biệt ('a' / 'o' đứng riêng giữ nguyên: có thể là ă / â, ô / ơ)
+    ('Đ', 'Đ'), ('d', 'đ'), ('D', 'Đ'),  # Đ bị nhầm thành D
+    ('ă', 'ă'), ('â', 'â'),
+    ('ê', 'ê'), ('e', 'ê'), ('E', 'Ê'),  # ê bị nhầm thành e
+    ('ô', 'ô'), ('ơ', 'ơ'),
+    ('ư', 'ư'), ('u', 'ư'), ('U', 'Ư'),  # ư bị nhầm thành u
+], "OCR_NAME_CORRECTIONS")
 
 OCR_CLASS_CORRECTIONS = {
     'CNIT': 'CNTT', 'CNTI': 'CNTT', 'CNT': 'CNTT', 'CNTF': 'CNTT',
@@ -344,6 +410,85 @@ DEFAULT_SURNAME = "Nguyễn"
 DEFAULT_NAME = "Anh"
 
 # Utility Functions for Vietnamese Names
+def fold_name(name):
+    """Khóa tra cứu tên: chuẩn hóa Unicode (NFC) + casefold - 'NGUYỄN', 'nguyễn' cùng một khóa"""
+    return unicodedata.normalize("NFC", name.strip()).casefold()
+
+def strip_diacritics(name):
+    """Khóa tên không dấu ('Nguyễn' → 'nguyen', 'Đạt' → 'dat')"""
+    decomposed = unicodedata.normalize("NFD", fold_name(name))
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).replace("đ", "d")
+
+class NameIndex:
+    """
+    Chỉ mục bất biến cho một nhóm tên (họ, tên đệm hoặc tên riêng)
+
+    - Tra cứu có dấu, không phân biệt hoa thường: O(1)
+    - Tra cứu không dấu → các tên có dấu tương ứng ('nguyen' → Nguyễn): O(1)
+    - Tìm theo tiền tố (có dấu hoặc không dấu): O(log n + số kết quả), giữ thứ tự phổ biến
+    """
+
+    __slots__ = ("names", "_by_key", "_by_plain", "_keys", "_plain_keys")
+
+    def __init__(self, names):
+        self.names = tuple(dict.fromkeys(names))  # bỏ trùng, giữ thứ tự (tên phổ biến đứng trước)
+        by_key = {}
+        by_plain = {}
+        for name in self.names:
+            by_key.setdefault(fold_name(name), name)
+            by_plain.setdefault(strip_diacritics(name), []).append(name)
+        self._by_key = MappingProxyType(by_key)
+        self._by_plain = MappingProxyType({key: tuple(group) for key, group in by_plain.items()})
+        # (khóa, thứ hạng) đã sắp xếp để tìm tiền tố bằng bisect; khóa có dấu ở dạng NFD
+        # để "Nguyê" (ê) vẫn là tiền tố của "Nguyễn" (ễ = e + dấu mũ + dấu ngã)
+        self._keys = tuple(sorted((unicodedata.normalize("NFD", fold_name(name)), rank)
+                                  for rank, name in enumerate(self.names)))
+        self._plain_keys = tuple(sorted((strip_diacritics(name), rank) for rank, name in enumerate(self.names)))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return isinstance(name, str) and fold_name(name) in self._by_key
+
+    def canonical(self, name):
+        """Cách viết chuẩn của tên ('NGUYỄN' → 'Nguyễn'), None nếu không có"""
+        return self._by_key.get(fold_name(name))
+
+    def without_diacritics(self, name):
+        """Các tên có dấu cùng dạng không dấu với name ('Nguyen' → ('Nguyễn',))"""
+        return self._by_plain.get(strip_diacritics(name), ())
+
+    def prefix(self, partial, limit=10):
+        """Các tên bắt đầu bằng partial; partial không dấu thì so khớp cả tên có dấu"""
+        key = unicodedata.normalize("NFD", fold_name(partial))
+        plain = strip_diacritics(partial)
+        keys, key = (self._plain_keys, plain) if plain == key else (self._keys, key)
+
+        ranks = []
+        for entry_key, rank in keys[bisect.bisect_left(keys, (key,)):]:
+            if not entry_key.startswith(key):
+                break
+            ranks.append(rank)
+        return [self.names[rank] for rank in sorted(ranks)[:limit]]
+
+@lru_cache(maxsize=None)
+def get_name_index(kind):
+    """
+    Chỉ mục tên dựng một lần khi dùng lần đầu
+
+    Args:
+        kind: "surname", "middle_name" hoặc "first_name"
+    """
+    if kind == "surname":
+        return NameIndex(VIETNAMESE_NAMES_DATABASE["surnames"])
+    if kind == "middle_name":
+        return NameIndex(VIETNAMESE_NAMES_DATABASE["middle_names"])
+    if kind == "first_name":
+        first_names = VIETNAMESE_NAMES_DATABASE["first_names"]
+        return NameIndex(first_names["male"] + first_names["female"] + first_names["unisex"])
+    raise ValueError(f"Loại tên không hợp lệ: {kind}")
+
 def get_all_surnames():
     """Lấy tất cả họ trong database"""
     return VIETNAMESE_NAMES_DATABASE["surnames"]
@@ -353,24 +498,24 @@ def get_all_middle_names():
     return VIETNAMESE_NAMES_DATABASE["middle_names"]
 
 def get_all_first_names():
-    """Lấy tất cả tên riêng trong database"""
-    all_names = []
-    all_names.extend(VIETNAMESE_NAMES_DATABASE["first_names"]["male"])
-    all_names.extend(VIETNAMESE_NAMES_DATABASE["first_names"]["female"])
-    all_names.extend(VIETNAMESE_NAMES_DATABASE["first_names"]["unisex"])
-    return list(set(all_names))  # Loại bỏ trùng lặp
+    """Lấy tất cả tên riêng trong database (đã loại trùng)"""
+    return list(get_name_index("first_name").names)
 
 def is_valid_vietnamese_surname(name):
-    """Kiểm tra có phải họ Việt Nam hợp lệ không"""
-    return name in VIETNAMESE_NAMES_DATABASE["surnames"]
+    """Kiểm tra có phải họ Việt Nam hợp lệ không (không phân biệt hoa thường)"""
+    return name in get_name_index("surname")
 
 def is_valid_vietnamese_name(name):
-    """Kiểm tra có phải tên Việt Nam hợp lệ không"""
-    all_names = get_all_first_names()
-    return name in all_names
+    """Kiểm tra có phải tên Việt Nam hợp lệ không (không phân biệt hoa thường)"""
+    return name in get_name_index("first_name")
 
-def suggest_name_correction(name):
-    """Gợi ý sửa tên dựa trên OCR corrections - Phiên bản nâng cao"""
+def suggest_name_correction(name, kind=None):
+    """
+    Gợi ý sửa tên dựa trên OCR corrections - Phiên bản nâng cao
+
+    Không có trong OCR_NAME_CORRECTIONS thì tìm tên gần đúng trong database
+    (kind: "surname", "middle_name", "first_name" hoặc None - tất cả)
+    """
     if not name or name.strip() == "":
         return name
 
@@ -393,10 +538,20 @@ def suggest_name_correction(name):
     if title_name in OCR_NAME_CORRECTIONS:
         return OCR_NAME_CORRECTIONS[title_name]
 
+    if NAME_FUZZY_ENABLED:
+        # Import lười: name_corrector import config
+        from name_corrector import correct_name_word
+        return correct_name_word(original_name, kind)
+
     return original_name  # Không tìm thấy correction
 
-def fix_vietnamese_name_advanced(full_name):
-    """Sửa tên tiếng Việt nâng cao - xử lý cả họ tên đầy đủ"""
+def fix_vietnamese_name_advanced(full_name, role=None):
+    """
+    Sửa tên tiếng Việt nâng cao - xử lý cả họ tên đầy đủ
+
+    Args:
+        role: "ho" (từ đầu là họ), "ten" (tên riêng) hoặc None - chọn danh sách tên khi sửa gần đúng
+    """
     if not full_name or full_name.strip() == "":
         return full_name
 
@@ -404,9 +559,15 @@ def fix_vietnamese_name_advanced(full_name):
     name_parts = full_name.strip().split()
     corrected_parts = []
 
-    for part in name_parts:
+    for index, part in enumerate(name_parts):
         # Áp dụng correction cho từng phần
-        corrected_part = suggest_name_correction(part)
+        if role == "ho":
+            kind = "surname" if index == 0 else None  # tên đệm có thể trùng tên riêng (VD "Yến")
+        elif role == "ten":
+            kind = "first_name"
+        else:
+            kind = None
+        corrected_part = suggest_name_correction(part, kind)
         corrected_parts.append(corrected_part)
 
     return " ".join(corrected_parts)
@@ -429,22 +590,16 @@ def validate_vietnamese_name_structure(ho, ten):
     return len(errors) == 0, errors
 
 def get_name_suggestions(partial_name, name_type="all"):
-    """Lấy gợi ý tên dựa trên phần tên đã nhập"""
+    """Lấy gợi ý tên dựa trên phần tên đã nhập (gõ không dấu vẫn gợi ý được tên có dấu)"""
     suggestions = []
-    partial_lower = partial_name.lower()
 
     if name_type in ["all", "surname"]:
         # Tìm trong họ
-        for surname in VIETNAMESE_NAMES_DATABASE["surnames"]:
-            if surname.lower().startswith(partial_lower):
-                suggestions.append(surname)
+        suggestions.extend(get_name_index("surname").prefix(partial_name))
 
     if name_type in ["all", "first_name"]:
         # Tìm trong tên riêng
-        all_first_names = get_all_first_names()
-        for name in all_first_names:
-            if name.lower().startswith(partial_lower):
-                suggestions.append(name)
+        suggestions.extend(get_name_index("first_name").prefix(partial_name))
 
     return suggestions[:10]  # Trả về tối đa 10 gợi ý
 
@@ -1,17 +1,185 @@
 # data_validator.py - Validation và làm sạch dữ liệu
 
 import re
+import numpy as np
 import pandas as pd
 from config import *
 
+def build_translation(corrections):
+    """
+    Bảng str.maketrans tương đương áp dụng lần lượt corrections (khóa một ký tự) bằng str.replace
+
+    Mỗi ký tự được thay độc lập nên giá trị của một khóa là kết quả áp dụng lần lượt toàn bộ
+    corrections lên chính khóa đó. Các khóa nhiều ký tự được trả về riêng để thay bằng replace.
+    """
+    table = {}
+    multi_char = {}
+    for wrong, correct in corrections.items():
+        if len(wrong) == 1:
+            value = wrong
+            for w, c in corrections.items():
+                value = value.replace(w, c)
+            table[wrong] = value
+        else:
+            multi_char[wrong] = correct
+    return str.maketrans(table), multi_char
+
+# Biên dịch một lần khi import - mỗi ô chỉ còn một lượt translate / sub ở tầng C
+NUMBER_TRANSLATION, NUMBER_MULTI_CHAR = build_translation(OCR_NUMBER_CORRECTIONS)
+NON_DIGIT_RE = re.compile(r'[^\d]')
+NON_SCORE_CHAR_RE = re.compile(r'[^\d\.]')
+DIGITS_RE = re.compile(r'\d+')
+WHITESPACE_RE = re.compile(r'\s')
+MSV_PREFIX_KEEP_RE = re.compile(r'1[567]')
+
+def as_text(series):
+    """Mỗi ô thành chuỗi giống str(value) của bản từng dòng (None → 'None'; astype(str) của pandas mới giữ NaN)"""
+    return series.astype(object).map(str).astype(str)
+
+def translate_numbers(text):
+    """Áp dụng OCR_NUMBER_CORRECTIONS cho một chuỗi"""
+    text = text.translate(NUMBER_TRANSLATION)
+    for wrong, correct in NUMBER_MULTI_CHAR.items():
+        text = text.replace(wrong, correct)
+    return text
+
 class DataValidator:
     """Class xử lý validation và làm sạch dữ liệu"""
+
+    SCORE_COLUMNS = ['CC', 'KT1', 'KT2', 'KDT']
+    LOGGED_CORRECTIONS = 20  # bản vectorized chỉ in chừng này dòng sửa, phần còn lại gộp một dòng
     
     def __init__(self):
         self.corrections_applied = []
     
     def validate_and_clean_dataframe(self, df):
-        """Kiểm tra và làm sạch DataFrame"""
+        """
+        Kiểm tra và làm sạch DataFrame (vectorized theo cột)
+
+        Kết quả và danh sách sửa đổi giống hệt validate_and_clean_dataframe_rows
+        nhưng xử lý cả cột bằng Series.str / pd.to_numeric thay vì từng ô.
+        """
+        if df.empty:
+            return df
+
+        print("🔍 Đang validation và làm sạch dữ liệu...")
+        self.corrections_applied = []
+        changes = []  # (cột thứ mấy trong một dòng, Series nhãn sửa đổi) - sắp lại theo thứ tự dòng
+
+        df['STT'] = self._validate_stt_series(df['STT'])
+
+        for order, (col, field, cleaner) in enumerate([
+            ('MSV', 'MSV', self._validate_msv_series),
+            ('Lớp', 'Lớp', self._validate_class_series),
+            ('Họ và đệm', 'Họ', self._validate_ho_series),
+            ('Tên', 'Tên', self._validate_ten_series),
+        ] + [(col, col, self._validate_score_series) for col in self.SCORE_COLUMNS if col in df.columns]):
+            original = as_text(df[col]).str.strip()
+            cleaned = self._clean_unique(original, cleaner)
+            changed = cleaned != original
+            if changed.any():
+                labels = [f"{field} hàng {idx}: {before} → {after}" for idx, before, after in
+                          zip(df.index[changed], original[changed], cleaned[changed])]
+                changes.append((order, np.flatnonzero(changed.to_numpy()), labels))
+            df[col] = cleaned
+
+        # Cùng thứ tự với bản từng dòng: theo dòng, trong một dòng theo thứ tự cột
+        records = [(position, order, label) for order, positions, labels in changes
+                   for position, label in zip(positions, labels)]
+        records.sort(key=lambda record: (record[0], record[1]))
+        self.corrections_applied = [label for _, _, label in records]
+        for correction in self.corrections_applied[:self.LOGGED_CORRECTIONS]:
+            print(f"  ✏️ {correction}")
+        if len(self.corrections_applied) > self.LOGGED_CORRECTIONS:
+            print(f"  ✏️ ... và {len(self.corrections_applied) - self.LOGGED_CORRECTIONS} sửa đổi khác")
+
+        print(f"✅ Hoàn thành validation. Đã sửa {len(self.corrections_applied)} lỗi.")
+        return df
+
+    @staticmethod
+    def _clean_unique(series, cleaner):
+        """
+        Gọi cleaner trên các giá trị khác nhau rồi ánh xạ lại cả cột
+
+        Lớp, điểm, họ/tên lặp lại rất nhiều nên chỉ xử lý vài trăm giá trị thay vì mọi dòng;
+        cột gần như không lặp (MSV) thì xử lý trực tiếp.
+        """
+        unique = series.unique()
+        if len(unique) * 2 > len(series):
+            return cleaner(series)
+        cleaned = cleaner(pd.Series(unique, dtype=series.dtype))
+        return series.map(dict(zip(unique, cleaned))).astype(series.dtype)
+
+    def _translate_numbers(self, series):
+        """Áp dụng OCR_NUMBER_CORRECTIONS cho cả cột"""
+        series = series.str.translate(NUMBER_TRANSLATION)
+        for wrong, correct in NUMBER_MULTI_CHAR.items():
+            series = series.str.replace(wrong, correct, regex=False)
+        return series
+
+    @staticmethod
+    def _validate_stt_series(stt):
+        """Bản vectorized của _validate_stt"""
+        stt_str = as_text(stt).str.strip()
+        value = pd.to_numeric(stt_str.where(stt_str.str.isdigit()), errors='coerce')
+        valid = value.between(1, 100)
+        return stt_str.where(valid, pd.Series(stt.index + 1, index=stt.index).astype(str))
+
+    def _validate_msv_series(self, msv):
+        """Bản vectorized của _validate_msv"""
+        digits = self._translate_numbers(msv).str.replace(NON_DIGIT_RE, '', regex=True)
+
+        # Sai đầu mã: giữ nguyên nếu dạng 15/16/17..., còn lại thay 2 số đầu bằng 17
+        keep_prefix = digits.str[:2].isin(VALID_MSV_PREFIXES) | digits.str.match(MSV_PREFIX_KEEP_RE)
+        replace_prefix = (digits.str.len() >= MIN_MSV_LENGTH) & ~keep_prefix
+        digits = digits.where(~replace_prefix, '17' + digits.str[2:])
+
+        return digits.str.zfill(MAX_MSV_LENGTH).str[:MAX_MSV_LENGTH]
+
+    @staticmethod
+    def _validate_class_series(class_name):
+        """Bản vectorized của _validate_class"""
+        class_name = class_name.str.upper().str.strip()
+        for wrong, correct in OCR_CLASS_CORRECTIONS.items():
+            class_name = class_name.str.replace(wrong, correct, regex=False)
+        for wrong, correct in (('l7', '17'), ('I7', '17'), ('1?', '17'), ('l5', '15'), ('I5', '15'), ('O', '0')):
+            class_name = class_name.str.replace(wrong, correct, regex=False)
+
+        numbers = class_name.str.findall(DIGITS_RE)
+        count = numbers.str.len()
+        # Không dòng nào có đủ nhóm số → .str[i] toàn NaN kiểu float, phải đưa về chuỗi trước khi dùng .str
+        year = numbers.str[0].fillna('').astype(str)
+        year = year.where(year.isin(VALID_MSV_PREFIXES), '17')
+        class_num = numbers.str[1].fillna('').astype(str)
+        class_value = pd.to_numeric(class_num, errors='coerce')
+        class_num = class_num.str.zfill(2).where(class_value.between(1, 10), '02')
+
+        result = pd.Series(DEFAULT_CLASS, index=class_name.index, dtype=class_name.dtype)
+        result = result.where(count < 1, "CNTT " + year + "-02")
+        return result.where(count < 2, "CNTT " + year + "-" + class_num)
+
+    def _validate_ho_series(self, names):
+        """Bản theo cột của _validate_vietnamese_name cho họ + tên đệm (sửa tên từng từ nên vẫn gọi từng giá trị)"""
+        return names.map(lambda name: self._validate_vietnamese_name(name, role="ho"))
+
+    def _validate_ten_series(self, names):
+        """Bản theo cột của _validate_vietnamese_name cho tên riêng"""
+        return names.map(lambda name: self._validate_vietnamese_name(name, role="ten"))
+
+    def _validate_score_series(self, score):
+        """Bản vectorized của _validate_score"""
+        corrected = self._translate_numbers(score).str.replace(NON_SCORE_CHAR_RE, '', regex=True)
+
+        # Chỉ giữ dấu chấm đầu tiên
+        parts = corrected.str.partition('.')
+        corrected = parts[0] + parts[1] + parts[2].str.replace('.', '', regex=False)
+
+        value = pd.to_numeric(corrected, errors='coerce')
+        valid = value.between(*VALID_SCORE_RANGE)
+        return value.map("{:.1f}".format).where(valid, DEFAULT_SCORE)
+
+    def validate_and_clean_dataframe_rows(self, df):
+        """Kiểm tra và làm sạch DataFrame từng dòng (bản gốc, dùng để đối chiếu / benchmark)"""
         if df.empty:
             return df
             
@@ -39,8 +207,8 @@ class DataValidator:
             # Validate Names
             original_ho = str(row['Họ và đệm']).strip()
             original_ten = str(row['Tên']).strip()
-            cleaned_ho = self._validate_vietnamese_name(original_ho)
-            cleaned_ten = self._validate_vietnamese_name(original_ten)
+            cleaned_ho = self._validate_vietnamese_name(original_ho, role="ho")
+            cleaned_ten = self._validate_vietnamese_name(original_ten, role="ten")
 
             if cleaned_ho != original_ho:
                 self._log_correction(f"Họ hàng {idx}", original_ho, cleaned_ho)
@@ -51,7 +219,7 @@ class DataValidator:
             df.at[idx, 'Tên'] = cleaned_ten
             
             # Validate Scores
-            for col in ['CC', 'KT1', 'KT2', 'KDT']:
+            for col in self.SCORE_COLUMNS:
                 if col in df.columns:  # Kiểm tra cột có tồn tại không
                     original_score = str(row[col]).strip()
                     cleaned_score = self._validate_score(original_score)
@@ -71,13 +239,8 @@ class DataValidator:
     
     def _validate_msv(self, msv):
         """Validate mã số sinh viên"""
-        # Apply OCR corrections
-        corrected_msv = msv
-        for wrong, correct in OCR_NUMBER_CORRECTIONS.items():
-            corrected_msv = corrected_msv.replace(wrong, correct)
-        
-        # Remove non-digits
-        digits_only = re.sub(r'[^\d]', '', corrected_msv)
+        # Apply OCR corrections + remove non-digits
+        digits_only = NON_DIGIT_RE.sub('', translate_numbers(msv))
         
         # Check MSV pattern
         if len(digits_only) >= MIN_MSV_LENGTH:
@@ -114,7 +277,7 @@ class DataValidator:
         class_name = class_name.replace('l5', '15').replace('I5', '15').replace('O', '0')
         
         # Extract numbers
-        numbers = re.findall(r'\d+', class_name)
+        numbers = DIGITS_RE.findall(class_name)
         
         if len(numbers) >= 2:
             year = numbers[0]
@@ -140,8 +303,8 @@ class DataValidator:
         
         return DEFAULT_CLASS
     
-    def _validate_vietnamese_name(self, name):
-        """Validate tên tiếng Việt - Phiên bản nâng cao"""
+    def _validate_vietnamese_name(self, name, role=None):
+        """Validate tên tiếng Việt - Phiên bản nâng cao (role: "ho" / "ten" / None)"""
         if not name or name.strip() == "":
             return ""
 
@@ -149,20 +312,15 @@ class DataValidator:
         from config import fix_vietnamese_name_advanced, suggest_name_correction
 
         # Sử dụng hàm sửa lỗi nâng cao
-        corrected_name = fix_vietnamese_name_advanced(name)
+        corrected_name = fix_vietnamese_name_advanced(name, role)
 
         # Đảm bảo format đúng (Title Case)
         return corrected_name.title() if corrected_name else ""
     
     def _validate_score(self, score):
         """Validate điểm số"""
-        # Apply OCR corrections for numbers
-        corrected_score = score
-        for wrong, correct in OCR_NUMBER_CORRECTIONS.items():
-            corrected_score = corrected_score.replace(wrong, correct)
-        
-        # Keep only digits and dots
-        corrected_score = re.sub(r'[^\d\.]', '', corrected_score)
+        # Apply OCR corrections for numbers, keep only digits and dots
+        corrected_score = NON_SCORE_CHAR_RE.sub('', translate_numbers(score))
         
         # Ensure only one decimal point
         parts = corrected_score.split('.')
@@ -178,6 +336,75 @@ class DataValidator:
         
         return DEFAULT_SCORE
     
+    def row_issues(self, row):
+        """
+        Các lỗi của một dòng chưa làm sạch (dict / Series tên cột → giá trị)
+
+        Returns:
+            List[str]: Tên cột bị lỗi (MSV sai định dạng, điểm ngoài khoảng, thiếu tên, STT không phải số)
+        """
+        issues = []
+        if 'STT' in row:
+            stt = str(row['STT']).strip()
+            if not stt.isdigit():
+                issues.append('STT')
+
+        if 'MSV' in row:
+            msv = WHITESPACE_RE.sub('', str(row['MSV']))
+            if not (msv.isdigit() and MIN_MSV_LENGTH <= len(msv) <= MAX_MSV_LENGTH
+                    and msv[:2] in VALID_MSV_PREFIXES):
+                issues.append('MSV')
+
+        if 'Tên' in row and not str(row['Tên']).strip():
+            issues.append('Tên')
+
+        for col in self.SCORE_COLUMNS:
+            if col not in row:
+                continue
+            score = str(row[col]).strip()
+            if not score:
+                continue  # ô điểm trống là hợp lệ (chưa có điểm)
+            try:
+                if not VALID_SCORE_RANGE[0] <= float(score) <= VALID_SCORE_RANGE[1]:
+                    issues.append(col)
+            except ValueError:
+                issues.append(col)
+        return issues
+
+    def find_suspect_rows(self, df):
+        """
+        Tìm các dòng nghi bị đọc sai trong DataFrame CHƯA làm sạch
+
+        Gồm dòng có lỗi (row_issues) và chỗ STT bị nhảy / trùng (thiếu dòng).
+
+        Returns:
+            List[dict]: {"index": vị trí dòng, "stt": STT, "issues": [...], "missing": [STT bị thiếu trước dòng này]}
+        """
+        suspects = []
+        previous_stt = None
+        for position, (_, row) in enumerate(df.iterrows()):
+            issues = self.row_issues(row)
+            missing = []
+
+            stt = str(row['STT']).strip() if 'STT' in df.columns else ""
+            if stt.isdigit():
+                current = int(stt)
+                if previous_stt is not None:
+                    if current <= previous_stt:
+                        issues.append('STT trùng/lùi')
+                    elif current > previous_stt + 1:
+                        missing = [str(n) for n in range(previous_stt + 1, current)]
+                        issues.append(f"thiếu STT {missing[0]}" + (f"-{missing[-1]}" if len(missing) > 1 else ""))
+                previous_stt = current
+
+            if issues:
+                suspects.append({"index": position, "stt": stt, "issues": issues, "missing": missing})
+
+        if suspects:
+            print(f"🔎 {len(suspects)} dòng nghi sai: " +
+                  ", ".join(f"STT {s['stt'] or '?'} ({', '.join(s['issues'])})" for s in suspects[:10]))
+        return suspects
+
     def _log_correction(self, field, original, corrected):
         """Ghi log các sửa đổi"""
         correction = f"{field}: {original} → {corrected}"
@@ -218,10 +218,31 @@ class DatabaseManager:
             )
             """
             
+            # Cột số liệu trích xuất (thêm vào bảng OCR_Sessions cũ nếu thiếu)
+            add_session_metrics_columns = """
+            IF COL_LENGTH('OCR_Sessions', 'DurationMs') IS NULL
+            ALTER TABLE OCR_Sessions ADD
+                DurationMs INT,
+                BytesSent INT,
+                ApiCalls INT,
+                PromptTokens INT,
+                ResponseTokens INT,
+                FromCache BIT,
+                Corrections INT
+            """
+
+            # Bảng đã có cột số liệu nhưng chưa có Corrections
+            add_session_corrections_column = """
+            IF COL_LENGTH('OCR_Sessions', 'Corrections') IS NULL
+            ALTER TABLE OCR_Sessions ADD Corrections INT
+            """
+
             # Thực thi các câu lệnh tạo bảng
             cursor.execute(create_students_table)
             cursor.execute(create_grades_table)
             cursor.execute(create_sessions_table)
+            cursor.execute(add_session_metrics_columns)
+            cursor.execute(add_session_corrections_column)
             
             self.connection.commit()
             self.logger.info("Đã tạo tất cả bảng thành công")
@@ -235,6 +256,63 @@ class DatabaseManager:
         finally:
             self.disconnect()
     
+    def insert_ocr_sessions(self, metrics_list: List) -> Tuple[bool, str, int]:
+        """
+        Ghi số liệu các lần trích xuất vào OCR_Sessions (executemany, một transaction)
+
+        Args:
+            metrics_list: List ExtractionMetrics
+
+        Returns:
+            Tuple[bool, str, int]: (success, message, inserted_count)
+        """
+        if not metrics_list:
+            return True, "Không có số liệu để ghi", 0
+        if not self.connect():
+            return False, "Không thể kết nối đến database", 0
+
+        try:
+            cursor = self.connection.cursor()
+            cursor.fast_executemany = True
+            rows = [
+                (
+                    f"{m.template} ({m.backend})"[:200],
+                    m.image_path[:500],
+                    m.started_at,
+                    m.rows,
+                    m.rows if m.success else 0,
+                    0 if m.success else 1,  # ErrorCount: lần trích xuất lỗi
+                    m.corrections or 0,
+                    m.notes(),
+                    int(m.duration * 1000),
+                    m.bytes_sent,
+                    m.api_calls,
+                    m.prompt_tokens,
+                    m.response_tokens,
+                    1 if m.from_cache else 0
+                )
+                for m in metrics_list
+            ]
+            cursor.executemany("""
+                INSERT INTO OCR_Sessions (SessionName, ImagePath, ProcessedDate, TotalStudents, SuccessCount,
+                                          ErrorCount, Corrections, Notes, DurationMs, BytesSent, ApiCalls,
+                                          PromptTokens, ResponseTokens, FromCache)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            self.connection.commit()
+
+            message = f"Đã ghi {len(rows)} phiên OCR"
+            self.logger.info(message)
+            return True, message, len(rows)
+
+        except pyodbc.Error as e:
+            self.connection.rollback()
+            error_msg = f"Lỗi ghi OCR_Sessions: {str(e)}"
+            self.logger.error(error_msg)
+            return False, error_msg, 0
+        finally:
+            self.disconnect()
+
     def insert_student(self, msv: str, ho: str, ten: str, lop: str = None) -> Tuple[bool, str]:
         """
         Thêm sinh viên mới
@@ -278,6 +356,41 @@ class DatabaseManager:
         finally:
             self.disconnect()
     
+    @staticmethod
+    def _to_float(value) -> Optional[float]:
+        """Chuyển giá trị điểm sang float (None nếu trống / không hợp lệ)"""
+        if value is None or str(value).strip() == '':
+            return None
+        try:
+            return float(str(value).replace(',', '.'))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def dataframe_to_grades(df: pd.DataFrame) -> List[Dict]:
+        """
+        Chuyển DataFrame kết quả trích xuất sang dữ liệu cho insert_grades_dynamic
+
+        Args:
+            df: DataFrame với các cột MSV, Họ và đệm, Tên, Lớp và các cột điểm
+
+        Returns:
+            List[Dict]: Mỗi dict là một sinh viên, chỉ chứa các cột điểm có trong df
+        """
+        score_columns = [col for col in ['CC', 'KT1', 'KT2', 'KDT'] if col in df.columns]
+        grades_data = []
+        for _, row in df.iterrows():
+            grade_dict = {
+                'MSV': str(row.get('MSV', '')),
+                'Họ và đệm': str(row.get('Họ và đệm', '')),
+                'Tên': str(row.get('Tên', '')),
+                'Lớp': str(row.get('Lớp', ''))
+            }
+            for col in score_columns:
+                grade_dict[col] = DatabaseManager._to_float(row.get(col))
+            grades_data.append(grade_dict)
+        return grades_data
+
     def insert_grades_dynamic(self, grades_data: List[Dict]) -> Tuple[bool, str, int]:
         """
         Thêm điểm số với cấu trúc động - chỉ lưu các cột có dữ liệu
@@ -0,0 +1,148 @@
+# extraction_metrics.py - Số liệu thời gian / dung lượng / token cho mỗi lần trích xuất
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+class ExtractionMetrics:
+    """
+    Số liệu của một lần trích xuất ảnh
+
+    - Thời gian từng bước (đọc ảnh, chuẩn hóa, gọi API, parse...) - cộng dồn nếu một bước chạy nhiều lần (VD các dải)
+    - Dung lượng ảnh đọc vào / gửi lên, số lần gọi API
+    - Token prompt / response (usage_metadata của Gemini)
+    - Số dòng, số lỗi được DataValidator sửa
+    """
+
+    def __init__(self, image_path, backend="", template=""):
+        self.image_path = str(image_path)
+        self.backend = backend
+        self.template = template
+        self.started_at = datetime.now()
+        self.stages = {}
+        self.bytes_read = 0
+        self.bytes_sent = 0
+        self.api_calls = 0
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        self.total_tokens = 0
+        self.rows = 0
+        self.corrections = None
+        self.from_cache = False
+        self.engine = ""
+        self.success = False
+        self.error = None
+        self.duration = 0.0
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()  # các dải ảnh ghi số liệu từ nhiều thread
+
+    @contextmanager
+    def stage(self, name):
+        """Đo thời gian một bước: with metrics.stage('api'): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def add_stage(self, name, seconds):
+        """Cộng thời gian vào một bước đã đo bằng cách khác"""
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def split_wait(self, stage, waited):
+        """Tách thời gian chờ rate limiter ra khỏi bước stage thành bước 'rate_limit'"""
+        if waited > 0:
+            self.add_stage(stage, -waited)
+            self.add_stage("rate_limit", waited)
+
+    def add_upload(self, size):
+        """Ghi nhận một lần gọi API gửi ảnh size bytes"""
+        with self._lock:
+            self.api_calls += 1
+            self.bytes_sent += size or 0
+
+    def add_usage(self, usage_metadata):
+        """Cộng token từ usage_metadata (bỏ qua nếu backend không trả về)"""
+        if usage_metadata is None:
+            return
+        with self._lock:
+            self.prompt_tokens += getattr(usage_metadata, "prompt_token_count", 0) or 0
+            self.response_tokens += getattr(usage_metadata, "candidates_token_count", 0) or 0
+            self.total_tokens += getattr(usage_metadata, "total_token_count", 0) or 0
+
+    def finish(self, success, rows=0, error=None):
+        """Kết thúc đo"""
+        self.duration = time.perf_counter() - self._start
+        self.success = success
+        self.rows = rows
+        self.error = str(error)[:300] if error else None
+
+    def to_dict(self):
+        """Số liệu dạng dict phẳng (thời gian tính bằng giây)"""
+        record = {
+            "image_path": self.image_path,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "backend": self.backend,
+            "engine": self.engine,
+            "template": self.template,
+            "success": self.success,
+            "from_cache": self.from_cache,
+            "duration": round(self.duration, 4),
+            "bytes_read": self.bytes_read,
+            "bytes_sent": self.bytes_sent,
+            "api_calls": self.api_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "response_tokens": self.response_tokens,
+            "total_tokens": self.total_tokens,
+            "rows": self.rows,
+            "corrections": self.corrections,
+            "error": self.error
+        }
+        for name, seconds in self.stages.items():
+            record[f"stage_{name}"] = round(seconds, 4)
+        return record
+
+    def notes(self, limit=1000):
+        """Chi tiết dạng JSON cho cột Notes của OCR_Sessions"""
+        detail = {
+            "backend": self.backend,
+            "engine": self.engine,
+            "template": self.template,
+            "cache": self.from_cache,
+            "api_calls": self.api_calls,
+            "stages": {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            "error": self.error
+        }
+        return json.dumps(detail, ensure_ascii=False)[:limit]
+
+def summarize_metrics(records):
+    """Tổng hợp danh sách số liệu (dict từ to_dict): tổng thời gian từng bước, bytes, token"""
+    summary = {
+        "extractions": len(records),
+        "succeeded": sum(1 for r in records if r["success"]),
+        "from_cache": sum(1 for r in records if r["from_cache"]),
+        "duration": 0.0,
+        "bytes_sent": 0,
+        "api_calls": 0,
+        "prompt_tokens": 0,
+        "response_tokens": 0,
+        "rows": 0,
+        "corrections": 0,
+        "stages": {}
+    }
+    for record in records:
+        for key in ("duration", "bytes_sent", "api_calls", "prompt_tokens", "response_tokens", "rows"):
+            summary[key] += record[key] or 0
+        summary["corrections"] += record["corrections"] or 0
+        for key, value in record.items():
+            if key.startswith("stage_"):
+                stage = key[len("stage_"):]
+                summary["stages"][stage] = summary["stages"].get(stage, 0.0) + value
+    summary["duration"] = round(summary["duration"], 3)
+    summary["stages"] = {name: round(seconds, 3) for name, seconds in summary["stages"].items()}
+    return summary
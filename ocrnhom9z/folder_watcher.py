@@ -0,0 +1,187 @@
+# folder_watcher.py - Theo dõi thư mục (hot folder) và báo khi có ảnh mới đã ghi xong
+
+import os
+import threading
+import time
+from config import *
+
+# Dấu kết thúc file: thiếu → file còn đang được ghi (hoặc hỏng)
+END_MARKERS = {
+    ('.jpg', '.jpeg'): b'\xff\xd9',
+    ('.png',): b'IEND',
+    ('.pdf',): b'%%EOF'
+}
+
+def looks_complete(path, tail_size=1024):
+    """Kiểm tra nhanh file đã ghi xong chưa dựa trên dấu kết thúc (chỉ đọc phần cuối file)"""
+    lower = path.lower()
+    for extensions, marker in END_MARKERS.items():
+        if lower.endswith(extensions):
+            with open(path, 'rb') as f:
+                f.seek(max(0, os.path.getsize(path) - tail_size))
+                return marker in f.read()
+    return True
+
+class FolderWatcher:
+    """
+    Theo dõi thư mục, gọi on_file_ready(path) cho mỗi file ảnh/PDF mới hoặc vừa thay đổi
+
+    - Dùng watchdog (inotify trên Linux, ReadDirectoryChangesW trên Windows) nếu đã cài,
+      không thì quét thư mục định kỳ
+    - Debounce: chỉ báo khi kích thước + thời gian sửa không đổi trong settle_seconds
+      và file có dấu kết thúc hợp lệ (tránh đọc file đang copy / upload dở)
+    - File đã có sẵn trong thư mục khi khởi động cũng được báo (job store sẽ bỏ qua file đã xử lý)
+    """
+
+    def __init__(self, folder, on_file_ready, recursive=False, extensions=BATCH_FILE_EXTENSIONS,
+                 poll_interval=WATCH_POLL_INTERVAL, settle_seconds=WATCH_SETTLE_SECONDS,
+                 use_native=WATCH_USE_NATIVE):
+        self.folder = os.path.abspath(folder)
+        self.on_file_ready = on_file_ready
+        self.recursive = recursive
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.use_native = use_native
+
+        self._pending = {}  # path → (size, mtime, thời điểm bắt đầu ổn định)
+        self._handed_off = {}  # path → (size, mtime) đã chuyển đi xử lý
+        self._first_seen = {}  # path → thời điểm phát hiện lần đầu
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._observer = None
+        self._thread = None
+
+    @property
+    def mode(self):
+        return "native" if self._observer else "polling"
+
+    def _is_candidate(self, path):
+        name = os.path.basename(path)
+        # Bỏ qua file tạm của trình copy / upload (~$x.jpg, .x.jpg.part...)
+        return not name.startswith(('.', '~')) and name.lower().endswith(self.extensions)
+
+    def notify(self, path):
+        """Ghi nhận file có thể mới / vừa thay đổi (gọi từ sự kiện hệ thống hoặc lần quét)"""
+        if not self._is_candidate(path):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        signature = (stat.st_size, stat.st_mtime)
+        with self._lock:
+            if self._handed_off.get(path) == signature:
+                return
+            now = time.monotonic()
+            self._first_seen.setdefault(path, now)
+            current = self._pending.get(path)
+            if current is None or current[:2] != signature:
+                self._pending[path] = signature + (now,)
+
+    def scan(self):
+        """Quét toàn bộ thư mục"""
+        if self.recursive:
+            for root, _, names in os.walk(self.folder):
+                for name in names:
+                    self.notify(os.path.join(root, name))
+        else:
+            for entry in os.scandir(self.folder):
+                if entry.is_file():
+                    self.notify(entry.path)
+
+    def _check_pending(self):
+        """Chuyển các file đã ổn định sang on_file_ready"""
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            for path, (size, mtime, since) in list(self._pending.items()):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    del self._pending[path]  # file bị xóa / đổi tên
+                    continue
+                if (stat.st_size, stat.st_mtime) != (size, mtime):
+                    self._pending[path] = (stat.st_size, stat.st_mtime, now)
+                elif size > 0 and now - since >= self.settle_seconds:
+                    del self._pending[path]
+                    self._handed_off[path] = (size, mtime)
+                    ready.append(path)
+
+        for path in sorted(ready):
+            try:
+                # Windows: file đang bị chương trình khác ghi sẽ không mở được
+                complete = looks_complete(path)
+            except OSError:
+                complete = False
+            if not complete and now - self._first_seen.get(path, now) < self.settle_seconds * 10:
+                # Chưa ghi xong - chờ thêm (quá lâu thì vẫn chuyển đi để báo lỗi file hỏng)
+                with self._lock:
+                    self._handed_off.pop(path, None)
+                    self._pending[path] = self._pending.get(path) or (-1, -1, now)
+                continue
+            with self._lock:
+                self._first_seen.pop(path, None)
+            self.on_file_ready(path)
+
+    def _start_native(self):
+        """Khởi động watchdog observer (None nếu chưa cài watchdog)"""
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            print("ℹ️ Chưa cài watchdog - chuyển sang quét thư mục định kỳ (pip install watchdog)")
+            return None
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.src_path)
+
+            def on_modified(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.src_path)
+
+            def on_moved(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.dest_path)
+
+        observer = Observer()
+        observer.schedule(Handler(), self.folder, recursive=self.recursive)
+        observer.start()
+        return observer
+
+    def _run(self):
+        last_scan = time.monotonic()
+        tick = min(0.5, self.settle_seconds / 2 or 0.5)
+        while not self._stop.wait(tick):
+            if not self._observer and time.monotonic() - last_scan >= self.poll_interval:
+                self.scan()
+                last_scan = time.monotonic()
+            self._check_pending()
+
+    def start(self):
+        """Bắt đầu theo dõi (chạy nền)"""
+        if not os.path.isdir(self.folder):
+            raise Exception(f"Thư mục không tồn tại: {self.folder}")
+        if self.use_native:
+            self._observer = self._start_native()
+        self.scan()
+        self._thread = threading.Thread(target=self._run, name="folder-watcher", daemon=True)
+        self._thread.start()
+        print(f"👀 Đang theo dõi {self.folder} ({self.mode})")
+
+    def stop(self):
+        """Dừng theo dõi"""
+        self._stop.set()
+        if self._observer:
+            self._observer.stop()
+            self._observer.join()
+        if self._thread:
+            self._thread.join()
+
+    def wait(self, timeout=None):
+        """Chờ tới khi stop() được gọi (hoặc hết timeout)"""
+        return self._stop.wait(timeout)
@@ -5,6 +5,7 @@ from tkinter import ttk, filedialog, messagebox, scrolledtext
 import os
 import threading
 import traceback
+import pandas as pd
 from PIL import Image, ImageTk
 from config import *
 from database_manager import DatabaseManager
@@ -23,6 +24,7 @@ class GradeExtractionGUI:
         self.extracted_data = None
         self.original_image = None
         self.db_manager = None
+        self.job_store = None
 
         # Biến lưu trữ dữ liệu từ nhiều ảnh
         self.all_extracted_data = []  # Danh sách các DataFrame từ nhiều ảnh
@@ -127,6 +129,12 @@ class GradeExtractionGUI:
         
         self.select_btn = ttk.Button(image_frame, text="📁 Chọn ảnh", command=self.select_image)
         self.select_btn.pack(side=tk.LEFT, padx=(0, 10))
+
+        self.batch_btn = ttk.Button(image_frame, text="📚 Xử lý hàng loạt", command=self.extract_batch)
+        self.batch_btn.pack(side=tk.LEFT, padx=(0, 10))
+
+        self.retry_btn = ttk.Button(image_frame, text="🔄 Thử lại ảnh lỗi", command=self.retry_failed_jobs)
+        self.retry_btn.pack(side=tk.LEFT, padx=(0, 10))
         
         self.image_label = ttk.Label(image_frame, text="Chưa chọn ảnh")
         self.image_label.pack(side=tk.LEFT, padx=(0, 20))
@@ -343,17 +351,33 @@ Nhập Gemini API Key và chọn ảnh bảng điểm để bắt đầu
         try:
             print(f"🔍 Bắt đầu trích xuất từ: {self.image_path}")
 
-            # Trích xuất dữ liệu
+            # Trích xuất dữ liệu - hiển thị tiến độ ngay khi từng dòng được sinh ra
+            received_rows = []
+
+            def on_row(row):
+                received_rows.append(row)
+                name = f"{row.get('Họ và đệm', '')} {row.get('Tên', '')}".strip() or row.get('MSV', '')
+                status = f"📥 Đã nhận {len(received_rows)} dòng... {name}"
+                self.root.after(0, lambda text=status: self.status_label.config(text=text))
+
             success, df, raw_response = self.ocr_processor.extract_data_from_image(
-                self.image_path
+                self.image_path, on_row=on_row
             )
 
             print(f"📊 Kết quả OCR: success={success}, rows={len(df) if not df.empty else 0}")
 
             if success and not df.empty:
+                if REEXTRACT_SUSPECT_ROWS:
+                    # Chỉ gọi lại cho các dòng nghi sai (vài request nhỏ thay vì cả bảng)
+                    self.root.after(0, lambda: self.status_label.config(text="🩹 Đang đọc lại các dòng nghi sai..."))
+                    df, _ = self.ocr_processor.reextract_suspect_rows(self.image_path, df,
+                                                                      validator=self.data_validator)
+
                 print("🔧 Bắt đầu validation dữ liệu...")
                 # Validate và làm sạch dữ liệu
                 cleaned_df = self.data_validator.validate_and_clean_dataframe(df)
+                self.ocr_processor.record_corrections(self.image_path,
+                                                      len(self.data_validator.get_corrections_summary()))
 
                 print(f"✅ Validation hoàn thành: {len(cleaned_df)} rows")
                 # Cập nhật UI
@@ -371,6 +395,101 @@ Nhập Gemini API Key và chọn ảnh bảng điểm để bắt đầu
             self.root.after(0, lambda: self._show_error(error_msg))
         finally:
             self.root.after(0, self._finish_processing)
+
+    def extract_batch(self):
+        """Chọn nhiều ảnh và trích xuất song song"""
+        if not hasattr(self.ocr_processor, 'api_key') or not self.ocr_processor.api_key:
+            messagebox.showwarning("Cảnh báo", "Vui lòng kiểm tra API Key trước")
+            return
+
+        file_paths = filedialog.askopenfilenames(
+            title="Chọn nhiều ảnh / PDF bảng điểm",
+            filetypes=SUPPORTED_BATCH_FORMATS
+        )
+        if not file_paths:
+            return
+
+        self.all_extracted_data = []
+        self.progress.start()
+        self.process_btn.config(state='disabled')
+        self.batch_btn.config(state='disabled')
+        self.retry_btn.config(state='disabled')
+        self.status_label.config(text=f"🔍 Đang xử lý hàng loạt {len(file_paths)} ảnh...")
+
+        thread = threading.Thread(target=self._extract_batch_thread, args=(list(file_paths),))
+        thread.daemon = True
+        thread.start()
+
+    def get_job_store(self):
+        """Job store mặc định (mở khi cần lần đầu)"""
+        if self.job_store is None:
+            from job_store import JobStore
+            self.job_store = JobStore()
+        return self.job_store
+
+    def retry_failed_jobs(self):
+        """Đặt lại các ảnh lỗi để lần xử lý hàng loạt tiếp theo gọi API lại"""
+        try:
+            count = self.get_job_store().reset_failed()
+        except Exception as e:
+            messagebox.showerror("Lỗi", f"❌ Không đặt lại được job lỗi: {str(e)}")
+            return
+        if count:
+            messagebox.showinfo("Thành công", f"✅ Đã đặt lại {count} ảnh lỗi - chọn lại ảnh để xử lý")
+        else:
+            messagebox.showinfo("Thông báo", "Không có ảnh lỗi nào cần thử lại")
+
+    def _extract_batch_thread(self, file_paths):
+        """Trích xuất hàng loạt trong thread riêng"""
+        errors = []
+        try:
+            # TIFF nhiều trang / PDF: mỗi trang là một job
+            from page_source import expand_pages
+            pages = list(expand_pages(file_paths))
+            total = len(pages)
+            # Job store: chạy lại cùng danh sách ảnh sẽ tiếp tục từ chỗ dừng
+            results = self.ocr_processor.extract_many(pages, ordered=False, job_store=self.get_job_store())
+            for done, (image_path, success, df, raw_response) in enumerate(results, start=1):
+                name = os.path.basename(str(image_path))
+                if success and not df.empty:
+                    cleaned_df = self.data_validator.validate_and_clean_dataframe(df)
+                    self.ocr_processor.record_corrections(image_path,
+                                                          len(self.data_validator.get_corrections_summary()))
+                    self.all_extracted_data.append(cleaned_df)
+                else:
+                    errors.append(f"{name}: {raw_response if not success else 'Không có dữ liệu'}")
+
+                status = f"🔍 Đã xử lý {done}/{total} ảnh ({name})"
+                self.root.after(0, lambda text=status: self.status_label.config(text=text))
+
+            if self.all_extracted_data:
+                merged_df = pd.concat(self.all_extracted_data, ignore_index=True)
+                if 'MSV' in merged_df.columns:
+                    merged_df = merged_df.drop_duplicates(subset=['MSV'], keep='first').reset_index(drop=True)
+                self.merged_data = merged_df
+                self.root.after(0, self._update_results, merged_df, "")
+            else:
+                self.root.after(0, lambda: self._show_error("Không trích xuất được dữ liệu từ ảnh nào"))
+
+            if errors:
+                print(f"⚠️ {len(errors)}/{total} ảnh lỗi:")
+                for error in errors:
+                    print(f"   - {error}")
+
+        except Exception as e:
+            error_msg = f"Lỗi xử lý hàng loạt: {str(e)}"
+            traceback.print_exc()
+            self.root.after(0, lambda: self._show_error(error_msg))
+        finally:
+            self.root.after(0, self._finish_batch_processing)
+
+    def _finish_batch_processing(self):
+        """Hoàn thành xử lý hàng loạt"""
+        self._finish_processing()
+        self.batch_btn.config(state='normal')
+        self.retry_btn.config(state='normal')
+        if not self.image_path:
+            self.process_btn.config(state='disabled')
             
     def _get_current_template_mode(self):
         """Lấy chế độ template hiện tại"""
@@ -670,40 +789,18 @@ Nhập Gemini API Key và chọn ảnh bảng điểm để bắt đầu
             self.status_label.config(text="Đang lưu vào database...")
 
             # Chuyển đổi dữ liệu sang format phù hợp
-            grades_data = []
-
-            # Debug: In ra tên cột để kiểm tra
-            print("=== DEBUG: Tên các cột trong dữ liệu ===")
             print("Columns:", list(self.extracted_data.columns))
-            print("Sample data:")
-            print(self.extracted_data.head())
-
-            # Kiểm tra cột nào có dữ liệu thực sự
-            available_columns = list(self.extracted_data.columns)
-            print(f"Các cột có sẵn: {available_columns}")
-
-            for _, row in self.extracted_data.iterrows():
-                grade_dict = {
-                    'MSV': str(row.get('MSV', '')),
-                    'Họ và đệm': str(row.get('Họ và đệm', '')),
-                    'Tên': str(row.get('Tên', '')),
-                    'Lớp': str(row.get('Lớp', ''))
-                }
-
-                # Chỉ thêm các cột điểm nếu có trong dữ liệu
-                score_columns = ['CC', 'KT1', 'KT2', 'KDT']
-                for col in score_columns:
-                    if col in available_columns:
-                        grade_dict[col] = self._convert_to_float(row.get(col))
-                        print(f"Thêm cột {col}: {grade_dict[col]}")
-                    else:
-                        print(f"Bỏ qua cột {col} - không có trong dữ liệu")
-
-                grades_data.append(grade_dict)
+            grades_data = DatabaseManager.dataframe_to_grades(self.extracted_data)
 
             # Lưu vào database với cấu trúc động
             success, message, count = db_manager.insert_grades_dynamic(grades_data)
 
+            # Ghi số liệu các lần trích xuất (thời gian, bytes, token) vào OCR_Sessions
+            if success:
+                metrics_ok, metrics_msg, _ = self.ocr_processor.save_metrics(db_manager)
+                if not metrics_ok:
+                    print(f"⚠️ {metrics_msg}")
+
             # Dừng progress
             self.progress.stop()
 
@@ -720,15 +817,6 @@ Nhập Gemini API Key và chọn ảnh bảng điểm để bắt đầu
             messagebox.showerror("Lỗi", error_msg)
             self.status_label.config(text="❌ Lỗi lưu database")
 
-    def _convert_to_float(self, value):
-        """Chuyển đổi giá trị sang float"""
-        if value is None or value == '' or str(value).strip() == '':
-            return None
-        try:
-            return float(str(value).replace(',', '.'))
-        except:
-            return None
-
 
 class DatabaseConnectionDialog:
     """Dialog đơn giản để nhập thông tin kết nối database"""
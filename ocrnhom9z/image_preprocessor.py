@@ -0,0 +1,103 @@
+# image_preprocessor.py - Chuẩn hóa ảnh trước khi gửi lên Gemini
+
+import io
+from PIL import Image, ImageOps
+from config import *
+from table_localizer import TableLocalizer
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp"
+}
+
+class ImageNormalizer:
+    """Class chuẩn hóa ảnh: xoay theo EXIF, cắt vùng bảng, giới hạn kích thước, chọn định dạng mã hóa"""
+
+    def __init__(self, max_side=IMAGE_MAX_SIDE, grayscale=IMAGE_GRAYSCALE,
+                 encoding=IMAGE_ENCODING, quality=IMAGE_JPEG_QUALITY, table_localizer=None):
+        encoding = encoding.upper()
+        if encoding not in MIME_TYPES:
+            raise ValueError(f"Định dạng mã hóa không hỗ trợ: {encoding}")
+
+        self.max_side = max_side
+        self.grayscale = grayscale
+        self.encoding = encoding
+        self.quality = quality
+        if table_localizer is None and AUTO_CROP_ENABLED:
+            table_localizer = TableLocalizer()
+        self.table_localizer = table_localizer or None
+
+    def describe(self):
+        """Chuỗi mô tả cấu hình (dùng làm một phần khóa cache)"""
+        description = f"{self.encoding}:{self.max_side}:{'L' if self.grayscale else 'RGB'}:{self.quality}"
+        if self.table_localizer:
+            description += ":" + self.table_localizer.describe()
+        return description
+
+    def crop_table(self, image):
+        """Cắt ảnh (đã xoay theo EXIF) về vùng bảng nếu bật auto-crop
+
+        Returns:
+            Tuple[PIL.Image, tuple | None]: (ảnh, khung đã cắt)
+        """
+        if not self.table_localizer:
+            return image, None
+        return self.table_localizer.crop(image)
+
+    def normalize_image(self, image, crop=True):
+        """Chuẩn hóa một PIL Image, trả về ảnh mới
+
+        Args:
+            crop: False khi ảnh đã được cắt sẵn (VD từng dải khi chia ảnh dài)
+        """
+        image = ImageOps.exif_transpose(image)
+        if crop:
+            image, _ = self.crop_table(image)
+
+        if self.grayscale:
+            image = image.convert('L')
+        elif image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        if self.max_side and max(image.size) > self.max_side:
+            image = image.copy()
+            image.thumbnail((self.max_side, self.max_side), Image.Resampling.LANCZOS)
+
+        return image
+
+    def encode_image(self, image):
+        """Mã hóa PIL Image thành blob {'mime_type', 'data'} cho Gemini"""
+        buffer = io.BytesIO()
+        save_kwargs = {}
+        if self.encoding in ("JPEG", "WEBP"):
+            save_kwargs["quality"] = self.quality
+        if self.encoding == "JPEG":
+            save_kwargs["optimize"] = True
+        image.save(buffer, format=self.encoding, **save_kwargs)
+        return {"mime_type": MIME_TYPES[self.encoding], "data": buffer.getvalue()}
+
+    def normalize(self, image_bytes):
+        """
+        Chuẩn hóa ảnh từ bytes gốc
+
+        Returns:
+            Tuple[dict, dict]: (blob ảnh đã mã hóa, thống kê kích thước)
+        """
+        with Image.open(io.BytesIO(image_bytes)) as original:
+            size_before = original.size
+            image = ImageOps.exif_transpose(original)
+            image, crop_box = self.crop_table(image)
+            image = self.normalize_image(image, crop=False)
+            blob = self.encode_image(image)
+
+        stats = {
+            "bytes_before": len(image_bytes),
+            "bytes_after": len(blob["data"]),
+            "size_before": size_before,
+            "size_after": image.size,
+            "crop_box": crop_box,
+            "encoding": self.encoding
+        }
+        stats["ratio"] = stats["bytes_after"] / stats["bytes_before"] if stats["bytes_before"] else 1.0
+        return blob, stats
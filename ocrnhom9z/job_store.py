@@ -0,0 +1,168 @@
+# job_store.py - Lưu trạng thái job trích xuất (SQLite) để tiếp tục batch khi bị gián đoạn
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import pandas as pd
+from config import *
+from page_source import PageError, PageRef
+
+class JobStore:
+    """Quản lý job trích xuất theo ảnh: pending → running → done / failed"""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, db_path=JOB_STORE_FILE, results_dir=JOB_RESULTS_DIR):
+        self.db_path = db_path
+        self.results_dir = results_dir
+        os.makedirs(results_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._file_hashes = {}  # (path, size, mtime) → hash, tránh băm lại file nhiều trang
+        self._run_attempts = {}  # job_key → số lần thử trong lần chạy này (cột attempts là tổng mọi lần chạy)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_key TEXT PRIMARY KEY,
+                image_path TEXT NOT NULL,
+                image_hash TEXT NOT NULL,
+                variant TEXT NOT NULL DEFAULT '',
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result_path TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state)")
+        self._conn.commit()
+        self.recover_interrupted()
+
+    @staticmethod
+    def hash_file(path):
+        """SHA-256 nội dung file (đọc theo khối)"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _source_hash(self, source):
+        """Hash của ảnh; trang trong file nhiều trang = hash file + số trang; file lỗi (PageError) = hash file"""
+        path = source.path if isinstance(source, (PageRef, PageError)) else source
+        stat = os.stat(path)
+        cache_key = (path, stat.st_size, stat.st_mtime)
+        file_hash = self._file_hashes.get(cache_key)
+        if file_hash is None:
+            file_hash = self.hash_file(path)
+            self._file_hashes[cache_key] = file_hash
+        return f"{file_hash}#p{source.index + 1}" if isinstance(source, PageRef) else file_hash
+
+    def recover_interrupted(self):
+        """Các job đang 'running' khi tiến trình bị dừng được đưa về 'pending'"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET state = ?, updated_at = ? WHERE state = ?",
+                (self.PENDING, time.time(), self.RUNNING)
+            )
+            self._conn.commit()
+        if cursor.rowcount:
+            print(f"♻️ Khôi phục {cursor.rowcount} job bị gián đoạn về trạng thái chờ")
+
+    def enqueue(self, image_path, variant=""):
+        """
+        Đăng ký job cho một ảnh hoặc một trang (PageRef) - khóa theo hash nội dung + variant (VD tên template)
+
+        Returns:
+            dict: Thông tin job (job mới hoặc job đã có)
+        """
+        image_hash = self._source_hash(image_path)
+        image_path = str(image_path)
+        job_key = f"{image_hash}:{variant}" if variant else image_hash
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (job_key, image_path, image_hash, variant, state, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_key, image_path, image_hash, variant, self.PENDING, now, now)
+            )
+            # Cập nhật đường dẫn nếu file được đổi tên / di chuyển
+            self._conn.execute("UPDATE jobs SET image_path = ? WHERE job_key = ?", (image_path, job_key))
+            self._conn.commit()
+        return self.get(job_key)
+
+    def get(self, job_key):
+        """Lấy job theo khóa"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_key = ?", (job_key,)).fetchone()
+        return dict(row) if row else None
+
+    def _update(self, job_key, sql, params):
+        with self._lock:
+            self._conn.execute(sql, params + (time.time(), job_key))
+            self._conn.commit()
+
+    def mark_running(self, job_key):
+        """Đánh dấu job đang chạy và tăng số lần thử"""
+        with self._lock:
+            self._run_attempts[job_key] = self._run_attempts.get(job_key, 0) + 1
+        self._update(job_key, "UPDATE jobs SET state = ?, attempts = attempts + 1, updated_at = ? WHERE job_key = ?",
+                     (self.RUNNING,))
+
+    def run_attempts(self, job_key):
+        """Số lần job đã chạy kể từ khi mở job store (lỗi ở lần chạy trước không tính)"""
+        with self._lock:
+            return self._run_attempts.get(job_key, 0)
+
+    def reset_failed(self):
+        """
+        Đưa mọi job lỗi về trạng thái chờ và xóa số lần thử - dùng khi đã sửa nguyên nhân lỗi
+        (API key, prompt, ảnh chụp lại...) và muốn xử lý lại ngay trong phiên đang chạy
+
+        Returns:
+            int: Số job được đặt lại
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET state = ?, attempts = 0, error = NULL, updated_at = ? WHERE state = ?",
+                (self.PENDING, time.time(), self.FAILED)
+            )
+            self._conn.commit()
+            self._run_attempts.clear()
+        if cursor.rowcount:
+            print(f"🔄 Đặt lại {cursor.rowcount} job lỗi về trạng thái chờ")
+        return cursor.rowcount
+
+    def mark_done(self, job_key, df):
+        """Lưu kết quả ra file và đánh dấu hoàn thành"""
+        result_path = os.path.join(self.results_dir, f"{job_key.replace(':', '_')}.json")
+        df.to_json(result_path, orient='split', force_ascii=False, index=False)
+        self._update(job_key, "UPDATE jobs SET state = ?, result_path = ?, error = NULL, updated_at = ? WHERE job_key = ?",
+                     (self.DONE, result_path))
+
+    def mark_failed(self, job_key, error):
+        """Đánh dấu job lỗi"""
+        self._update(job_key, "UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE job_key = ?",
+                     (self.FAILED, str(error)[:1000]))
+
+    def load_result(self, job):
+        """Đọc lại DataFrame kết quả của job đã hoàn thành (None nếu file mất)"""
+        result_path = job.get('result_path')
+        if not result_path or not os.path.exists(result_path):
+            return None
+        return pd.read_json(result_path, orient='split', dtype=False)
+
+    def get_stats(self):
+        """Số job theo từng trạng thái"""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        stats = {state: 0 for state in (self.PENDING, self.RUNNING, self.DONE, self.FAILED)}
+        stats.update({state: count for state, count in rows})
+        return stats
@@ -1,19 +1,19 @@
 # main.py - File chính để chạy ứng dụng
 
-import tkinter as tk
-from tkinter import messagebox
 import sys
 import os
 
-# Import các module của ứng dụng
-from gui import GradeExtractionGUI
-from ocr_processor import OCRProcessor
-from data_validator import DataValidator
-from excel_exporter import ExcelExporter
-
 def main():
     """Hàm chính để chạy ứng dụng"""
     try:
+        # Import GUI tại đây để chế độ dòng lệnh (batch) không cần tkinter
+        import tkinter as tk
+        from tkinter import messagebox
+        from gui import GradeExtractionGUI
+        from ocr_processor import OCRProcessor
+        from data_validator import DataValidator
+        from excel_exporter import ExcelExporter
+
         # Tạo cửa sổ chính
         root = tk.Tk()
         
@@ -42,6 +42,7 @@ def main():
         print(error_msg)
         if 'tkinter' in str(e):
             print("Lỗi: Tkinter không có sẵn. Vui lòng cài đặt Python với Tkinter support.")
+            print("Chạy không giao diện: python main.py batch <thư mục ảnh> --xlsx ket_qua.xlsx")
         sys.exit(1)
         
     except Exception as e:
@@ -84,6 +85,11 @@ def check_dependencies():
     return True
 
 if __name__ == "__main__":
+    # Chế độ dòng lệnh: python main.py batch|watch ... (không tạo cửa sổ Tk)
+    if len(sys.argv) > 1 and sys.argv[1] in ("batch", "watch"):
+        from cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+
     print("🚀 Khởi động ứng dụng Trích Xuất Bảng Điểm...")
     print("📁 Cấu trúc modular:")
     print("   - main.py: File chính")
@@ -91,6 +97,7 @@ if __name__ == "__main__":
     print("   - ocr_processor.py: Xử lý OCR và Gemini")
     print("   - data_validator.py: Validation dữ liệu")
     print("   - excel_exporter.py: Xuất Excel")
+    print("   - cli.py: Chạy hàng loạt không giao diện (python main.py batch ...)")
     print("   - config.py: Cấu hình hệ thống")
     print()
     
@@ -0,0 +1,171 @@
+# name_corrector.py - Sửa lỗi OCR cho tên tiếng Việt bằng tra cứu gần đúng (SymSpell) trên tên không dấu
+
+import re
+import unicodedata
+from functools import lru_cache
+from itertools import combinations
+from config import *
+
+# Âm tiết tiếng Việt (không dấu): phụ âm đầu? + nguyên âm + phụ âm cuối? - không khớp → từ bị OCR làm hỏng
+SYLLABLE_RE = re.compile(r'^(ngh|ng|gh|gi|kh|nh|ph|qu|th|tr|ch|[bcdghklmnpqrstvx])?[aeiouy]+(ch|ng|nh|[cmnpt])?$')
+TONE_MARKS = frozenset("\u0300\u0301\u0303\u0309\u0323")  # huyền, sắc, ngã, hỏi, nặng (dạng NFD)
+
+def _deletes(word, max_distance):
+    """
+    Tất cả chuỗi thu được khi xóa tối đa max_distance ký tự của word (gồm cả word)
+
+    Thứ tự cố định, ít ký tự bị xóa trước - khi phải dừng sớm vẫn giữ các ứng viên gần nhất.
+    """
+    results = {word: None}
+    for count in range(1, min(max_distance, len(word)) + 1):
+        for positions in combinations(range(len(word)), count):
+            results["".join(ch for i, ch in enumerate(word) if i not in positions)] = None
+    return list(results)
+
+def edit_distance(a, b, max_distance):
+    """
+    Khoảng cách Damerau-Levenshtein (OSA: thêm / xóa / thay / đổi chỗ hai ký tự liền kề)
+
+    Dừng sớm và trả về max_distance + 1 khi chắc chắn vượt max_distance.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and i > 1 and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        # Hai dòng liên tiếp đều vượt ngưỡng (đổi chỗ dùng tới dòng trước nữa) → không thể quay lại
+        if min(current) > max_distance and min(previous) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+def has_diacritics(word):
+    """Từ có dấu (kể cả chữ đ)"""
+    return fold_name(word) != strip_diacritics(word)
+
+def is_malformed(word):
+    """Từ không phải một âm tiết tiếng Việt hợp lệ (VD 'Hoàag', 'Bìnk', có chữ số, hai dấu thanh)"""
+    tones = sum(1 for ch in unicodedata.normalize("NFD", fold_name(word)) if ch in TONE_MARKS)
+    return tones > 1 or not SYLLABLE_RE.match(strip_diacritics(word))
+
+def allowed_distance(plain):
+    """Số lỗi tối đa được sửa theo độ dài tên (tên ngắn chỉ được khôi phục dấu)"""
+    if len(plain) < NAME_FUZZY_MIN_LENGTH:
+        return 0
+    if len(plain) < NAME_FUZZY_LONG_LENGTH:
+        return min(1, NAME_FUZZY_MAX_DISTANCE)
+    return NAME_FUZZY_MAX_DISTANCE
+
+class NameCorrector:
+    """
+    Sửa một từ trong tên về tên gần nhất trong VIETNAMESE_NAMES_DATABASE
+
+    - Chỉ mục SymSpell: mọi biến thể "xóa tối đa NAME_FUZZY_MAX_DISTANCE ký tự" của tên không dấu,
+      tra cứu bằng các biến thể xóa của từ cần sửa → không phải so với toàn bộ danh sách
+    - Xếp hạng ứng viên theo (khoảng cách, độ giống dấu với từ gốc, độ phổ biến = thứ tự trong database);
+      correct() chỉ nhận ứng viên tốt nhất duy nhất (không phân xử bằng độ phổ biến)
+    - Độ trễ mỗi lần tra có giới hạn: từ dài hơn NAME_FUZZY_MAX_WORD_LENGTH bị bỏ qua, số ứng viên
+      được kiểm tra tối đa NAME_FUZZY_MAX_CANDIDATES
+    """
+
+    def __init__(self, names, max_distance=NAME_FUZZY_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.names = tuple(dict.fromkeys(names))
+        self._rank = {}  # tên → thứ hạng (nhỏ = phổ biến hơn)
+        self._by_plain = {}  # khóa không dấu → các tên có dấu
+        for rank, name in enumerate(self.names):
+            self._rank.setdefault(name, rank)
+            self._by_plain.setdefault(strip_diacritics(name), []).append(name)
+        self._deletes = {}  # biến thể xóa → các khóa không dấu
+        for plain in self._by_plain:
+            for variant in _deletes(plain, max_distance):
+                self._deletes.setdefault(variant, set()).add(plain)
+
+    def _score(self, word, max_distance=None):
+        """Các ứng viên (khoảng cách, độ khác dấu, thứ hạng, tên) đã sắp xếp, tốt nhất trước"""
+        plain = strip_diacritics(word)
+        if not plain or len(plain) > NAME_FUZZY_MAX_WORD_LENGTH:
+            return []
+        if max_distance is None:
+            max_distance = allowed_distance(plain)
+        max_distance = min(max_distance, self.max_distance)
+
+        candidates = set()
+        for variant in _deletes(plain, max_distance):
+            candidates.update(self._deletes.get(variant, ()))
+            if len(candidates) >= NAME_FUZZY_MAX_CANDIDATES:
+                break
+
+        scored = []
+        for key in candidates:
+            distance = edit_distance(plain, key, max_distance)
+            if distance <= max_distance:
+                for name in self._by_plain[key]:
+                    scored.append((distance, self._accent_distance(word, name), self._rank[name], name))
+        scored.sort()
+        return scored
+
+    def lookup(self, word, max_distance=None, limit=5):
+        """
+        Các tên gần word nhất
+
+        Returns:
+            List[Tuple[str, int]]: (tên có dấu, khoảng cách trên dạng không dấu), tốt nhất trước
+        """
+        return [(name, distance) for distance, _, _, name in self._score(word, max_distance)[:limit]]
+
+    @staticmethod
+    def _accent_distance(word, name):
+        """Từ gốc có dấu: ưu tiên tên có dấu giống nhất ('Hoà' → Hòa thay vì Hoa)"""
+        folded = fold_name(word)
+        if folded == strip_diacritics(word):
+            return 0  # từ không dấu - chỉ xét độ phổ biến
+        return edit_distance(folded, fold_name(name), len(folded) + len(name))
+
+    def correct(self, word):
+        """
+        Tên đúng cho word, hoặc None nếu không chắc chắn
+
+        - Từ có dấu và là âm tiết hợp lệ thường là tên thật chưa có trong database ('Thìn', 'Trâm',
+          'Nhàn') → giữ nguyên, kể cả khi chỉ khác dấu với một tên đã biết ('Nhân')
+        - Chỉ sửa từ không dấu ('Nguyen', 'Phuong') hoặc hỏng rõ ràng ('Nguycn', 'Hoàag')
+        - Chỉ sửa khi có đúng một ứng viên tốt nhất; hòa ('Quyen' → Quyên / Quyền) thì giữ nguyên
+        """
+        if has_diacritics(word) and not is_malformed(word):
+            return None
+        matches = self._score(word)
+        if not matches or (len(matches) > 1 and matches[1][:2] == matches[0][:2]):
+            return None
+        return matches[0][3]
+
+@lru_cache(maxsize=None)
+def get_name_corrector(kind=None):
+    """Bộ sửa tên dùng chung (dựng một lần): kind = "surname", "middle_name", "first_name" hoặc None (tất cả)"""
+    if kind is None:
+        names = (get_name_index("surname").names + get_name_index("middle_name").names
+                 + get_name_index("first_name").names)
+        return NameCorrector(names)
+    return NameCorrector(get_name_index(kind).names)
+
+def is_known_name(word):
+    """Từ đã có trong database (có dấu, không phân biệt hoa thường)"""
+    return any(word in get_name_index(kind) for kind in ("surname", "middle_name", "first_name"))
+
+@lru_cache(maxsize=NAME_FUZZY_CACHE_SIZE)
+def correct_name_word(word, kind=None):
+    """
+    Sửa một từ trong tên; từ đã đúng hoặc không có tên nào đủ gần thì giữ nguyên
+
+    Kết quả được cache - bảng điểm lặp lại rất nhiều họ / tên đệm.
+    """
+    if not word or is_known_name(word):
+        return word
+    corrected = get_name_corrector(kind).correct(word)
+    return corrected or word
@@ -0,0 +1,393 @@
+# ocr_backends.py - Các backend sinh nội dung từ ảnh (Gemini thật hoặc replay offline)
+
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import threading
+import time
+from config import *
+
+class VisionBackend:
+    """Interface backend: nhận [prompt, ảnh] và trả về response có thuộc tính .text"""
+
+    model_name = "base"
+
+    def generate_content(self, contents, generation_config=None, timeout=None):
+        """
+        Sinh nội dung từ prompt và ảnh
+
+        Args:
+            contents: Prompt (str) hoặc list [prompt, ảnh]
+            generation_config: Cấu hình sinh (JSON mode, schema...)
+            timeout: Deadline (giây) cho request, nếu backend hỗ trợ
+
+        Returns:
+            Object có thuộc tính .text (và .usage_metadata nếu backend hỗ trợ)
+        """
+        raise NotImplementedError
+
+    def generate_content_stream(self, contents, generation_config=None, on_usage=None, timeout=None):
+        """Sinh nội dung dạng stream - yield từng đoạn text (mặc định: một đoạn duy nhất)
+
+        on_usage: Callback nhận usage_metadata (token) sau khi stream kết thúc
+        """
+        response = self.generate_content(contents, generation_config=generation_config, timeout=timeout)
+        if on_usage:
+            on_usage(getattr(response, "usage_metadata", None))
+        if response and response.text:
+            yield response.text
+
+    def test_connection(self):
+        """Kiểm tra backend sẵn sàng - trả về (success, message)"""
+        return True, f"Backend {self.model_name} sẵn sàng"
+
+    def count_tokens(self, contents):
+        """Số token của contents theo tokenizer của model (None nếu backend không hỗ trợ)"""
+        return None
+
+# Registry dùng chung trong tiến trình: mỗi (API key, model) chỉ tạo client một lần
+_gemini_lock = threading.Lock()
+_gemini_models = {}  # (api_key, model_name) → GenerativeModel đã gắn client
+_gemini_checks = {}  # (api_key, model_name) → (thời điểm, thông tin model) của lần kiểm tra thành công
+_gemini_configured_key = None
+
+def _configure_gemini(genai, api_key):
+    """genai.configure là cấu hình toàn cục - chỉ gọi khi đổi API key (giữ _gemini_lock khi gọi)"""
+    global _gemini_configured_key
+    if _gemini_configured_key != api_key:
+        genai.configure(api_key=api_key)
+        _gemini_configured_key = api_key
+
+def get_gemini_model(api_key, model_name=GEMINI_MODEL):
+    """
+    Lấy GenerativeModel dùng chung cho (api_key, model_name)
+
+    Client (kênh kết nối) được tạo một lần và gắn vào model, nên đổi API key
+    sau đó không ảnh hưởng tới các model đã tạo.
+    """
+    key = (api_key, model_name)
+    with _gemini_lock:
+        model = _gemini_models.get(key)
+        if model is None:
+            import google.generativeai as genai
+
+            _configure_gemini(genai, api_key)
+            model = genai.GenerativeModel(model_name)
+            try:
+                from google.generativeai import client as genai_client
+                model._client = genai_client.get_default_generative_client()
+            except (ImportError, AttributeError):
+                pass  # phiên bản thư viện khác: model tự lấy client mặc định khi gọi
+            _gemini_models[key] = model
+        return model
+
+def check_gemini_connection(api_key, model_name=GEMINI_MODEL, max_age=GEMINI_CONNECTION_CHECK_TTL):
+    """
+    Kiểm tra API key bằng lời gọi metadata (models.get) - không sinh nội dung, không tốn quota
+
+    Kết quả thành công được dùng lại trong max_age giây; lỗi luôn được ném ra để kiểm tra lại lần sau.
+
+    Returns:
+        str: Tên hiển thị của model
+    """
+    key = (api_key, model_name)
+    cached = _gemini_checks.get(key)
+    if cached and time.time() - cached[0] < max_age:
+        return cached[1]
+
+    with _gemini_lock:
+        import google.generativeai as genai
+
+        _configure_gemini(genai, api_key)
+        info = genai.get_model(model_name if model_name.startswith("models/") else f"models/{model_name}")
+
+    display_name = getattr(info, "display_name", None) or model_name
+    _gemini_checks[key] = (time.time(), display_name)
+    return display_name
+
+class GeminiBackend(VisionBackend):
+    """Backend gọi Google Gemini qua google.generativeai (model lấy từ registry dùng chung)"""
+
+    def __init__(self, api_key, model_name=GEMINI_MODEL):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.model = get_gemini_model(api_key, model_name)
+
+    @staticmethod
+    def _request_options(timeout):
+        # Deadline phía thư viện: request quá hạn bị hủy ở tầng HTTP/gRPC
+        return {"timeout": timeout} if timeout else None
+
+    def generate_content(self, contents, generation_config=None, timeout=None):
+        return self.model.generate_content(contents, generation_config=generation_config,
+                                           request_options=self._request_options(timeout))
+
+    def generate_content_stream(self, contents, generation_config=None, on_usage=None, timeout=None):
+        response = self.model.generate_content(contents, generation_config=generation_config, stream=True,
+                                               request_options=self._request_options(timeout))
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+        if on_usage:
+            on_usage(getattr(response, "usage_metadata", None))
+
+    def test_connection(self):
+        display_name = check_gemini_connection(self.api_key, self.model_name)
+        return True, f"Kết nối Gemini API thành công ({display_name})"
+
+    def count_tokens(self, contents):
+        # countTokens miễn phí, không tính vào quota sinh nội dung
+        return self.model.count_tokens(contents).total_tokens
+
+class BackendResponse:
+    """Response của backend không phải Gemini, cùng giao diện với response của Gemini"""
+
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+def image_part_hash(image):
+    """Hash nội dung ảnh gửi lên backend (blob dict hoặc PIL Image)"""
+    if isinstance(image, dict):
+        data = image.get("data", b"")
+    elif isinstance(image, (bytes, bytearray)):
+        data = bytes(image)
+    else:
+        header = f"{image.mode}:{image.size}".encode('utf-8')
+        data = header + image.tobytes()
+    return hashlib.sha256(data).hexdigest()
+
+def _split_contents(contents):
+    """Tách prompt và ảnh từ contents"""
+    if isinstance(contents, (list, tuple)):
+        prompt = next((part for part in contents if isinstance(part, str)), "")
+        image = next((part for part in contents if not isinstance(part, str)), None)
+        return prompt, image
+    return contents, None
+
+class ReplayBackend(VisionBackend):
+    """
+    Backend offline: trả response đã ghi sẵn theo hash ảnh
+
+    Hỗ trợ giả lập độ trễ và lỗi (mặc định lỗi 429) để benchmark / load-test
+    pipeline mà không tốn quota hay cần mạng.
+    """
+
+    model_name = "replay"
+
+    def __init__(self, recordings_dir=REPLAY_RECORDINGS_DIR, latency=(0.0, 0.0), error_rate=0.0,
+                 error_message="429 Resource has been exhausted (replay)", default_response=None,
+                 seed=None, stream_chunk_size=256):
+        self.recordings_dir = recordings_dir
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_message = error_message
+        self.default_response = default_response
+        self.stream_chunk_size = stream_chunk_size
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        os.makedirs(recordings_dir, exist_ok=True)
+
+    def _recording_path(self, key):
+        return os.path.join(self.recordings_dir, f"{key}.json")
+
+    def record(self, image, response_text):
+        """Ghi lại response cho một ảnh"""
+        path = self._recording_path(image_part_hash(image))
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"text": response_text}, f, ensure_ascii=False)
+        return path
+
+    def count_recordings(self):
+        """Số response đã ghi"""
+        return sum(1 for name in os.listdir(self.recordings_dir) if name.endswith('.json'))
+
+    def _next_call(self):
+        """Bốc thăm độ trễ và lỗi giả lập cho một lần gọi"""
+        with self._lock:
+            delay = self._random.uniform(*self.latency)
+            inject_error = self._random.random() < self.error_rate
+        return delay, inject_error
+
+    def generate_content(self, contents, generation_config=None, timeout=None):
+        delay, inject_error = self._next_call()
+        if delay > 0:
+            time.sleep(delay)
+        if inject_error:
+            raise Exception(self.error_message)
+        return BackendResponse(self._lookup(contents))
+
+    def generate_content_stream(self, contents, generation_config=None, on_usage=None, timeout=None):
+        # Độ trễ được rải đều qua các chunk để mô phỏng thời gian sinh
+        delay, inject_error = self._next_call()
+        if inject_error:
+            raise Exception(self.error_message)
+
+        text = self._lookup(contents)
+        chunks = [text[i:i + self.stream_chunk_size] for i in range(0, len(text), self.stream_chunk_size)] or [""]
+        for chunk in chunks:
+            if delay > 0:
+                time.sleep(delay / len(chunks))
+            yield chunk
+
+    def _lookup(self, contents):
+        """Tìm response đã ghi cho ảnh trong contents"""
+        _, image = _split_contents(contents)
+        if image is None:
+            return self.default_response or "OK"
+
+        path = self._recording_path(image_part_hash(image))
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)["text"]
+
+        if self.default_response is not None:
+            return self.default_response
+        raise Exception(f"Không có response ghi sẵn cho ảnh {os.path.basename(path)}")
+
+    def test_connection(self):
+        return True, f"Replay backend sẵn sàng ({self.count_recordings()} response đã ghi)"
+
+class RecordingBackend(VisionBackend):
+    """Bọc một backend thật và ghi lại mọi response thành công để replay sau này"""
+
+    def __init__(self, inner, replay_backend):
+        self.inner = inner
+        self.replay_backend = replay_backend
+        self.model_name = inner.model_name
+
+    def generate_content(self, contents, generation_config=None, timeout=None):
+        response = self.inner.generate_content(contents, generation_config=generation_config, timeout=timeout)
+        _, image = _split_contents(contents)
+        if image is not None and response and response.text:
+            self.replay_backend.record(image, response.text)
+        return response
+
+    def generate_content_stream(self, contents, generation_config=None, on_usage=None, timeout=None):
+        parts = []
+        for chunk in self.inner.generate_content_stream(contents, generation_config=generation_config,
+                                                        on_usage=on_usage, timeout=timeout):
+            parts.append(chunk)
+            yield chunk
+        _, image = _split_contents(contents)
+        if image is not None and parts:
+            self.replay_backend.record(image, "".join(parts))
+
+    def test_connection(self):
+        return self.inner.test_connection()
+
+class TesseractBackend(VisionBackend):
+    """
+    Backend OCR cục bộ bằng Tesseract (không tốn quota, không cần mạng)
+
+    Đọc văn bản theo dòng rồi ánh xạ vào các cột của template hiện tại, trả về
+    JSON {"students": [...]} giống Gemini để dùng chung bộ parse.
+    """
+
+    model_name = "tesseract"
+
+    MSV_RE = re.compile(r'^\d{8,10}$')
+    CLASS_RE = re.compile(r'\b([A-ZĐ]{2,5})\s?(\d{2})\s?-\s?(\d{2})\b')
+    SCORE_RE = re.compile(r'^\d{1,2}(?:[.,]\d{1,2})?$')
+    NAME_KEYS = ('ho', 'hodem', 'ten', 'hoten')
+    GENDER_VALUES = ('Nam', 'Nữ')
+
+    def __init__(self, prompt_manager, handwriting=False):
+        try:
+            import pytesseract
+        except ImportError:
+            raise Exception("Chưa cài pytesseract - pip install pytesseract (và cài Tesseract OCR kèm gói ngôn ngữ 'vie')")
+
+        self.pytesseract = pytesseract
+        self.prompt_manager = prompt_manager
+        self.ocr_config = OCR_CONFIG_HANDWRITING if handwriting else OCR_CONFIG_STANDARD
+
+    def _to_pil(self, image):
+        from PIL import Image
+
+        if isinstance(image, dict):
+            return Image.open(io.BytesIO(image["data"]))
+        if isinstance(image, (bytes, bytearray)):
+            return Image.open(io.BytesIO(bytes(image)))
+        return image
+
+    def generate_content(self, contents, generation_config=None, timeout=None):
+        _, image = _split_contents(contents)
+        if image is None:
+            return BackendResponse("OK")
+
+        text = self.pytesseract.image_to_string(self._to_pil(image), lang=OCR_LANGUAGES, config=self.ocr_config)
+        columns = self.prompt_manager.get_current_columns()
+        students = []
+        for line in text.splitlines():
+            student = self.parse_line(line, columns)
+            if student:
+                students.append(student)
+        return BackendResponse(json.dumps({"students": students}, ensure_ascii=False))
+
+    def parse_line(self, line, columns):
+        """Ánh xạ một dòng văn bản OCR vào các cột của template (None nếu không phải dòng dữ liệu)"""
+        line = line.replace('|', ' ').strip()
+        if not line:
+            return None
+
+        keys = [col.get('key', '') for col in columns]
+        student = {key: "" for key in keys}
+
+        # Lớp (VD: CNTT 17-02)
+        class_match = self.CLASS_RE.search(line)
+        if class_match:
+            line = line[:class_match.start()] + " " + line[class_match.end():]
+            if 'lop' in student:
+                student['lop'] = f"{class_match.group(1)} {class_match.group(2)}-{class_match.group(3)}"
+
+        tokens = line.split()
+
+        # STT ở đầu dòng
+        if tokens and tokens[0].rstrip('.').isdigit() and len(tokens[0].rstrip('.')) <= 3:
+            stt = tokens.pop(0).rstrip('.')
+            if 'stt' in student:
+                student['stt'] = stt
+
+        # MSV
+        msv_index = next((i for i, tok in enumerate(tokens) if self.MSV_RE.match(tok)), None)
+        if msv_index is not None:
+            msv = tokens.pop(msv_index)
+            if 'msv' in student:
+                student['msv'] = msv
+
+        # Điểm ở cuối dòng, gán theo thứ tự các cột điểm
+        score_keys = [col.get('key', '') for col in columns if col.get('type') == 'score']
+        scores = []
+        while tokens and len(scores) < len(score_keys) and self.SCORE_RE.match(tokens[-1]):
+            scores.insert(0, tokens.pop().replace(',', '.'))
+        for key, score in zip(score_keys, scores):
+            student[key] = score
+
+        # Giới tính
+        if 'gioitinh' in student:
+            for i, tok in enumerate(tokens):
+                if tok.capitalize() in self.GENDER_VALUES:
+                    student['gioitinh'] = tokens.pop(i).capitalize()
+                    break
+
+        # Phần chữ còn lại là họ tên
+        name_words = [tok for tok in tokens if any(ch.isalpha() for ch in tok)]
+        if name_words:
+            if 'hoten' in student:
+                student['hoten'] = " ".join(name_words)
+            else:
+                if 'ten' in student:
+                    student['ten'] = name_words[-1]
+                    name_words = name_words[:-1]
+                surname_key = 'ho' if 'ho' in student else 'hodem' if 'hodem' in student else None
+                if surname_key:
+                    student[surname_key] = " ".join(name_words)
+
+        has_name = any(student.get(key) for key in self.NAME_KEYS)
+        if not student.get('msv') and not (student.get('stt') and has_name):
+            return None
+        return student
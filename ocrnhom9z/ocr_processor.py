@@ -1,202 +1,1045 @@
 # ocr_processor.py - Xử lý OCR và Gemini Vision
 
+import hashlib
+import io
 import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 import pandas as pd
-import google.generativeai as genai
-from PIL import Image
+from PIL import Image, ImageOps
 from config import *
 from prompt_manager import PromptManager
+from image_preprocessor import ImageNormalizer
+from extraction_metrics import ExtractionMetrics, summarize_metrics
+from job_store import JobStore
+from page_source import PageError, PageRef, expand_pages, read_page_bytes
+from ocr_backends import GeminiBackend, TesseractBackend
+from rate_limiter import QuotaExceededError, get_shared_rate_limiter, is_quota_error
+from request_policy import RequestPolicy, iter_with_deadline
+from stream_parser import IncrementalStudentParser
+
+class ResponseCache:
+    """Cache response Gemini trên đĩa (SQLite), khóa theo nội dung ảnh + prompt + model"""
+
+    def __init__(self, db_path=RESPONSE_CACHE_FILE, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                response_text TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_access ON responses(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(image_bytes, prompt, model_name=GEMINI_MODEL, variant=""):
+        """Tạo khóa cache từ hash ảnh, hash prompt, tên model và cấu hình tiền xử lý"""
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+        prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        key = f"{model_name}:{image_hash}:{prompt_hash}"
+        return f"{key}:{variant}" if variant else key
+
+    def get(self, key):
+        """Lấy response đã cache, trả về None nếu chưa có"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response_text FROM responses WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE cache_key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key, response_text):
+        """Lưu response và loại bỏ các bản ghi ít dùng nhất khi vượt giới hạn"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (cache_key, response_text, created_at, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, response_text, now, now)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE cache_key IN ("
+                    "SELECT cache_key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+    def clear(self):
+        """Xóa toàn bộ cache"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self):
+        """Thống kê hit/miss của cache"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries
+        }
 
 class OCRProcessor:
     """Class xử lý OCR và Gemini Vision API"""
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, response_cache=None, image_normalizer=None, rate_limiter=None,
+                 backend=None, prompt_manager=None, request_policy=None):
         self.api_key = api_key
         self.last_response = None
-        self.prompt_manager = PromptManager()
-        if api_key:
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel(GEMINI_MODEL)
+        self.prompt_manager = prompt_manager or PromptManager()
+        self.rate_limiter = rate_limiter or get_shared_rate_limiter()
+        self.request_policy = request_policy or RequestPolicy()
+        if response_cache is None and RESPONSE_CACHE_ENABLED:
+            response_cache = ResponseCache()
+        self.response_cache = response_cache
+        if image_normalizer is None and IMAGE_NORMALIZE_ENABLED:
+            image_normalizer = ImageNormalizer()
+        self.image_normalizer = image_normalizer
+        self.image_stats = []  # Thống kê bytes trước/sau chuẩn hóa cho từng ảnh
+        self.tiling_enabled = TILING_ENABLED
+        self.dedupe_enabled = BATCH_DEDUPE_ENABLED
+        self.compact_prompt = PROMPT_COMPACT
+        self._column_plans = {}  # cấu hình cột → (keys, headers, tách họ/tên)
+        self._stats_lock = threading.Lock()
+        if backend is None and api_key:
+            backend = GeminiBackend(api_key)
+        self.backend = backend
+        self.ocr_engine = OCR_ENGINE
+        self._tesseract_engines = {}
+        self.metrics = deque(maxlen=METRICS_HISTORY_SIZE)  # số liệu các lần trích xuất gần nhất
+        self._unsaved_metrics = []  # chờ ghi vào OCR_Sessions
     
     def test_api_connection(self):
         """Kiểm tra kết nối Gemini API"""
         try:
+            # Backend khác Gemini (replay...) tự kiểm tra
+            if self.backend is not None and not isinstance(self.backend, GeminiBackend):
+                return self.backend.test_connection()
+
             if not self.api_key:
                 return False, "API Key không được để trống"
 
-            # Cấu hình Gemini
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel(GEMINI_MODEL)
+            # Model lấy từ registry dùng chung - không tạo lại client mỗi lần kiểm tra
+            if not isinstance(self.backend, GeminiBackend) or self.backend.api_key != self.api_key:
+                self.backend = GeminiBackend(self.api_key)
 
-            # Test với prompt đơn giản
-            response = self.model.generate_content("Hello, test connection")
-
-            if response and response.text:
-                return True, "Kết nối Gemini API thành công! 🆓 Hoàn toàn miễn phí!"
-            else:
-                return False, "Không nhận được response từ Gemini"
+            # Lời gọi metadata (không sinh nội dung), kết quả thành công được cache
+            self.backend.test_connection()
+            return True, "Kết nối Gemini API thành công! 🆓 Hoàn toàn miễn phí!"
 
         except Exception as e:
             error_msg = str(e)
             if "API_KEY_INVALID" in error_msg:
                 return False, "API Key không hợp lệ - Vui lòng kiểm tra lại"
-            elif "QUOTA_EXCEEDED" in error_msg:
+            elif is_quota_error(e):
                 return False, "Vượt quá quota - Vui lòng thử lại sau"
             else:
                 return False, f"Lỗi kết nối Gemini: {error_msg}"
     
-    def extract_data_from_image(self, image_path):
-        """Trích xuất dữ liệu từ ảnh bằng Gemini"""
+    def extract_data_from_image(self, image_path, on_row=None):
+        """
+        Trích xuất dữ liệu từ ảnh bằng Gemini
+
+        Args:
+            image_path: Đường dẫn ảnh, PDF (trang đầu) hoặc PageRef (một trang của TIFF/PDF)
+            on_row: Callback nhận từng dòng (dict tên cột → giá trị) ngay khi có,
+                    bật chế độ stream khi GEMINI_STREAMING
+        """
+        metrics = ExtractionMetrics(image_path, backend=self.backend_name,
+                                    template=self.get_prompt_variant())
         try:
             print(f"🔍 Bắt đầu trích xuất: {image_path}")
 
-            # Mở ảnh bằng PIL
-            image = Image.open(image_path)
-            print(f"📸 Đã mở ảnh thành công: {image.size}")
+            # Đọc bytes ảnh (dùng cho cả cache và PIL) - trang PDF/TIFF được render tại đây
+            with metrics.stage("read"):
+                image_bytes = read_page_bytes(image_path)
+            metrics.bytes_read = len(image_bytes)
 
             # Tạo prompt
             prompt = self._create_prompt()
             print(f"📝 Đã tạo prompt")
 
-            # Gọi Gemini Vision API
-            response_text = self._call_gemini_vision_api(image, prompt)
-            print(f"🤖 Gemini response length: {len(response_text)} chars")
+            # Engine cục bộ (Tesseract) - Gemini làm dự phòng cho chữ viết tay
+            if self.ocr_engine in ("tesseract", "auto"):
+                local_result = self._extract_with_tesseract(image_path, image_bytes, metrics)
+                if local_result is not None:
+                    if on_row:
+                        self._emit_rows(local_result[1], on_row)
+                    metrics.engine = "tesseract"
+                    self.last_response = local_result[2]
+                    self._record_metrics(metrics, local_result[0], len(local_result[1]))
+                    return local_result
+            metrics.engine = "gemini"
+
+            # Bảng dài: chia dải ngang và trích xuất song song
+            tiled = self._should_tile(image_bytes)
+
+            # Tra cache trước khi gọi API
+            variant = self.image_normalizer.describe() if self.image_normalizer else ""
+            generation_config = self._create_generation_config()
+            if generation_config:
+                schema_json = json.dumps(generation_config["response_schema"], sort_keys=True)
+                variant += "|json:" + hashlib.sha256(schema_json.encode('utf-8')).hexdigest()[:16]
+            if tiled:
+                variant += f"|tiles:{TILE_COUNT}:{TILE_OVERLAP}"
+            cache_key = ResponseCache.make_key(image_bytes, prompt, model_name=self.backend_name,
+                                               variant=variant)
+            with metrics.stage("cache"):
+                response_text = self.response_cache.get(cache_key) if self.response_cache else None
+            from_cache = response_text is not None
+            metrics.from_cache = from_cache
+            rows_emitted = False
+
+            if from_cache:
+                print(f"♻️ Dùng response đã cache ({len(response_text)} chars)")
+            elif tiled:
+                response_text = self._extract_tiled(image_path, image_bytes, prompt, metrics)
+            elif on_row and GEMINI_STREAMING:
+                # Stream: đẩy từng sinh viên cho on_row ngay khi object JSON đóng
+                image = self._prepare_image(image_path, image_bytes, metrics)
+                columns_config = self.prompt_manager.get_current_columns()
+                headers = self._get_headers(columns_config)
+                text_parts = []
+                self.rate_limiter.take_thread_wait()
+                with metrics.stage("api"):
+                    for index, student in enumerate(self._stream_students(image, prompt, text_parts, metrics)):
+                        row = self._student_to_row(dict(student), columns_config, index)
+                        on_row(dict(zip(headers, row)))
+                metrics.split_wait("api", self.rate_limiter.take_thread_wait())
+                rows_emitted = True
+                response_text = "".join(text_parts)
+                print(f"🤖 Gemini stream: {len(response_text)} chars")
+            else:
+                # Chuẩn hóa ảnh trước khi upload
+                image = self._prepare_image(image_path, image_bytes, metrics)
+
+                # Gọi Gemini Vision API
+                response_text = self._call_gemini_vision_api(image, prompt, metrics)
+                print(f"🤖 Gemini response length: {len(response_text)} chars")
 
             # Parse kết quả thành DataFrame
-            df = self._parse_response_to_dataframe(response_text)
+            with metrics.stage("parse"):
+                df = self._parse_response_to_dataframe(response_text)
             print(f"📊 Parsed DataFrame: {len(df)} rows")
+            self.last_response = response_text
+            if on_row and not rows_emitted:
+                self._emit_rows(df, on_row)
+
+            # Chỉ cache các response parse được dữ liệu
+            if self.response_cache and not from_cache and not df.empty:
+                self.response_cache.put(cache_key, response_text)
 
+            self._record_metrics(metrics, True, len(df))
             return True, df, response_text
 
         except Exception as e:
             print(f"❌ Lỗi trích xuất: {str(e)}")
+            self._record_metrics(metrics, False, error=e)
             return False, pd.DataFrame(), f"Lỗi trích xuất: {str(e)}"
-    
-    def _call_gemini_vision_api(self, image, prompt):
+
+    def iter_rows(self, image_path):
+        """
+        Trích xuất dạng iterator: yield từng dòng (dict tên cột → giá trị) ngay khi Gemini sinh xong
+
+        Trích xuất chạy ở thread nền nên người gọi có thể validate các dòng
+        trong khi Gemini vẫn đang sinh phần còn lại.
+        """
+        rows = queue.Queue()
+        done = object()
+        result = {}
+
+        def worker():
+            try:
+                result['value'] = self.extract_data_from_image(image_path, on_row=rows.put)
+            finally:
+                rows.put(done)
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        while True:
+            row = rows.get()
+            if row is done:
+                break
+            yield row
+        thread.join()
+
+        success, _, raw_response = result.get('value', (False, None, "Lỗi trích xuất"))
+        if not success:
+            raise Exception(raw_response)
+
+    def _stream_students(self, image, prompt, text_parts, metrics=None):
+        """Gọi Gemini dạng stream, yield từng sinh viên; text thô được gom vào text_parts"""
+        if self.backend is None:
+            raise Exception("Chưa cấu hình API Key / backend")
+
+        parser = IncrementalStudentParser()
+        if metrics:
+            metrics.add_upload(self._payload_size(image))
+        backend = self.backend
+        timeout = self.request_policy.timeout
+
+        def open_stream(contents, **kwargs):
+            # Deadline cho cả stream - chunk bị treo không giữ worker quá timeout
+            return iter_with_deadline(
+                lambda: backend.generate_content_stream(contents, timeout=timeout, **kwargs), timeout)
+
+        chunks = self.rate_limiter.stream(open_stream, [prompt, image],
+                                          generation_config=self._create_generation_config(),
+                                          on_usage=metrics.add_usage if metrics else None)
+        for chunk in chunks:
+            text_parts.append(chunk)
+            for student in parser.feed(chunk):
+                yield student
+
+    @staticmethod
+    def _emit_rows(df, on_row):
+        """Đẩy toàn bộ dòng của DataFrame cho on_row"""
+        for record in df.to_dict('records'):
+            on_row(record)
+
+    def _is_handwriting_template(self):
+        """Template hiện tại có phải dành cho chữ viết tay không"""
+        template = self.prompt_manager.get_current_template()
+        label = f"{self.prompt_manager.current_template} {template.get('name', '')}".lower()
+        return "handwritten" in label or "viết tay" in label or "viet_tay" in label
+
+    def _extract_with_tesseract(self, image_path, image_bytes, metrics=None):
+        """
+        Trích xuất bằng Tesseract cục bộ
+
+        Returns:
+            Tuple (success, df, raw_response) hoặc None nếu cần chuyển sang Gemini
+        """
+        handwriting = self._is_handwriting_template()
+        if self.ocr_engine == "auto" and handwriting:
+            print("✍️ Template chữ viết tay - dùng Gemini")
+            return None
+
+        try:
+            engine = self._tesseract_engines.get(handwriting)
+            if engine is None:
+                engine = TesseractBackend(self.prompt_manager, handwriting=handwriting)
+                self._tesseract_engines[handwriting] = engine
+            image = self._prepare_image(image_path, image_bytes, metrics)
+            if metrics:
+                with metrics.stage("ocr"):
+                    response_text = engine.generate_content([self._create_prompt(), image]).text
+            else:
+                response_text = engine.generate_content([self._create_prompt(), image]).text
+        except Exception as e:
+            if self.ocr_engine == "tesseract":
+                raise
+            print(f"⚠️ Tesseract lỗi ({str(e)}) - chuyển sang Gemini")
+            return None
+
+        df = self._parse_response_to_dataframe(response_text)
+        print(f"🖨️ Tesseract đọc được {len(df)} dòng")
+        if self.ocr_engine == "auto" and len(df) < OCR_MIN_ROWS:
+            print("↩️ Tesseract không đọc đủ dữ liệu - chuyển sang Gemini")
+            return None
+        return True, df, response_text
+
+    def extract_many(self, image_paths, max_workers=None, ordered=True, on_row=None, job_store=None):
+        """Trích xuất nhiều ảnh song song với pool worker giới hạn
+
+        Args:
+            image_paths: Danh sách (hoặc iterator) đường dẫn ảnh; TIFF nhiều trang / PDF được tách thành
+                         từng trang (PageRef), mỗi trang là một job và chỉ được render khi worker xử lý
+            max_workers: Số worker tối đa (mặc định BATCH_MAX_WORKERS)
+            ordered: True - trả kết quả theo thứ tự đầu vào,
+                     False - trả kết quả ngay khi từng ảnh hoàn thành
+            on_row: Callback on_row(image_path, row) nhận từng dòng ngay khi có (gọi từ thread worker)
+            job_store: JobStore để bỏ qua ảnh đã xong và tiếp tục batch bị gián đoạn; ảnh lỗi
+                       JOB_MAX_ATTEMPTS lần trong cùng phiên (watch / GUI) bị bỏ qua tới khi reset_failed()
+
+        Trang được gửi vào pool dần dần, tối đa 2 x max_workers trang chờ / chưa trả kết quả cùng lúc
+        → bộ nhớ không tăng theo số trang. File không đọc được (TIFF hỏng, PDF khi chưa cài PyMuPDF)
+        trở thành một kết quả lỗi, các file còn lại vẫn được xử lý.
+
+        File giống hệt nội dung trong cùng batch (BATCH_DEDUPE_ENABLED) chỉ được gửi lên API một lần;
+        các bản trùng dùng lại kết quả của file đại diện.
+        Các trang PDF/TIFF không so trùng; ảnh đã xử lý ở lần chạy trước do job_store bỏ qua.
+
+        Yields:
+            Tuple[str, bool, pd.DataFrame, str]: (image_path, success, df, raw_response)
+        """
+        workers = max(1, max_workers or BATCH_MAX_WORKERS)
+        max_in_flight = workers * 2
+        print(f"🚀 Bắt đầu xử lý hàng loạt với {workers} worker")
+
+        def run(image_path, job_key=None):
+            if job_store and job_key:
+                job_store.mark_running(job_key)
+            row_callback = (lambda row: on_row(image_path, row)) if on_row else None
+            success, df, raw_response = self.extract_data_from_image(image_path, on_row=row_callback)
+            if job_store and job_key:
+                if success and not df.empty:
+                    job_store.mark_done(job_key, df)
+                else:
+                    job_store.mark_failed(job_key, raw_response if not success else "Không có dữ liệu")
+            return image_path, success, df, raw_response
+
+        def finished(result):
+            future = Future()
+            future.set_result(result)
+            return future
+
+        def duplicate_of(source_future, path, source_path, job_key=None):
+            # Kết quả của ảnh trùng = kết quả của ảnh đại diện khi nó hoàn thành
+            future = Future()
+
+            def copy_result(source):
+                try:
+                    _, success, df, raw_response = source.result()
+                except BaseException as e:
+                    future.set_exception(e)
+                    return
+                if job_store and job_key:
+                    if success and not df.empty:
+                        job_store.mark_done(job_key, df)
+                    else:
+                        job_store.mark_failed(job_key, raw_response if not success else "Không có dữ liệu")
+                future.set_result((path, success, df.copy(), raw_response))
+
+            source_future.add_done_callback(copy_result)
+            print(f"♻️ {os.path.basename(path)} trùng với {os.path.basename(source_path)} - dùng chung kết quả")
+            return future
+
+        variant = self.get_job_variant()
+        batch_index = {} if self.dedupe_enabled else None  # SHA-256 nội dung → (path, future)
+        counts = {"total": 0, "skipped": 0, "deduped": 0}
+
+        def submit(path):
+            """Future cho một trang: kết quả có sẵn (job cũ, file lỗi, ảnh trùng) hoặc job trong pool"""
+            counts["total"] += 1
+            job_key = None
+            if job_store:
+                try:
+                    job = job_store.enqueue(path, variant=variant)
+                except OSError as e:
+                    # File bị xóa / không đọc được - để extract_data_from_image báo lỗi
+                    print(f"⚠️ Không đăng ký được job cho {path}: {e}")
+                    job = None
+                if job:
+                    job_key = job['job_key']
+                    if job['state'] == JobStore.DONE:
+                        df = job_store.load_result(job)
+                        if df is not None:
+                            counts["skipped"] += 1
+                            return finished((path, True, df, "♻️ Đã xử lý trong lần chạy trước"))
+                    elif (job['state'] == JobStore.FAILED
+                          and job_store.run_attempts(job_key) >= JOB_MAX_ATTEMPTS):
+                        # Chỉ đếm lần thử trong phiên này - lỗi ở lần chạy trước luôn được thử lại
+                        counts["skipped"] += 1
+                        return finished((path, False, pd.DataFrame(),
+                                         f"Bỏ qua sau {JOB_MAX_ATTEMPTS} lần lỗi: {job['error']}"))
+
+            if isinstance(path, PageError):
+                message = f"Không đọc được file: {path.error}"
+                if job_key:
+                    job_store.mark_failed(job_key, message)
+                return finished((str(path), False, pd.DataFrame(), message))
+
+            content_hash = None
+            if batch_index is not None and not isinstance(path, PageRef):
+                content_hash = self._content_hash(path)
+            match = batch_index.get(content_hash) if content_hash else None
+            if match:
+                counts["deduped"] += 1
+                source_path, source_future = match
+                return duplicate_of(source_future, path, source_path, job_key)
+
+            future = executor.submit(run, path, job_key)
+            if content_hash:
+                batch_index[content_hash] = (path, future)
+            return future
+
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr-batch")
+        window = deque()  # future đã gửi, chưa trả kết quả cho người gọi
+        try:
+            for path in expand_pages(image_paths):
+                window.append(submit(path))
+                yield from self._drain_results(window, max_in_flight - 1, ordered)
+            yield from self._drain_results(window, 0, ordered)
+
+            if counts["skipped"]:
+                print(f"♻️ Bỏ qua {counts['skipped']} ảnh đã có kết quả / đã lỗi {JOB_MAX_ATTEMPTS} lần trong phiên này")
+            if counts["deduped"]:
+                print(f"♻️ Phát hiện {counts['deduped']} ảnh trùng - không gọi API lại")
+        finally:
+            # Hủy các ảnh chưa chạy nếu người gọi dừng giữa chừng
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _drain_results(window, keep, ordered):
+        """
+        Trả kết quả các future trong window: mọi future đã xong, và chờ thêm cho tới khi
+        window còn tối đa keep future (ordered - theo thứ tự gửi)
+        """
+        while window:
+            if ordered:
+                if len(window) <= keep and not window[0].done():
+                    return
+                yield window.popleft().result()
+                continue
+
+            done = [future for future in window if future.done()]
+            if not done:
+                if len(window) <= keep:
+                    return
+                done, _ = wait(window, return_when=FIRST_COMPLETED)
+            for future in done:
+                window.remove(future)
+                yield future.result()
+
+    def _content_hash(self, image_path):
+        """SHA-256 nội dung file để gộp file trùng (None nếu không đọc được)"""
+        try:
+            return JobStore.hash_file(image_path)
+        except OSError as e:
+            print(f"⚠️ Không tính được hash ảnh {image_path}: {e}")
+            return None
+
+    def _should_tile(self, image_bytes):
+        """Kiểm tra ảnh có đủ dài để chia dải không (chỉ đọc header ảnh)"""
+        if not self.tiling_enabled or TILE_COUNT < 2:
+            return False
+
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            width, height = image.size
+            # EXIF orientation 5-8: ảnh sẽ bị xoay 90 độ
+            if image.getexif().get(0x0112) in (5, 6, 7, 8):
+                width, height = height, width
+
+        return width > 0 and height / width >= TILE_MIN_ASPECT_RATIO
+
+    def _extract_tiled(self, image_path, image_bytes, prompt, metrics=None):
+        """Chia ảnh thành các dải ngang chồng lấn, trích xuất song song rồi ghép lại"""
+        with Image.open(io.BytesIO(image_bytes)) as original:
+            image = ImageOps.exif_transpose(original)
+
+        # Cắt vùng bảng trên ảnh nguyên trước khi chia dải
+        if self.image_normalizer:
+            image, crop_box = self.image_normalizer.crop_table(image)
+            if crop_box:
+                print(f"✂️ Cắt vùng bảng: {crop_box}")
+
+        width, height = image.size
+        strip_height = -(-height // TILE_COUNT)
+        overlap = int(strip_height * TILE_OVERLAP)
+        boxes = [
+            (0, max(0, i * strip_height - overlap), width, min(height, (i + 1) * strip_height + overlap))
+            for i in range(TILE_COUNT)
+        ]
+        print(f"🧩 Chia ảnh {image.size} thành {len(boxes)} dải (chồng lấn {overlap}px)")
+
+        def run(index, box):
+            strip = image.crop(box)
+            if self.image_normalizer:
+                strip = self.image_normalizer.encode_image(self.image_normalizer.normalize_image(strip, crop=False))
+            strip_prompt = prompt + (
+                f"\n\n⚠️ ẢNH NÀY LÀ DẢI {index + 1}/{len(boxes)} CẮT NGANG TỪ MỘT BẢNG DÀI:\n"
+                "- Chỉ trích xuất các dòng sinh viên hiển thị ĐẦY ĐỦ trong ảnh\n"
+                "- Bỏ qua dòng bị cắt dở ở mép trên/dưới\n"
+                "- Giữ nguyên STT như trong ảnh, KHÔNG đánh số lại"
+            )
+            response_text = self._call_gemini_vision_api(strip, strip_prompt, metrics)
+            students = self._parse_response_to_students(response_text)
+            print(f"🧩 Dải {index + 1}/{len(boxes)}: {len(students)} dòng")
+            return students
+
+        with ThreadPoolExecutor(max_workers=len(boxes), thread_name_prefix="ocr-tile") as executor:
+            strip_results = list(executor.map(run, range(len(boxes)), boxes))
+
+        students = self._stitch_students(strip_results)
+        print(f"🧵 Ghép {sum(len(r) for r in strip_results)} dòng từ các dải → {len(students)} sinh viên")
+        return json.dumps({"students": students}, ensure_ascii=False)
+
+    @staticmethod
+    def _stitch_students(strip_results):
+        """Ghép danh sách sinh viên từ các dải, loại trùng ở vùng chồng lấn theo MSV/STT"""
+        stitched = []
+        seen_keys = set()
+        for students in strip_results:
+            for student in students:
+                msv = ''.join(ch for ch in str(student.get('msv', '')) if ch.isalnum())
+                stt = str(student.get('stt', '')).strip()
+                if msv:
+                    key = ('msv', msv)
+                elif stt:
+                    key = ('stt', stt)
+                else:
+                    stitched.append(student)
+                    continue
+
+                if key in seen_keys:
+                    continue
+                seen_keys.add(key)
+                stitched.append(student)
+        return stitched
+
+    def reextract_suspect_rows(self, image_path, df, suspects=None, validator=None):
+        """
+        Gọi lại Gemini chỉ cho các dòng nghi sai thay vì cả bảng
+
+        Vị trí dọc của mỗi dòng được ước lượng theo thứ tự dòng (bảng coi như các dòng cao bằng nhau,
+        có một dòng tiêu đề). Mỗi nhóm dòng nghi sai được cắt thành một dải nhỏ (kèm dải tiêu đề để
+        Gemini biết cột nào là cột nào), gọi API cho từng dải rồi ghép lại theo STT / MSV.
+
+        Args:
+            image_path: Ảnh / PageRef đã trích xuất ra df
+            df: DataFrame CHƯA làm sạch (kết quả extract_data_from_image)
+            suspects: Kết quả DataValidator.find_suspect_rows (None → tự tìm)
+            validator: DataValidator dùng để kiểm tra dòng mới (None → tạo mới)
+
+        Returns:
+            Tuple[DataFrame, dict]: (DataFrame đã thay dòng sửa được, báo cáo)
+        """
+        if validator is None:
+            from data_validator import DataValidator
+            validator = DataValidator()
+        if suspects is None:
+            suspects = validator.find_suspect_rows(df)
+
+        report = {"suspects": len(suspects), "bands": 0, "fixed": 0, "inserted": 0, "remaining": len(suspects)}
+        if not suspects or df.empty:
+            return df, report
+        if self.backend is None or self.ocr_engine == "tesseract":
+            print("⚠️ Gọi lại từng dòng cần Gemini - bỏ qua")
+            return df, report
+
+        # Vị trí (slot) của từng dòng trong bảng, tính cả các dòng bị thiếu
+        missing_before = {s["index"]: len(s["missing"]) for s in suspects}
+        slots = []
+        slot = -1
+        for position in range(len(df)):
+            slot += 1 + missing_before.get(position, 0)
+            slots.append(slot)
+        total_slots = slots[-1] + 1
+
+        # Gộp các dòng nghi sai gần nhau thành dải
+        padding = REEXTRACT_BAND_PADDING_ROWS
+        bands = []
+        for suspect in suspects:
+            first = slots[suspect["index"]] - len(suspect["missing"])
+            last = slots[suspect["index"]]
+            start, end = first - padding, last + 1 + padding
+            if bands and start <= bands[-1]["end"]:
+                bands[-1]["end"] = max(bands[-1]["end"], end)
+                bands[-1]["suspects"].append(suspect)
+            else:
+                bands.append({"start": start, "end": end, "suspects": [suspect]})
+        if len(bands) > REEXTRACT_MAX_BANDS:
+            print(f"⚠️ Cần {len(bands)} dải (> {REEXTRACT_MAX_BANDS}) - nên trích xuất lại cả bảng")
+            return df, report
+        report["bands"] = len(bands)
+
+        metrics = ExtractionMetrics(image_path, backend=self.backend_name,
+                                    template=self.get_prompt_variant() + ":rows")
+        metrics.engine = "gemini"
+        try:
+            with metrics.stage("read"):
+                image_bytes = read_page_bytes(image_path)
+            metrics.bytes_read = len(image_bytes)
+
+            with metrics.stage("prepare"):
+                with Image.open(io.BytesIO(image_bytes)) as original:
+                    image = ImageOps.exif_transpose(original)
+                if self.image_normalizer:
+                    image, _ = self.image_normalizer.crop_table(image)
+            width, height = image.size
+            row_height = height / (total_slots + 1)  # +1: dòng tiêu đề
+            header = image.crop((0, 0, width, min(height, int(row_height * 1.5))))
+
+            prompt = self._create_prompt() + (
+                "\n\n⚠️ ẢNH NÀY GỒM DÒNG TIÊU ĐỀ VÀ MỘT ĐOẠN CẮT TỪ GIỮA BẢNG:\n"
+                "- Chỉ trích xuất các dòng sinh viên hiển thị ĐẦY ĐỦ trong ảnh\n"
+                "- Bỏ qua dòng bị cắt dở ở mép trên/dưới\n"
+                "- Giữ nguyên STT như trong ảnh, KHÔNG đánh số lại"
+            )
+
+            def run(band):
+                top = max(int(row_height), int((band["start"] + 1) * row_height))
+                bottom = min(height, int((band["end"] + 1) * row_height) + 1)
+                piece = Image.new(image.mode, (width, header.height + bottom - top), "white")
+                piece.paste(header, (0, 0))
+                piece.paste(image.crop((0, top, width, bottom)), (0, header.height))
+                if self.image_normalizer:
+                    piece = self.image_normalizer.encode_image(
+                        self.image_normalizer.normalize_image(piece, crop=False))
+                response_text = self._call_gemini_vision_api(piece, prompt, metrics)
+                return self._parse_response_to_students(response_text)
+
+            with ThreadPoolExecutor(max_workers=len(bands), thread_name_prefix="ocr-rows") as executor:
+                band_results = list(executor.map(run, bands))
+
+            with metrics.stage("parse"):
+                df, fixed, inserted = self._merge_band_rows(df, bands, band_results, validator)
+        except Exception as e:
+            print(f"❌ Lỗi gọi lại dòng nghi sai: {str(e)}")
+            self._record_metrics(metrics, False, error=e)
+            return df, report
+
+        report.update(fixed=fixed, inserted=inserted,
+                      remaining=len(validator.find_suspect_rows(df)))
+        self._record_metrics(metrics, True, fixed + inserted)
+        print(f"🩹 Gọi lại {len(bands)} dải: sửa {fixed} dòng, thêm {inserted} dòng thiếu")
+        return df, report
+
+    def _merge_band_rows(self, df, bands, band_results, validator):
+        """Thay dòng nghi sai bằng dòng đọc lại (nếu ít lỗi hơn) và chèn các dòng bị thiếu"""
+        columns_config = self.prompt_manager.get_current_columns()
+        headers = self._get_headers(columns_config)
+        header_of = {col.get('key'): header for col, header in zip(columns_config, headers)}
+        stt_header, msv_header = header_of.get('stt'), header_of.get('msv')
+
+        def digits(value):
+            return ''.join(ch for ch in str(value) if ch.isdigit())
+
+        rows = df.to_dict('records')
+        inserts = {}  # vị trí → các dòng chèn vào trước dòng đó
+        fixed = 0
+        for band, students in zip(bands, band_results):
+            candidates = [dict(zip(headers, self._student_to_row(dict(student), columns_config, i)))
+                          for i, student in enumerate(students)]
+            by_stt = {str(row.get(stt_header, '')).strip(): row for row in candidates if stt_header}
+            by_msv = {digits(row.get(msv_header, '')): row for row in candidates if msv_header}
+
+            for suspect in band["suspects"]:
+                index = suspect["index"]
+                old = rows[index]
+                new = by_stt.get(suspect["stt"]) if suspect["stt"].isdigit() else None
+                if new is None and msv_header:
+                    new = by_msv.get(digits(old.get(msv_header, '')))
+                if new is not None and len(validator.row_issues(new)) < len(validator.row_issues(old)):
+                    rows[index] = {column: new.get(column, old.get(column, '')) for column in df.columns}
+                    fixed += 1
+                found = [by_stt[stt] for stt in suspect["missing"] if stt in by_stt]
+                if found:
+                    inserts[index] = [{column: row.get(column, '') for column in df.columns} for row in found]
+
+        merged = []
+        for index, row in enumerate(rows):
+            merged.extend(inserts.get(index, []))
+            merged.append(row)
+        inserted = sum(len(found) for found in inserts.values())
+        return pd.DataFrame(merged, columns=df.columns), fixed, inserted
+
+    def _prepare_image(self, image_path, image_bytes, metrics=None):
+        """Chuẩn hóa ảnh (nếu bật) và ghi nhận kích thước trước/sau"""
+        if metrics:
+            with metrics.stage("prepare"):
+                return self._prepare_image(image_path, image_bytes)
+
+        if not self.image_normalizer:
+            image = Image.open(io.BytesIO(image_bytes))
+            image.info["source_bytes"] = len(image_bytes)  # dung lượng gửi lên (ước lượng)
+            print(f"📸 Đã mở ảnh thành công: {image.size}")
+            return image
+
+        blob, stats = self.image_normalizer.normalize(image_bytes)
+        stats["image_path"] = str(image_path)
+        with self._stats_lock:
+            self.image_stats.append(stats)
+
+        if stats['crop_box']:
+            print(f"✂️ Cắt vùng bảng: {stats['crop_box']}")
+        print(f"📸 Chuẩn hóa ảnh: {stats['size_before']} → {stats['size_after']}, "
+              f"{stats['bytes_before'] / 1024:.0f} KB → {stats['bytes_after'] / 1024:.0f} KB "
+              f"({stats['ratio']:.0%}, {stats['encoding']})")
+        return blob
+
+    @staticmethod
+    def _payload_size(image):
+        """Dung lượng ảnh gửi lên API (bytes)"""
+        if isinstance(image, dict):
+            return len(image.get("data", b""))
+        return getattr(image, "info", {}).get("source_bytes", 0)
+
+    def _call_gemini_vision_api(self, image, prompt, metrics=None):
         """Gọi Gemini Vision API"""
         try:
-            # Tạo content với ảnh và prompt
-            response = self.model.generate_content([prompt, image])
+            if self.backend is None:
+                raise Exception("Chưa cấu hình API Key / backend")
+
+            # Tạo content với ảnh và prompt - đi qua limiter dùng chung,
+            # mỗi lần thử có deadline riêng (và request dự phòng nếu bật hedging)
+            generation_config = self._create_generation_config()
+            backend = self.backend
+            request = lambda: backend.generate_content([prompt, image], generation_config=generation_config,
+                                                       timeout=self.request_policy.timeout)
+            # Request dự phòng chỉ gửi khi limiter còn token rảnh ngay lập tức
+            can_hedge = lambda: self.rate_limiter.acquire(timeout=0)
+            if metrics:
+                metrics.add_upload(self._payload_size(image))
+                self.rate_limiter.take_thread_wait()
+                with metrics.stage("api"):
+                    response = self.rate_limiter.call(self.request_policy.call, request, can_hedge=can_hedge)
+                metrics.split_wait("api", self.rate_limiter.take_thread_wait())
+                metrics.add_usage(getattr(response, "usage_metadata", None))
+            else:
+                response = self.rate_limiter.call(self.request_policy.call, request, can_hedge=can_hedge)
 
             if response and response.text:
                 return response.text
             else:
                 raise Exception("Không nhận được response từ Gemini")
 
+        except QuotaExceededError:
+            raise
         except Exception as e:
             raise Exception(f"Lỗi Gemini API: {str(e)}")
     
+    @property
+    def backend_name(self):
+        """Tên model/backend đang dùng (một phần khóa cache)"""
+        return self.backend.model_name if self.backend else GEMINI_MODEL
+
     def _create_prompt(self):
         """Tạo prompt cho Gemini từ template hiện tại"""
-        return self.prompt_manager.get_current_prompt()
+        prompt = self.prompt_manager.get_current_prompt()
+        if self.compact_prompt:
+            compact = self.prompt_manager.get_current_compact_prompt()
+            # Template vốn đã ngắn thì giữ nguyên prompt gốc
+            if len(compact.encode('utf-8')) < len(prompt.encode('utf-8')):
+                return compact
+        return prompt
+
+    def get_prompt_variant(self):
+        """Tên template (kèm ':compact' nếu dùng prompt rút gọn) - nhãn cho metrics / log"""
+        variant = self.prompt_manager.current_template
+        return f"{variant}:compact" if self.compact_prompt else variant
+
+    def get_job_variant(self):
+        """
+        Variant cho job store: tên template + hash của prompt và cấu hình cột
+
+        Sửa prompt / cột của template trong cài đặt → khóa job mới, ảnh cũ được trích xuất lại
+        thay vì trả DataFrame đã lưu theo cấu hình cũ (giống ResponseCache.make_key).
+        """
+        columns = json.dumps(self.prompt_manager.get_current_columns(), sort_keys=True, ensure_ascii=False)
+        config_hash = hashlib.sha256((self._create_prompt() + "\n" + columns).encode('utf-8')).hexdigest()
+        return f"{self.get_prompt_variant()}:{config_hash[:16]}"
+
+    def _create_generation_config(self):
+        """Cấu hình sinh JSON theo schema của template (None nếu tắt JSON mode)"""
+        if not GEMINI_JSON_MODE:
+            return None
+        return {
+            "response_mime_type": "application/json",
+            "response_schema": self.prompt_manager.get_current_response_schema()
+        }
     
 
     
 
     
-    def _parse_response_to_dataframe(self, response_text):
-        """Parse response thành DataFrame"""
+    def _parse_response_to_students(self, response_text):
+        """Parse response thành danh sách sinh viên (dict)"""
+        # JSON mode: response là JSON thuần - chỉ cần load một lần
+        try:
+            data = json.loads(response_text)
+            if isinstance(data, dict):
+                return data.get('students') or []
+        except ValueError:
+            pass
+
         try:
-            # Tìm JSON trong response
+            # Response dạng tự do: tìm JSON trong response
             json_start = response_text.find('{')
             json_end = response_text.rfind('}') + 1
             
             if json_start != -1 and json_end > json_start:
                 json_str = response_text[json_start:json_end]
                 data = json.loads(json_str)
-                
-                if 'students' in data and data['students']:
-                    students = data['students']
-                    
-                    # Lấy cấu trúc cột từ template hiện tại
-                    columns_config = self.prompt_manager.get_current_columns()
-
-                    # Tạo DataFrame với cấu trúc động
-                    df_data = []
-                    for i, student in enumerate(students):
-                        row = []
-
-                        # Xử lý từng cột theo cấu hình
-                        for col_config in columns_config:
-                            col_key = col_config.get('key', '')
-                            value = student.get(col_key, '').strip()
-
-                            # Xử lý đặc biệt cho tên (nếu có cả ho và ten)
-                            if col_key == 'ho' and 'ten' in [c.get('key') for c in columns_config]:
-                                ho = student.get('ho', '').strip()
-                                ten = student.get('ten', '').strip()
-
-                                # DEBUG: In ra để kiểm tra
-                                print(f"Student {i+1}: ho='{ho}', ten='{ten}'")
-
-                                # VALIDATION: Kiểm tra phân chia tên
-                                if ho and ten:
-                                    ho_words = ho.split()
-                                    ten_words = ten.split()
-
-                                    # Kiểm tra các trường hợp lỗi phân chia tên
-                                    needs_fix = False
-
-                                    # Trường hợp 1: ho có 1 từ, ten có nhiều từ
-                                    if len(ho_words) == 1 and len(ten_words) > 1:
-                                        print(f"⚠️ PHÁT HIỆN LỖI PHÂN CHIA TÊN (Type 1): ho='{ho}' (1 từ), ten='{ten}' ({len(ten_words)} từ)")
-                                        needs_fix = True
-
-                                    # Trường hợp 2: ten có nhiều từ (bất kể ho có bao nhiêu từ)
-                                    elif len(ten_words) > 1:
-                                        print(f"⚠️ PHÁT HIỆN LỖI PHÂN CHIA TÊN (Type 2): ten='{ten}' có {len(ten_words)} từ (phải chỉ có 1 từ)")
-                                        needs_fix = True
-
-                                    # Trường hợp 3: ho trống nhưng ten có nhiều từ
-                                    elif not ho and len(ten_words) > 1:
-                                        print(f"⚠️ PHÁT HIỆN LỖI PHÂN CHIA TÊN (Type 3): ho trống, ten='{ten}' có {len(ten_words)} từ")
-                                        needs_fix = True
-
-                                    if needs_fix:
-                                        # Tự động sửa: ghép lại và phân chia đúng
-                                        full_name = f"{ho} {ten}".strip()
-                                        name_parts = full_name.split()
-                                        if len(name_parts) >= 2:
-                                            ho = " ".join(name_parts[:-1])  # Tất cả trừ từ cuối
-                                            ten = name_parts[-1]  # Từ cuối
-                                            print(f"✅ ĐÃ SỬA: ho='{ho}', ten='{ten}'")
-                                            # Cập nhật lại trong student data
-                                            student['ho'] = ho
-                                            student['ten'] = ten
-                                        elif len(name_parts) == 1:
-                                            # Chỉ có 1 từ - để làm tên, ho để trống
-                                            ho = ""
-                                            ten = name_parts[0]
-                                            print(f"✅ ĐÃ SỬA (1 từ): ho='', ten='{ten}'")
-                                            student['ho'] = ho
-                                            student['ten'] = ten
-
-                                value = ho
-
-                            row.append(value)
-
-                        df_data.append(row)
-
-                    # Tạo headers từ cấu hình cột
-                    headers = [col.get('name', col.get('key', '')) for col in columns_config]
-
-                    df = pd.DataFrame(df_data, columns=headers)
-
-                    # Làm sạch tên cột - loại bỏ dấu ngoặc kép thừa
-                    df.columns = [col.replace('"', '').strip() for col in df.columns]
-
-                    print(f"📊 DataFrame columns: {list(df.columns)}")
-                    return df
+                return data.get('students') or []
                     
         except Exception as e:
             print(f"Lỗi parse JSON: {e}")
             print(f"Response: {response_text}")
-        
-        # Fallback - tạo DataFrame trống
-        return pd.DataFrame()
-    
 
+        return []
+
+    def _parse_response_to_dataframe(self, response_text):
+        """Parse response thành DataFrame"""
+        students = self._parse_response_to_students(response_text)
+        if not students:
+            # Fallback - tạo DataFrame trống
+            return pd.DataFrame()
+        return self._students_to_dataframe(students)
+
+    def _students_to_dataframe(self, students):
+        """Tạo DataFrame từ danh sách sinh viên theo cấu trúc cột của template (điền theo cột)"""
+        keys, headers, split_name = self._column_plan(self.prompt_manager.get_current_columns())
+
+        # Một list giá trị cho mỗi cột, điền trong một lượt duyệt
+        columns = [[] for _ in keys]
+        fixed_names = 0
+        for student in students:
+            if split_name:
+                ho, ten, fixed = self._split_name(student.get('ho'), student.get('ten'))
+                fixed_names += fixed
+            for values, key in zip(columns, keys):
+                if split_name and key == 'ho':
+                    values.append(ho)
+                elif split_name and key == 'ten':
+                    values.append(ten)
+                else:
+                    values.append(self._cell_text(student.get(key)))
+
+        df = pd.DataFrame(dict(enumerate(columns)), index=range(len(students)))
+        df.columns = headers
+        if fixed_names:
+            print(f"✅ Đã sửa phân chia họ/tên cho {fixed_names} sinh viên")
+        print(f"📊 DataFrame columns: {list(df.columns)}")
+        return df
+
+    @staticmethod
+    def _get_headers(columns_config):
+        """Tạo headers từ cấu hình cột - loại bỏ dấu ngoặc kép thừa"""
+        return [col.get('name', col.get('key', '')).replace('"', '').strip() for col in columns_config]
+
+    def _column_plan(self, columns_config):
+        """(keys, headers, có tách họ/tên) của cấu hình cột - tính một lần cho mỗi template"""
+        signature = tuple((col.get('key', ''), col.get('name')) for col in columns_config)
+        plan = self._column_plans.get(signature)
+        if plan is None:
+            keys = tuple(key for key, _ in signature)
+            plan = (keys, self._get_headers(columns_config), 'ho' in keys and 'ten' in keys)
+            self._column_plans[signature] = plan
+        return plan
+
+    @staticmethod
+    def _cell_text(value):
+        """Giá trị ô dạng chuỗi đã bỏ khoảng trắng (JSON có thể trả số hoặc null)"""
+        if value is None:
+            return ''
+        return value.strip() if isinstance(value, str) else str(value).strip()
+
+    @classmethod
+    def _split_name(cls, ho, ten):
+        """
+        Sửa lỗi phân chia họ/tên: "ten" chỉ được có một từ (từ cuối), phần còn lại thuộc "ho"
+
+        Returns:
+            Tuple[str, str, bool]: (ho, ten, có sửa hay không)
+        """
+        ho, ten = cls._cell_text(ho), cls._cell_text(ten)
+        if len(ten.split()) < 2:
+            return ho, ten, False
+        # ten có nhiều từ (kể cả khi ho trống hoặc ho chỉ có một từ) → ghép lại và tách lại
+        name_parts = f"{ho} {ten}".split()
+        return " ".join(name_parts[:-1]), name_parts[-1], True
+
+    def _student_to_row(self, student, columns_config, index):
+        """Chuyển một sinh viên (dict) thành một dòng theo cấu hình cột (dùng khi stream từng dòng)"""
+        keys, _, split_name = self._column_plan(columns_config)
+        if split_name:
+            ho, ten, fixed = self._split_name(student.get('ho'), student.get('ten'))
+            if fixed:
+                print(f"✅ Sinh viên {index + 1}: đã sửa phân chia tên → ho='{ho}', ten='{ten}'")
+            student = {**student, 'ho': ho, 'ten': ten}
+        return [self._cell_text(student.get(key)) for key in keys]
 
     def get_last_response(self):
         """Lấy response cuối cùng từ API"""
         return self.last_response
+
+    def get_image_stats(self):
+        """Lấy thống kê bytes trước/sau chuẩn hóa của các ảnh đã gửi"""
+        with self._stats_lock:
+            return list(self.image_stats)
+
+    def get_cache_stats(self):
+        """Lấy thống kê cache response"""
+        if not self.response_cache:
+            return {}
+        return self.response_cache.get_stats()
+
+    def _record_metrics(self, metrics, success, rows=0, error=None):
+        """Lưu số liệu một lần trích xuất"""
+        metrics.finish(success, rows=rows, error=error)
+        with self._stats_lock:
+            self.metrics.append(metrics)
+            self._unsaved_metrics.append(metrics)
+            # Không có database: chỉ giữ số bản ghi chờ giới hạn
+            del self._unsaved_metrics[:-METRICS_HISTORY_SIZE]
+        stages = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in metrics.stages.items())
+        print(f"⏱️ {metrics.duration:.2f}s ({stages}) | gửi {metrics.bytes_sent / 1024:.0f} KB | "
+              f"token {metrics.prompt_tokens} → {metrics.response_tokens}")
+
+    def record_corrections(self, image_path, corrections):
+        """Ghi số lỗi DataValidator đã sửa vào số liệu lần trích xuất gần nhất của ảnh"""
+        image_path = str(image_path)
+        with self._stats_lock:
+            for metrics in reversed(self.metrics):
+                if metrics.image_path == image_path:
+                    metrics.corrections = corrections
+                    return True
+        return False
+
+    def get_metrics(self, summary=False):
+        """
+        Số liệu các lần trích xuất gần nhất (tối đa METRICS_HISTORY_SIZE)
+
+        Args:
+            summary: True - trả về bảng tổng hợp (tổng thời gian từng bước, bytes, token...)
+
+        Returns:
+            List[dict] hoặc dict tổng hợp
+        """
+        with self._stats_lock:
+            records = [metrics.to_dict() for metrics in self.metrics]
+        return summarize_metrics(records) if summary else records
+
+    def get_request_stats(self):
+        """Thống kê deadline / hedging của các request Gemini"""
+        return self.request_policy.get_stats()
+
+    def save_metrics(self, db_manager):
+        """
+        Ghi các số liệu chưa lưu vào bảng OCR_Sessions (một lần ghi cho cả lô)
+
+        Returns:
+            Tuple[bool, str, int]: (success, message, số bản ghi)
+        """
+        with self._stats_lock:
+            pending, self._unsaved_metrics = self._unsaved_metrics, []
+        if not pending:
+            return True, "Không có số liệu mới", 0
+
+        success, message, count = db_manager.insert_ocr_sessions(pending)
+        if not success:
+            # Giữ lại để ghi ở lần sau
+            with self._stats_lock:
+                self._unsaved_metrics = pending + self._unsaved_metrics
+        return success, message, count
@@ -0,0 +1,123 @@
+# page_source.py - Tách file nhiều trang (TIFF, PDF) thành từng trang, đọc lười từng trang một
+
+import io
+import os
+from PIL import Image
+from config import *
+
+MULTIPAGE_TIFF_EXTENSIONS = ('.tif', '.tiff')
+PDF_EXTENSIONS = ('.pdf',)
+
+class PageRef:
+    """Tham chiếu tới một trang trong file nhiều trang (chỉ render khi cần)"""
+
+    __slots__ = ("path", "index", "count")
+
+    def __init__(self, path, index, count=None):
+        self.path = path
+        self.index = index
+        self.count = count
+
+    def __str__(self):
+        return f"{self.path}#trang{self.index + 1}"
+
+    def __repr__(self):
+        return f"PageRef({self.path!r}, {self.index}, {self.count})"
+
+    def __eq__(self, other):
+        return isinstance(other, PageRef) and (self.path, self.index) == (other.path, other.index)
+
+    def __hash__(self):
+        return hash((self.path, self.index))
+
+    def read_bytes(self):
+        """Render trang thành bytes ảnh"""
+        if is_pdf(self.path):
+            return _render_pdf_page(self.path, self.index)
+        return _render_tiff_frame(self.path, self.index)
+
+class PageError:
+    """File không tách được trang (hỏng, thiếu thư viện đọc PDF...) - được trả về như một kết quả lỗi"""
+
+    __slots__ = ("path", "error")
+
+    def __init__(self, path, error):
+        self.path = path
+        self.error = error
+
+    def __str__(self):
+        return str(self.path)
+
+    def __repr__(self):
+        return f"PageError({self.path!r}, {self.error!r})"
+
+def is_pdf(path):
+    return str(path).lower().endswith(PDF_EXTENSIONS)
+
+def _open_pdf(path):
+    """Mở PDF bằng PyMuPDF (thư viện tùy chọn)"""
+    try:
+        import fitz
+    except ImportError:
+        raise Exception("Chưa cài PyMuPDF để đọc PDF - chạy: pip install PyMuPDF")
+    return fitz.open(path)
+
+def _render_pdf_page(path, index):
+    """Render một trang PDF thành PNG với độ phân giải PDF_RENDER_DPI"""
+    with _open_pdf(path) as document:
+        pixmap = document.load_page(index).get_pixmap(dpi=PDF_RENDER_DPI)
+        return pixmap.tobytes("png")
+
+def _render_tiff_frame(path, index):
+    """Lấy một frame TIFF và mã hóa lại thành PNG (chỉ frame đó nằm trong bộ nhớ)"""
+    with Image.open(path) as image:
+        image.seek(index)
+        # PNG không lưu được CMYK, YCbCr... → chuyển về RGB
+        frame = image.copy() if image.mode in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA') else image.convert('RGB')
+    buffer = io.BytesIO()
+    frame.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def count_pages(path):
+    """Số trang của file (ảnh thường = 1)"""
+    if is_pdf(path):
+        with _open_pdf(path) as document:
+            return document.page_count
+    if str(path).lower().endswith(MULTIPAGE_TIFF_EXTENSIONS):
+        with Image.open(path) as image:
+            return getattr(image, "n_frames", 1)
+    return 1
+
+def expand_pages(paths):
+    """
+    Mở rộng danh sách file thành danh sách trang (generator)
+
+    Ảnh một trang giữ nguyên đường dẫn; TIFF nhiều trang và PDF thành các PageRef.
+    Chỉ đọc header/số trang, không render trang nào. File không đọc được thành PageError
+    (không dừng cả danh sách vì một file hỏng).
+    """
+    for path in paths:
+        if isinstance(path, (PageRef, PageError)):
+            yield path
+            continue
+        try:
+            count = count_pages(path)
+        except Exception as e:
+            print(f"❌ Không đọc được {os.path.basename(path)}: {e}")
+            yield PageError(path, e)
+            continue
+        if count > 1 or is_pdf(path):
+            print(f"📄 {os.path.basename(path)}: {count} trang")
+            for index in range(count):
+                yield PageRef(path, index, count)
+        else:
+            yield path
+
+def read_page_bytes(source):
+    """Bytes ảnh của một nguồn: PageRef, PDF (trang đầu) hoặc file ảnh"""
+    if isinstance(source, PageRef):
+        return source.read_bytes()
+    if is_pdf(source):
+        return _render_pdf_page(source, 0)
+    with open(source, 'rb') as f:
+        return f.read()
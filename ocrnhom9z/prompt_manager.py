@@ -465,7 +465,124 @@ GEMINI - HÃY ĐỌC CHÍNH XÁC!"""
         template = self.get_current_template()
         return template.get("columns", [])
     
+    def build_response_schema(self, columns: Optional[List[Dict]] = None) -> Dict:
+        """Tạo response schema JSON {"students": [...]} từ cấu trúc cột"""
+        if columns is None:
+            columns = self.get_current_columns()
+
+        properties = {}
+        for col in columns:
+            key = col.get('key', '')
+            if not key:
+                continue
+            properties[key] = {
+                "type": "STRING",
+                "description": col.get('description') or col.get('name', key)
+            }
+
+        return {
+            "type": "OBJECT",
+            "properties": {
+                "students": {
+                    "type": "ARRAY",
+                    "items": {
+                        "type": "OBJECT",
+                        "properties": properties,
+                        # Chỉ bắt buộc cột định danh dòng - cột không có trong bảng thì được bỏ trống
+                        "required": [key for key in ("stt", "msv") if key in properties]
+                    }
+                }
+            },
+            "required": ["students"]
+        }
+
+    def get_current_response_schema(self) -> Dict:
+        """Lấy response schema của template hiện tại"""
+        return self.build_response_schema(self.get_current_columns())
+
     def get_current_validation_rules(self) -> Dict:
         """Lấy quy tắc validation của template hiện tại"""
         template = self.get_current_template()
         return template.get("validation_rules", {})
+
+    def build_compact_prompt(self, template: Optional[Dict] = None) -> str:
+        """
+        Tạo prompt rút gọn từ cấu trúc cột + quy tắc validation của template
+
+        Giữ nguyên ngữ nghĩa (cột, định dạng MSV/lớp, khoảng điểm, cách tách họ/tên)
+        nhưng bỏ emoji, ví dụ JSON và các đoạn lặp lại - prompt được gửi lại với mỗi ảnh.
+        """
+        if template is None:
+            template = self.get_current_template()
+        columns = template.get("columns", [])
+        rules = template.get("validation_rules", {})
+        keys = [col.get("key") for col in columns if col.get("key")]
+
+        lines = ['Trích xuất bảng điểm sinh viên trong ảnh (chữ in hoặc viết tay) thành JSON {"students": [...]}, '
+                 'mỗi dòng bảng một object, giữ đúng thứ tự.',
+                 "Cột (key: ý nghĩa):"]
+        for col in columns:
+            if col.get("key"):
+                lines.append(f"- {col['key']}: {col.get('description') or col.get('name', col['key'])}")
+
+        lines.append("Quy tắc:")
+        lines.append("- Chỉ xuất cột thực sự có trong bảng; không tự thêm cột, không giải thích.")
+        lines.append("- Đọc từng ký tự, không đoán bừa; phân biệt 0/O, 1/I/l, 5/S, 6/G.")
+        lines.append("- Tên tiếng Việt ghi đủ dấu, đọc hết mọi từ, không cắt ngắn.")
+        if "ho" in keys and "ten" in keys:
+            lines.append('- ho = họ + tên đệm, ten = chỉ từ cuối ("Nguyễn Vũ Yến Nhi" → ho "Nguyễn Vũ Yến", ten "Nhi").')
+        if rules.get("msv_pattern"):
+            lines.append(f"- MSV khớp regex {rules['msv_pattern']}.")
+        if rules.get("class_pattern"):
+            lines.append(f"- Lớp khớp regex {rules['class_pattern']} (VD CNTT 17-02).")
+        if rules.get("score_range"):
+            low, high = rules["score_range"]
+            lines.append(f"- Điểm là số thập phân dùng dấu chấm, trong [{low:g}, {high:g}].")
+        if rules.get("gpa_range"):
+            low, high = rules["gpa_range"]
+            lines.append(f"- Điểm hệ 4 trong [{low:g}, {high:g}].")
+        if rules.get("letter_grades"):
+            lines.append(f"- Điểm chữ thuộc: {', '.join(rules['letter_grades'])}.")
+        lines.append("- Không để trống tên; chữ mờ thì đọc gần đúng nhất theo ngữ cảnh.")
+        return "\n".join(lines)
+
+    def get_current_compact_prompt(self) -> str:
+        """Lấy prompt rút gọn của template hiện tại"""
+        return self.build_compact_prompt(self.get_current_template())
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """
+        Ước lượng số token của prompt khi không gọi được countTokens
+
+        Tokenizer của Gemini tính tiếng Việt có dấu và emoji tốn hơn chữ ASCII,
+        nên ước lượng theo số byte UTF-8 (~4 byte / token) thay vì số ký tự.
+        """
+        return max(1, round(len(text.encode("utf-8")) / 4)) if text else 0
+
+    def get_prompt_token_report(self, count_tokens=None) -> List[Dict]:
+        """
+        Chi phí token của prompt gốc và prompt rút gọn cho từng template
+
+        Args:
+            count_tokens: Hàm đếm token chính xác (VD backend.count_tokens), None → ước lượng
+
+        Returns:
+            List[dict]: template, chars, tokens, compact_tokens, saved (tỷ lệ tiết kiệm)
+        """
+        count = count_tokens or self.estimate_tokens
+        report = []
+        for name, template in self.templates.items():
+            prompt = template.get("prompt_template", "")
+            compact = self.build_compact_prompt(template)
+            tokens = count(prompt)
+            compact_tokens = count(compact)
+            report.append({
+                "template": name,
+                "chars": len(prompt),
+                "tokens": tokens,
+                "compact_chars": len(compact),
+                "compact_tokens": compact_tokens,
+                "saved": 1 - compact_tokens / tokens if tokens else 0.0
+            })
+        return report
@@ -0,0 +1,183 @@
+# rate_limiter.py - Giới hạn tốc độ gọi Gemini API dùng chung cho toàn tiến trình
+
+import random
+import threading
+import time
+from config import *
+
+QUOTA_ERROR_MARKERS = ("429", "quota_exceeded", "resource_exhausted", "resource has been exhausted", "rate limit")
+
+class QuotaExceededError(Exception):
+    """Lỗi vượt quota Gemini sau khi đã thử lại hết số lần cho phép"""
+    pass
+
+def is_quota_error(error):
+    """Kiểm tra lỗi có phải do vượt quota / 429 không"""
+    if getattr(error, 'code', None) == 429:
+        return True
+    error_msg = str(error).lower()
+    return any(marker in error_msg for marker in QUOTA_ERROR_MARKERS)
+
+class TokenBucketRateLimiter:
+    """Token bucket giới hạn request/phút, tự lùi (backoff) khi gặp lỗi quota"""
+
+    def __init__(self, rate_per_minute=GEMINI_RATE_LIMIT, burst=RATE_LIMIT_BURST,
+                 backoff_base=RATE_LIMIT_BACKOFF_BASE, backoff_max=RATE_LIMIT_BACKOFF_MAX):
+        self.rate = max(rate_per_minute, 1e-6) / 60.0  # token mỗi giây
+        self.capacity = max(1, burst)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._consecutive_quota_errors = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()  # thời gian chờ cộng dồn của từng thread
+
+        # Thống kê
+        self.total_acquired = 0
+        self.total_wait_time = 0.0
+        self.quota_errors = 0
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def acquire(self, timeout=None):
+        """
+        Chờ đến khi có token (hoặc hết thời gian backoff)
+
+        Returns:
+            bool: True nếu lấy được token, False nếu quá timeout
+        """
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+
+                if now < self._paused_until:
+                    wait_time = self._paused_until - now
+                elif self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    self.total_acquired += 1
+                    self.total_wait_time += now - start
+                    self._local.waited = getattr(self._local, "waited", 0.0) + (now - start)
+                    return True
+                else:
+                    wait_time = (1.0 - self._tokens) / self.rate
+
+                if deadline is not None:
+                    if now >= deadline:
+                        return False
+                    wait_time = min(wait_time, deadline - now)
+                self._cond.wait(wait_time)
+
+    def take_thread_wait(self):
+        """Thời gian thread hiện tại đã chờ limiter kể từ lần gọi trước (rồi đặt lại về 0)"""
+        waited = getattr(self._local, "waited", 0.0)
+        self._local.waited = 0.0
+        return waited
+
+    def report_success(self):
+        """Ghi nhận request thành công - reset chuỗi lỗi quota"""
+        with self._cond:
+            self._consecutive_quota_errors = 0
+
+    def report_quota_error(self):
+        """
+        Ghi nhận lỗi quota: tạm dừng mọi caller với backoff lũy thừa có jitter
+
+        Returns:
+            float: Số giây tạm dừng
+        """
+        with self._cond:
+            self._consecutive_quota_errors += 1
+            self.quota_errors += 1
+            delay = min(self.backoff_max,
+                        self.backoff_base * (2 ** (self._consecutive_quota_errors - 1)))
+            delay = random.uniform(delay / 2, delay)
+
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + delay)
+            self._tokens = 0.0
+            self._updated = now
+            self._cond.notify_all()
+            return self._paused_until - now
+
+    def call(self, func, *args, max_retries=RATE_LIMIT_MAX_RETRIES, **kwargs):
+        """Gọi func qua limiter, tự thử lại khi gặp lỗi 429/quota"""
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not is_quota_error(e):
+                    raise
+                attempt += 1
+                delay = self.report_quota_error()
+                if attempt > max_retries:
+                    raise QuotaExceededError(f"Vượt quota Gemini sau {attempt} lần thử: {str(e)}") from e
+                print(f"⏳ Gemini báo vượt quota - thử lại sau {delay:.1f}s (lần {attempt}/{max_retries})")
+                continue
+
+            self.report_success()
+            return result
+
+    def stream(self, func, *args, max_retries=RATE_LIMIT_MAX_RETRIES, **kwargs):
+        """
+        Phiên bản stream của call(): func trả về iterator các chunk
+
+        Chỉ thử lại khi lỗi quota xảy ra trước khi nhận được chunk đầu tiên.
+        """
+        attempt = 0
+        while True:
+            self.acquire()
+            emitted = False
+            try:
+                for chunk in func(*args, **kwargs):
+                    emitted = True
+                    yield chunk
+            except Exception as e:
+                if emitted or not is_quota_error(e):
+                    raise
+                attempt += 1
+                delay = self.report_quota_error()
+                if attempt > max_retries:
+                    raise QuotaExceededError(f"Vượt quota Gemini sau {attempt} lần thử: {str(e)}") from e
+                print(f"⏳ Gemini báo vượt quota - thử lại sau {delay:.1f}s (lần {attempt}/{max_retries})")
+                continue
+
+            self.report_success()
+            return
+
+    def get_stats(self):
+        """Thống kê hoạt động của limiter"""
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                "rate_per_minute": self.rate * 60.0,
+                "capacity": self.capacity,
+                "available_tokens": self._tokens,
+                "total_acquired": self.total_acquired,
+                "total_wait_time": self.total_wait_time,
+                "quota_errors": self.quota_errors,
+                "paused_for": max(0.0, self._paused_until - time.monotonic())
+            }
+
+_shared_limiter = None
+_shared_limiter_lock = threading.Lock()
+
+def get_shared_rate_limiter():
+    """Lấy limiter dùng chung cho GUI, batch và CLI trong cùng tiến trình"""
+    global _shared_limiter
+    with _shared_limiter_lock:
+        if _shared_limiter is None:
+            _shared_limiter = TokenBucketRateLimiter()
+        return _shared_limiter
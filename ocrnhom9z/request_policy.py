@@ -0,0 +1,209 @@
+# request_policy.py - Giới hạn thời gian (deadline) và gửi request dự phòng (hedging) cho lời gọi Gemini
+
+import math
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from config import *
+
+class RequestTimeoutError(Exception):
+    """Request vượt quá deadline (lần thử bị bỏ lại, xem RequestPolicy)"""
+
+def is_timeout_error(error):
+    """Lỗi hết thời gian chờ: RequestTimeoutError, TimeoutError hoặc DeadlineExceeded / Timeout của SDK"""
+    name = type(error).__name__
+    return isinstance(error, (RequestTimeoutError, TimeoutError)) or "DeadlineExceeded" in name or "Timeout" in name
+
+def run_async(func, *args, **kwargs):
+    """Chạy func ở thread daemon riêng, trả về Future
+
+    Không dùng pool: request bị treo không chiếm chỗ của các request sau.
+    Python không dừng được thread đang chạy - future.cancel() chỉ có tác dụng trước khi func bắt đầu.
+    """
+    future = Future()
+
+    def runner():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=runner, name="gemini-request", daemon=True).start()
+    return future
+
+def iter_with_deadline(factory, timeout):
+    """
+    Duyệt iterator do factory() tạo ra với deadline cho toàn bộ stream
+
+    Stream được đọc ở thread riêng; quá deadline thì ném RequestTimeoutError
+    thay vì treo worker chờ chunk tiếp theo. Thread đọc stream bị bỏ lại (không dừng được),
+    tự kết thúc khi SDK hết timeout.
+    """
+    chunks = queue.Queue()
+    end = object()
+
+    def pump():
+        try:
+            for chunk in factory():
+                chunks.put((chunk, None))
+            chunks.put((end, None))
+        except BaseException as e:
+            chunks.put((end, e))
+
+    threading.Thread(target=pump, name="gemini-stream", daemon=True).start()
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        try:
+            if remaining <= 0:
+                raise queue.Empty
+            chunk, error = chunks.get(timeout=remaining)
+        except queue.Empty:
+            raise RequestTimeoutError(f"Gemini stream không hoàn thành sau {timeout:g}s - đã bỏ qua request")
+        if chunk is end:
+            if error:
+                raise error
+            return
+        yield chunk
+
+class LatencyTracker:
+    """Lưu độ trễ các request thành công gần nhất để tính percentile"""
+
+    def __init__(self, window=HEDGE_LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p, min_samples=HEDGE_MIN_SAMPLES):
+        """Percentile p (0-100) của độ trễ, None nếu chưa đủ mẫu"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < max(1, min_samples):
+            return None
+        index = min(len(samples) - 1, max(0, math.ceil(p / 100 * len(samples)) - 1))
+        return samples[index]
+
+class RequestPolicy:
+    """
+    Gọi request với deadline và (tùy chọn) hedging
+
+    - Không hedge (mặc định, hoặc chưa đủ mẫu độ trễ): gọi func ngay trên thread hiện tại;
+      deadline do backend truyền cho SDK (request_options={"timeout": ...}) nên request bị hủy thật
+    - Hedging: request chạy lâu hơn percentile p95 của các request gần đây thì gửi thêm một
+      request giống hệt, lấy kết quả nào về trước. Chỉ hedge khi can_hedge() cho phép
+      (VD rate limiter còn token rảnh) để không tiêu quota của worker khác.
+      Mỗi lần thử chạy ở thread riêng; quá timeout giây thì ném RequestTimeoutError.
+      Lần thử thua / quá hạn KHÔNG bị hủy: nó chạy tiếp ở nền (vẫn tính quota) tới khi SDK
+      tự dừng theo request_options timeout, kết quả về muộn bị bỏ qua.
+    """
+
+    def __init__(self, timeout=TIMEOUT, hedge_enabled=HEDGE_ENABLED, hedge_percentile=HEDGE_PERCENTILE,
+                 hedge_min_delay=HEDGE_MIN_DELAY, tracker=None):
+        self.timeout = timeout
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.tracker = tracker or LatencyTracker()
+
+        self._lock = threading.Lock()
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self):
+        """Số giây chờ trước khi gửi request dự phòng (None nếu không hedge)"""
+        if not self.hedge_enabled:
+            return None
+        latency = self.tracker.percentile(self.hedge_percentile)
+        if latency is None:
+            return None
+        return max(latency, self.hedge_min_delay)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def call(self, func, can_hedge=None):
+        """
+        Gọi func() với deadline và hedging
+
+        Args:
+            func: Hàm không tham số thực hiện request
+            can_hedge: Hàm trả về True nếu được phép gửi request dự phòng
+
+        Returns:
+            Kết quả của request hoàn thành thành công đầu tiên
+        """
+        start = time.monotonic()
+        delay = self.hedge_delay()
+        if delay is None:
+            # Không cần thread: deadline do SDK thực thi qua timeout của backend
+            try:
+                result = func()
+            except Exception as e:
+                if is_timeout_error(e):
+                    self._count("timeouts")
+                raise
+            self.tracker.record(time.monotonic() - start)
+            return result
+
+        deadline = start + self.timeout
+        primary = run_async(func)
+        futures = [primary]
+        errors = []
+        hedged = False
+
+        while futures:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            wait_for = deadline - now
+            if delay is not None and not hedged:
+                wait_for = min(wait_for, max(0.0, start + delay - now))
+
+            done, _ = wait(futures, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                futures.remove(future)
+                if future.exception() is None:
+                    for other in futures:
+                        other.cancel()
+                    self.tracker.record(time.monotonic() - start)
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    return future.result()
+                errors.append(future.exception())
+
+            if (futures and not hedged and delay is not None
+                    and time.monotonic() - start >= delay):
+                hedged = True
+                if can_hedge is None or can_hedge():
+                    self._count("hedges")
+                    print(f"🔀 Request chậm hơn p{self.hedge_percentile:g} ({delay:.1f}s) - gửi request dự phòng")
+                    futures.append(run_async(func))
+
+        if not futures and errors:
+            raise errors[0]
+
+        # Các lần thử còn chạy không dừng được - bị bỏ lại, SDK tự hủy khi hết timeout
+        for future in futures:
+            future.cancel()
+        self._count("timeouts")
+        raise RequestTimeoutError(f"Gemini không phản hồi sau {self.timeout:g}s - đã bỏ qua request")
+
+    def get_stats(self):
+        """Thống kê deadline / hedging"""
+        return {
+            "timeout": self.timeout,
+            "timeouts": self.timeouts,
+            "hedge_enabled": self.hedge_enabled,
+            "hedge_delay": self.hedge_delay(),
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins
+        }
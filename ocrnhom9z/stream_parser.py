@@ -0,0 +1,81 @@
+# stream_parser.py - Parse JSON dạng stream, trả từng sinh viên ngay khi object đóng
+
+import json
+import re
+
+class IncrementalStudentParser:
+    """
+    Parser tăng dần cho response dạng {"students": [{...}, {...}]}
+
+    Mỗi lần feed() một đoạn text, trả về các object sinh viên vừa hoàn chỉnh.
+    Chỉ giữ lại phần buffer chưa xử lý xong nên bộ nhớ không tăng theo độ dài response.
+    """
+
+    def __init__(self, array_key="students"):
+        self._array_re = re.compile(r'"' + re.escape(array_key) + r'"\s*:\s*\[')
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._obj_start = None
+        self.done = False
+        self.count = 0
+
+    def feed(self, chunk):
+        """Nạp thêm text, trả về danh sách sinh viên vừa parse xong"""
+        if self.done or not chunk:
+            return []
+
+        self._buffer += chunk
+        if not self._in_array:
+            match = self._array_re.search(self._buffer)
+            if not match:
+                return []
+            self._in_array = True
+            self._pos = match.end()
+
+        students = []
+        buf = self._buffer
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == '{':
+                if self._depth == 0:
+                    self._obj_start = i
+                self._depth += 1
+            elif ch == '}':
+                self._depth -= 1
+                if self._depth == 0 and self._obj_start is not None:
+                    try:
+                        student = json.loads(buf[self._obj_start:i + 1])
+                        if isinstance(student, dict):
+                            students.append(student)
+                    except ValueError:
+                        pass
+                    self._obj_start = None
+            elif ch == ']' and self._depth == 0:
+                self.done = True
+                i += 1
+                break
+            i += 1
+
+        # Bỏ phần buffer đã xử lý xong
+        keep_from = self._obj_start if self._obj_start is not None else i
+        self._buffer = buf[keep_from:]
+        self._pos = i - keep_from
+        if self._obj_start is not None:
+            self._obj_start = 0
+
+        self.count += len(students)
+        return students
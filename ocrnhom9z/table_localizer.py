@@ -0,0 +1,114 @@
+# table_localizer.py - Xác định vùng bảng điểm trong ảnh chụp và cắt bỏ phần thừa (bàn, lề, tay...)
+
+import numpy as np
+from PIL import Image, ImageFilter
+from config import *
+
+class TableLocalizer:
+    """
+    Tìm khung bảng bằng cách phát hiện các đường kẻ ngang/dọc dài trên bản thu nhỏ
+
+    Các bước:
+    1. Thu nhỏ ảnh xám về cạnh dài work_side
+    2. Điểm "mực" = tối hơn nền cục bộ (ảnh làm mờ) một ngưỡng → không nhạy với bóng đổ, nền bàn tối
+    3. Đường kẻ = dãy điểm mực liên tiếp đủ dài theo hàng/cột (tổng trượt bằng cumsum)
+    4. Khung bảng = bounding box của các đường kẻ, nới thêm lề
+    """
+
+    def __init__(self, work_side=AUTO_CROP_WORK_SIDE, min_line_ratio=AUTO_CROP_MIN_LINE_RATIO,
+                 margin=AUTO_CROP_MARGIN, min_area_ratio=AUTO_CROP_MIN_AREA_RATIO):
+        self.work_side = work_side
+        self.min_line_ratio = min_line_ratio
+        self.margin = margin
+        self.min_area_ratio = min_area_ratio
+
+    def describe(self):
+        """Chuỗi mô tả cấu hình (dùng làm một phần khóa cache)"""
+        return f"crop:{self.work_side}:{self.min_line_ratio}:{self.margin}:{self.min_area_ratio}"
+
+    def _ink_mask(self, image):
+        """Mặt nạ điểm mực trên ảnh xám thu nhỏ"""
+        gray = image.convert('L')
+        scale = self.work_side / max(gray.size)
+        if scale < 1:
+            gray = gray.resize((max(1, round(gray.width * scale)), max(1, round(gray.height * scale))),
+                               Image.Resampling.BILINEAR)
+        background = gray.filter(ImageFilter.BoxBlur(max(2, self.work_side // 64)))
+        pixels = np.asarray(gray, dtype=np.int16)
+        diff = np.asarray(background, dtype=np.int16) - pixels
+        return diff > AUTO_CROP_INK_DELTA
+
+    @staticmethod
+    def _line_mask(mask, length, axis):
+        """Điểm thuộc một dãy mực liên tiếp dài >= length theo trục axis"""
+        # Tổng trượt cửa sổ length qua cumsum: cửa sổ đầy mực ⇔ tổng == length
+        counts = np.cumsum(mask, axis=axis, dtype=np.int32)
+        pad = [(0, 0), (0, 0)]
+        pad[axis] = (1, 0)
+        counts = np.pad(counts, pad)
+        if axis == 1:
+            window = counts[:, length:] - counts[:, :-length]
+        else:
+            window = counts[length:, :] - counts[:-length, :]
+        return window >= length
+
+    def find_table_box(self, image):
+        """
+        Tìm khung bảng trong ảnh
+
+        Returns:
+            Tuple[int, int, int, int] | None: (left, top, right, bottom) theo tọa độ ảnh gốc,
+            None nếu không tìm thấy bảng đủ tin cậy
+        """
+        mask = self._ink_mask(image)
+        height, width = mask.shape
+        if height < 16 or width < 16:
+            return None
+
+        # Cho phép đường kẻ đứt quãng 1px (ảnh chụp hơi nghiêng): nối điểm mực theo 2 phía
+        horizontal_src = mask | np.roll(mask, 1, axis=0) | np.roll(mask, -1, axis=0)
+        vertical_src = mask | np.roll(mask, 1, axis=1) | np.roll(mask, -1, axis=1)
+        horizontal = self._line_mask(horizontal_src, max(2, int(width * self.min_line_ratio)), axis=1)
+        vertical = self._line_mask(vertical_src, max(2, int(height * self.min_line_ratio)), axis=0)
+
+        rows = np.flatnonzero(horizontal.any(axis=1))
+        cols = np.flatnonzero(vertical.any(axis=0))
+        if len(rows) < 2 or len(cols) < 2:
+            return None
+
+        # Vị trí bắt đầu cửa sổ → mở rộng theo chiều dài đường kẻ
+        h_cols = np.flatnonzero(horizontal.any(axis=0))
+        v_rows = np.flatnonzero(vertical.any(axis=1))
+        h_length = width - horizontal.shape[1]
+        v_length = height - vertical.shape[0]
+        left = min(cols[0], h_cols[0])
+        right = max(cols[-1] + 1, h_cols[-1] + h_length + 1)
+        top = min(rows[0], v_rows[0])
+        bottom = max(rows[-1] + 1, v_rows[-1] + v_length + 1)
+
+        if (right - left) * (bottom - top) < self.min_area_ratio * width * height:
+            return None
+
+        scale_x = image.width / width
+        scale_y = image.height / height
+        pad_x = self.margin * image.width
+        pad_y = self.margin * image.height
+        box = (
+            max(0, int(left * scale_x - pad_x)),
+            max(0, int(top * scale_y - pad_y)),
+            min(image.width, int(right * scale_x + pad_x + 0.5)),
+            min(image.height, int(bottom * scale_y + pad_y + 0.5))
+        )
+        return box
+
+    def crop(self, image):
+        """
+        Cắt ảnh theo khung bảng
+
+        Returns:
+            Tuple[PIL.Image, tuple | None]: (ảnh đã cắt hoặc ảnh gốc, khung đã dùng)
+        """
+        box = self.find_table_box(image)
+        if box is None or box == (0, 0, image.width, image.height):
+            return image, None
+        return image.crop(box), box
@@ -0,0 +1,34 @@
+# test_data_validator.py - Bản vectorized của DataValidator phải cho kết quả giống bản từng dòng
+
+import contextlib
+import io
+
+import pandas as pd
+import pytest
+
+from benchmark import make_noisy_dataframe
+from data_validator import DataValidator
+
+def clean_both(df):
+    """(kết quả từng dòng, kết quả vectorized) kèm danh sách sửa đổi"""
+    results = []
+    for method in ("validate_and_clean_dataframe_rows", "validate_and_clean_dataframe"):
+        validator = DataValidator()
+        with contextlib.redirect_stdout(io.StringIO()):
+            cleaned = getattr(validator, method)(df.copy())
+        results.append((cleaned, validator.get_corrections_summary()))
+    return results
+
+@pytest.mark.parametrize("with_class", [True, False])
+def test_vectorized_matches_rows(with_class):
+    (row_df, row_fixes), (vec_df, vec_fixes) = clean_both(make_noisy_dataframe(500, with_class))
+    assert row_df.equals(vec_df)
+    assert row_fixes == vec_fixes
+
+@pytest.mark.parametrize("classes", [["", "", ""], ["CNTT 17", "abc", ""]])
+def test_class_without_second_number(classes):
+    # Không dòng nào có đủ hai nhóm số → trước đây .str trên cột NaN kiểu float bị lỗi
+    df = pd.DataFrame({"STT": ["1", "2", "3"], "Lớp": classes, "MSV": ["1771020001"] * 3,
+                       "Họ và đệm": ["Nguyễn Văn"] * 3, "Tên": ["An"] * 3})
+    (row_df, _), (vec_df, _) = clean_both(df)
+    assert list(vec_df["Lớp"]) == list(row_df["Lớp"]) == ["CNTT 17-02"] * 3
@@ -0,0 +1,56 @@
+# test_name_corrector.py - Sửa tên gần đúng không được làm hỏng tên thật có dấu
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from data_validator import DataValidator
+from name_corrector import correct_name_word
+
+@pytest.mark.parametrize("name", ["Thìn", "Trâm", "Thắm", "Nhàn"])
+def test_accented_real_names_are_kept(name):
+    # Tên có dấu hợp lệ chưa có trong database - trước đây bị đổi thành Thịnh / Tâm / Nhân
+    validator = DataValidator()
+    assert validator._validate_vietnamese_name(name, role="ten") == name
+    assert validator._validate_vietnamese_name(f"Trần {name}", role="ho") == f"Trần {name}"
+    assert correct_name_word(name) == name
+
+@pytest.mark.parametrize("word, kind, expected", [
+    ("Nguycn", "surname", "Nguyễn"),
+    ("Ngyuen", "surname", "Nguyễn"),
+    ("Nguyen", "surname", "Nguyễn"),
+    ("Hoàag", None, "Hoàng"),
+    ("Bìnk", "first_name", "Bình"),
+    ("Phuong", "first_name", "Phương"),
+    ("Dat", "first_name", "Đạt"),
+])
+def test_unaccented_or_malformed_words_are_corrected(word, kind, expected):
+    assert correct_name_word(word, kind) == expected
+
+@pytest.mark.parametrize("word, kind", [
+    ("Quyen", None),  # Quyên / Quyền: không có ứng viên tốt nhất duy nhất
+    ("Zzz", None),
+    ("Johnson", None),
+])
+def test_ambiguous_or_unknown_words_are_kept(word, kind):
+    assert correct_name_word(word, kind) == word
+
+def test_full_name_uses_role():
+    validator = DataValidator()
+    assert validator._validate_vietnamese_name("Nguycn Thi Huong", role="ho") == "Nguyễn Thị Hương"
+
+def test_name_corrections_have_no_conflicting_keys():
+    # Dict literal cũ ghi đè khóa trùng mà không báo (VD 'Van': 'Văn' bị thay bằng 'Vân')
+    result = subprocess.run([sys.executable, "-c", "import config"], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.returncode == 0
+    assert "có hai giá trị" not in result.stdout
+
+@pytest.mark.parametrize("word, expected", [
+    ("Van", "Văn"), ("VAN", "Văn"), ("Thanh", "Thanh"), ("Uyen", "Uyên"), ("Truong", "Trương"),
+])
+def test_name_corrections_resolve_ambiguous_words(word, expected):
+    from config import suggest_name_correction
+    assert suggest_name_correction(word) == expected